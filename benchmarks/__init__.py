@@ -0,0 +1 @@
+"""Benchmarks for snaphelpers, runnable offline."""
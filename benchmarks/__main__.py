@@ -0,0 +1,21 @@
+from importlib import import_module
+import sys
+
+BENCHMARKS = [
+    "config_lookup",
+    "config_view",
+    "services_parse",
+    "shared_config",
+    "single_flight",
+    "transport",
+]
+
+
+def main() -> None:
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"== {name}")
+        import_module(f"benchmarks.{name}").main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+)
+
+from snaphelpers import SnapCtl
+
+SNAP_ENV = {
+    "SNAP": "/snap/mysnap/123",
+    "SNAP_COMMON": "/var/snap/mysnap/common",
+    "SNAP_DATA": "/var/snap/mysnap/123",
+    "SNAP_INSTANCE_NAME": "mysnap",
+    "SNAP_NAME": "mysnap",
+    "SNAP_REAL_HOME": "/home/user",
+    "SNAP_REVISION": "123",
+    "SNAP_USER_COMMON": "/home/user/snap/mysnap/common",
+    "SNAP_USER_DATA": "/home/user/snap/mysnap/123",
+    "SNAP_VERSION": "0.1.2",
+}
+
+
+class FixedSnapCtl(SnapCtl):
+    """A SnapCtl returning a fixed configuration."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self._config = config
+
+    def config_get(self, *keys: str) -> Dict[str, Any]:
+        return self._config
+
+
+@contextmanager
+def temp_dir() -> Iterator[Path]:
+    """Return a short temporary directory path."""
+    with TemporaryDirectory() as tempdir:
+        yield Path(tempdir)
+
+
+def make_executable(path: Path, output: str) -> Path:
+    """Create a stand-in snapctl executable printing the specified output."""
+    path.write_text(
+        dedent(
+            f"""\
+            #!/bin/sh
+            cat <<'EOF'
+            {output}
+            EOF
+            """
+        )
+    )
+    path.chmod(0o755)
+    return path
+
+
+def make_counting_executable(
+    path: Path, output: str, log: Path, delay: float = 0.0
+) -> Path:
+    """Create a stand-in snapctl executable printing the specified output,
+    and logging each call to a file.
+
+    If ``delay`` is set, it takes that many seconds to reply, like snapd does.
+
+    """
+    lines = ["#!/bin/sh", f'echo "$@" >> {log}']
+    if delay:
+        lines.append(f"sleep {delay}")
+    lines.extend(["cat <<'EOF'", output, "EOF"])
+    path.write_text("\n".join(lines) + "\n")
+    path.chmod(0o755)
+    return path
+
+
+def timeit(func: Callable[[], object], count: int) -> float:
+    """Return the average time in microseconds for calling a function."""
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def report(results: Dict[str, float]) -> None:
+    """Print timing results."""
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        print(f"  {name:<{width}}  {value:12.1f} us")
@@ -0,0 +1,78 @@
+"""Compare config key lookups via the flat index and by walking nested dicts."""
+
+import time
+from typing import (
+    Any,
+    Dict,
+)
+
+from snaphelpers import (
+    SnapConfigOptions,
+    UnknownConfigKey,
+)
+
+from ._util import (
+    FixedSnapCtl,
+    report,
+    timeit,
+)
+
+COUNT = 100000
+
+
+def walk(config: Any, item: str) -> Any:
+    """Look up a key by walking nested dicts."""
+    for key in item.split("."):
+        if not isinstance(config, dict):
+            raise UnknownConfigKey(item)
+        try:
+            config = config[key]
+        except KeyError:
+            raise UnknownConfigKey(item)
+    return config
+
+
+def deep_config(depth: int) -> Dict[str, Any]:
+    config: Dict[str, Any] = {"value": "leaf"}
+    for level in reversed(range(depth)):
+        config = {f"level{level}": config}
+    return config
+
+
+def wide_config(width: int) -> Dict[str, Any]:
+    return {
+        "top": {
+            f"key{index}": {"host": f"host{index}", "port": index}
+            for index in range(width)
+        }
+    }
+
+
+def run(name: str, config: Dict[str, Any], key: str) -> None:
+    options = SnapConfigOptions(list(config), snapctl=FixedSnapCtl(config))
+    start = time.perf_counter()
+    options.fetch()
+    fetch_time = (time.perf_counter() - start) * 1e6
+    accessor = options.accessor(key)
+    print(f" {name} (fetch and index: {fetch_time:.1f} us)")
+    report(
+        {
+            "walk": timeit(lambda: walk(config, key), COUNT),
+            "index": timeit(lambda: options[key], COUNT),
+            "accessor": timeit(accessor, COUNT),
+            "contains (missing key)": timeit(
+                lambda: key + ".missing" in options, COUNT
+            ),
+        }
+    )
+
+
+def main() -> None:
+    depth = 10
+    run(
+        f"deep ({depth} levels)",
+        deep_config(depth),
+        ".".join(f"level{level}" for level in range(depth)) + ".value",
+    )
+    width = 1000
+    run(f"wide ({width} keys)", wide_config(width), "top.key500.host")
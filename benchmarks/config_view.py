@@ -0,0 +1,55 @@
+"""Compare copying the config with as_dict and viewing it with as_mapping."""
+
+import json
+from typing import (
+    Any,
+    Dict,
+)
+
+from snaphelpers import SnapConfigOptions
+
+from ._util import (
+    FixedSnapCtl,
+    report,
+    timeit,
+)
+
+COUNT = 20
+
+
+def large_config(routes: int) -> Dict[str, Any]:
+    certificate = "-----BEGIN CERTIFICATE-----\n" + "A" * 2000 + "\n"
+    return {
+        "tls": {"bundle": [certificate] * 200},
+        "routing": {
+            "table": [
+                {
+                    "prefix": f"10.{index // 256 % 256}.{index % 256}.0/24",
+                    "gateway": f"192.168.0.{index % 256}",
+                    "metrics": {"weight": index, "tags": ["a", "b"]},
+                }
+                for index in range(routes)
+            ]
+        },
+    }
+
+
+def main() -> None:
+    for routes in (10000, 50000):
+        config = large_config(routes)
+        size = len(json.dumps(config)) / 2**20
+        options = SnapConfigOptions(list(config), snapctl=FixedSnapCtl(config))
+        options.fetch()
+        print(f" {size:.1f} MiB config")
+        report(
+            {
+                "as_dict": timeit(options.as_dict, COUNT),
+                "as_mapping": timeit(options.as_mapping, COUNT),
+                "as_mapping + nested read": timeit(
+                    lambda: options.as_mapping()["routing"]["table"][-1][
+                        "gateway"
+                    ],
+                    COUNT,
+                ),
+            }
+        )
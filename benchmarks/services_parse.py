@@ -0,0 +1,101 @@
+"""Compare time and allocations for parsing "snapctl services" output with a
+per-line regex and by splitting lines, reusing info for unchanged lines."""
+
+import re
+import tracemalloc
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+
+from snaphelpers import (
+    SnapCtl,
+    SnapEnviron,
+)
+from snaphelpers._ctl import ServiceInfo
+
+from ._util import (
+    report,
+    SNAP_ENV,
+    timeit,
+)
+
+SERVICES = [1, 50, 500]
+COUNT = 200
+
+SERVICE_RE = re.compile(
+    r"[^.]+\.(?P<name>\S+)\s+"
+    r"(?P<startup>\S+)\s+"
+    r"(?P<current>\S+)\s+"
+    r"(?P<notes>\S+)"
+)
+
+
+def services_output(services: int) -> str:
+    width = len(f"mysnap.service{services}") + 2
+    lines = [f"{'Service':<{width}}Startup   Current   Notes"]
+    for index in range(services):
+        name = f"mysnap.service{index}"
+        notes = "timer-activated" if index % 3 else "-"
+        lines.append(f"{name:<{width}}enabled   active    {notes}")
+    return "\n".join(lines) + "\n"
+
+
+def regex_parse(output: str) -> List[ServiceInfo]:
+    """The previous parser, matching a regex on each line."""
+    service_infos = []
+    for line in output.splitlines()[1:]:
+        match = SERVICE_RE.match(line)
+        if match:
+            info = match.groupdict()
+            notes: List[str] = []
+            if info["notes"] != "-":
+                notes = info["notes"].split(",")
+            service_infos.append(
+                ServiceInfo(
+                    name=info["name"],
+                    enabled=info["startup"] == "enabled",
+                    active=info["current"] == "active",
+                    notes=notes,  # type: ignore
+                )
+            )
+    return service_infos
+
+
+def allocated(func: Callable[[], object]) -> float:
+    """Return peak KiB allocated while calling a function."""
+    tracemalloc.start()
+    func()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size / 1024
+
+
+def main() -> None:
+    for services in SERVICES:
+        output = services_output(services)
+        snapctl = SnapCtl(env=SnapEnviron(environ=SNAP_ENV))
+
+        def parse() -> List[ServiceInfo]:
+            # drop reused info to parse all lines
+            snapctl._service_lines = {}
+            return snapctl._parse_services(output)
+
+        def parse_unchanged() -> List[ServiceInfo]:
+            return snapctl._parse_services(output)
+
+        print(f" {services} services")
+        timings: Dict[str, float] = {
+            "regex": timeit(lambda: regex_parse(output), COUNT),
+            "split": timeit(parse, COUNT),
+            "split, unchanged": timeit(parse_unchanged, COUNT),
+        }
+        report(timings)
+        parse_unchanged()
+        for name, func in (
+            ("regex", lambda: regex_parse(output)),
+            ("split", parse),
+            ("split, unchanged", parse_unchanged),
+        ):
+            print(f"  {name:<16}  {allocated(func):12.1f} KiB allocated")
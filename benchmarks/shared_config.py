@@ -0,0 +1,86 @@
+"""Compare snapctl spawns and read latency of multiple worker processes, with
+per-process config snapshots and with a shared config cache."""
+
+import multiprocessing
+from pathlib import Path
+import time
+from typing import Optional
+
+from snaphelpers import (
+    ExecTransport,
+    SharedConfigCache,
+    SnapConfig,
+    SnapCtl,
+    SnapEnviron,
+)
+
+from ._util import (
+    make_counting_executable,
+    SNAP_ENV,
+    temp_dir,
+    timeit,
+)
+
+WORKERS = [1, 4, 16]
+COUNT = 1000
+OUTPUT = '{"foo": {"bar": "baz"}}'
+
+
+def worker(
+    executable: Path,
+    cache_path: Optional[Path],
+    results: "multiprocessing.Queue[float]",
+) -> None:
+    snapctl = SnapCtl(
+        env=SnapEnviron(environ=SNAP_ENV),
+        transport=ExecTransport(str(executable)),
+    )
+    if cache_path is None:
+        config = SnapConfig(snapctl=snapctl, prefetch=True)
+    else:
+        config = SnapConfig(
+            snapctl=snapctl, shared_cache=SharedConfigCache(cache_path)
+        )
+    # the first read includes fetching the configuration
+    first = timeit(lambda: config.get("foo.bar"), 1)
+    results.put(first)
+    # use CPU time, as workers might share CPUs
+    start = time.process_time()
+    for _ in range(COUNT):
+        config.get("foo.bar")
+    results.put((time.process_time() - start) / COUNT * 1e6)
+
+
+def run(tempdir: Path, workers: int, shared: bool) -> None:
+    log = tempdir / "calls.log"
+    log.write_text("")
+    executable = make_counting_executable(tempdir / "snapctl", OUTPUT, log)
+    cache_path = tempdir / "config.cache" if shared else None
+    if cache_path is not None and cache_path.exists():
+        cache_path.unlink()
+    context = multiprocessing.get_context("fork")
+    results: "multiprocessing.Queue[float]" = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(executable, cache_path, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    timings = [results.get(timeout=60) for _ in range(workers * 2)]
+    for process in processes:
+        process.join()
+    spawns = len(log.read_text().splitlines())
+    first = max(timings[0::2])
+    reads = sum(timings[1::2]) / workers
+    mode = "shared" if shared else "per-process"
+    print(
+        f"  {mode:<11}  {workers:>2} workers  {spawns:>3} spawns  "
+        f"first read {first:10.1f} us  read {reads:6.1f} us"
+    )
+
+
+def main() -> None:
+    with temp_dir() as tempdir:
+        for workers in WORKERS:
+            for shared in (False, True):
+                run(tempdir, workers, shared)
@@ -0,0 +1,70 @@
+"""Compare snapctl spawns per second for concurrent identical reads from
+multiple threads, with and without single-flight sharing of calls."""
+
+from pathlib import Path
+from threading import Thread
+import time
+from typing import Optional
+
+from snaphelpers import (
+    ExecTransport,
+    SingleFlight,
+    SnapCtl,
+    SnapEnviron,
+)
+
+from ._util import (
+    make_counting_executable,
+    SNAP_ENV,
+    temp_dir,
+)
+
+THREADS = [1, 4, 16, 64]
+DURATION = 1.0
+OUTPUT = '{"foo": {"bar": "baz"}}'
+
+
+def run(tempdir: Path, threads: int, shared: bool) -> None:
+    log = tempdir / "calls.log"
+    log.write_text("")
+    executable = make_counting_executable(
+        tempdir / "snapctl", OUTPUT, log, delay=0.01
+    )
+    single_flight: Optional[SingleFlight] = None
+    if shared:
+        single_flight = SingleFlight()
+    snapctl = SnapCtl(
+        env=SnapEnviron(environ=SNAP_ENV),
+        transport=ExecTransport(str(executable)),
+        single_flight=single_flight,
+    )
+    reads = [0] * threads
+    end = time.monotonic() + DURATION
+
+    def worker(index: int) -> None:
+        while time.monotonic() < end:
+            snapctl.config_get("foo")
+            reads[index] += 1
+
+    workers = [
+        Thread(target=worker, args=(index,)) for index in range(threads)
+    ]
+    start = time.monotonic()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - start
+    spawns = len(log.read_text().splitlines())
+    mode = "single-flight" if shared else "per-call"
+    print(
+        f"  {mode:<13}  {threads:>2} threads  "
+        f"{spawns / elapsed:7.1f} spawns/s  {sum(reads) / elapsed:8.1f} reads/s"
+    )
+
+
+def main() -> None:
+    with temp_dir() as tempdir:
+        for threads in THREADS:
+            for shared in (False, True):
+                run(tempdir, threads, shared)
@@ -0,0 +1,52 @@
+"""Compare latency of the exec and socket transports for SnapCtl."""
+
+from snaphelpers import (
+    ExecTransport,
+    SnapCtl,
+    SnapEnviron,
+    SocketTransport,
+)
+from tests.snapd import FakeSnapd
+
+from ._util import (
+    make_executable,
+    report,
+    SNAP_ENV,
+    temp_dir,
+    timeit,
+)
+
+COUNT = 200
+OUTPUT = '{"foo": {"bar": "baz"}}'
+
+
+def main() -> None:
+    env = SnapEnviron(environ=SNAP_ENV)
+    with temp_dir() as tempdir:
+        executable = make_executable(tempdir / "snapctl", OUTPUT)
+        snapd = FakeSnapd(tempdir / "snapd-snap.socket")
+        snapd.handler = lambda args: (OUTPUT, "", 0)
+        snapd.start()
+        try:
+            exec_snapctl = SnapCtl(
+                env=env, transport=ExecTransport(str(executable))
+            )
+            socket_snapctl = SnapCtl(
+                env=env,
+                transport=SocketTransport(
+                    socket_path=str(snapd.socket_path), env=env
+                ),
+            )
+            report(
+                {
+                    "exec": timeit(
+                        lambda: exec_snapctl.config_get("foo"), COUNT
+                    ),
+                    "socket": timeit(
+                        lambda: socket_snapctl.config_get("foo"), COUNT
+                    ),
+                }
+            )
+            socket_snapctl.close()
+        finally:
+            snapd.stop()
@@ -1,39 +1,129 @@
 """Helpers for interacting with the Snap system within a Snap."""
 
+from ._breaker import (
+    CircuitBreaker,
+    CircuitState,
+    SnapCtlCircuitOpen,
+)
+from ._cache import SnapCtlCache
 from ._conf import (
+    AsyncSnapConfig,
+    AsyncSnapConfigOptions,
+    ConfigSnapshotFile,
+    ConfigSnapshotListener,
     InvalidKey,
     SnapConfig,
+    SnapConfigAccessor,
     SnapConfigOptions,
+    SnapConfigTransaction,
     UnknownConfigKey,
 )
 from ._ctl import (
+    AsyncSnapCtl,
     SnapCtl,
-    SnapCtlError,
 )
 from ._env import (
     is_snap,
     NotASnapError,
     SnapEnviron,
 )
-from ._health import SnapHealth
+from ._flight import (
+    AsyncSingleFlight,
+    SingleFlight,
+)
+from ._health import (
+    AsyncSnapHealth,
+    SnapHealth,
+)
+from ._instrument import (
+    CommandMetrics,
+    SnapCtlCall,
+    SnapCtlInstrument,
+    SnapCtlMetrics,
+)
+from ._limit import (
+    AsyncConcurrencyLimit,
+    ConcurrencyLimit,
+)
 from ._path import SnapPaths
-from ._service import SnapServices
-from ._snap import Snap
+from ._service import (
+    AsyncSnapServices,
+    ServiceCall,
+    ServiceChange,
+    SnapServices,
+)
+from ._shared import SharedConfigCache
+from ._snap import (
+    AsyncSnap,
+    Snap,
+)
+from ._transport import (
+    ExecTransport,
+    SnapCtlError,
+    SnapCtlTimeout,
+    SnapCtlTransport,
+    SocketTransport,
+)
+from ._view import (
+    FrozenMapping,
+    FrozenSequence,
+)
+from ._watch import (
+    AsyncSnapConfigWatcher,
+    ConfigDiff,
+    diff_config,
+    SnapConfigWatcher,
+)
 
 __all__ = [
+    "AsyncConcurrencyLimit",
+    "AsyncSingleFlight",
+    "AsyncSnap",
+    "AsyncSnapConfig",
+    "AsyncSnapConfigOptions",
+    "AsyncSnapConfigWatcher",
+    "AsyncSnapCtl",
+    "AsyncSnapHealth",
+    "AsyncSnapServices",
+    "CircuitBreaker",
+    "CircuitState",
+    "CommandMetrics",
+    "ConcurrencyLimit",
+    "ConfigDiff",
+    "ConfigSnapshotFile",
+    "ConfigSnapshotListener",
+    "ExecTransport",
+    "FrozenMapping",
+    "FrozenSequence",
     "InvalidKey",
     "NotASnapError",
+    "ServiceCall",
+    "ServiceChange",
+    "SharedConfigCache",
+    "SingleFlight",
     "Snap",
     "SnapConfig",
+    "SnapConfigAccessor",
     "SnapConfigOptions",
+    "SnapConfigTransaction",
+    "SnapConfigWatcher",
     "SnapCtl",
+    "SnapCtlCache",
+    "SnapCtlCall",
+    "SnapCtlCircuitOpen",
     "SnapCtlError",
+    "SnapCtlInstrument",
+    "SnapCtlMetrics",
+    "SnapCtlTimeout",
+    "SnapCtlTransport",
     "SnapEnviron",
     "SnapHealth",
     "SnapPaths",
     "SnapServices",
+    "SocketTransport",
     "UnknownConfigKey",
     "__version__",
+    "diff_config",
     "is_snap",
 ]
 
@@ -0,0 +1,180 @@
+from enum import Enum
+from threading import Lock
+from time import monotonic
+from typing import (
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ._transport import (
+    SnapCtlError,
+    SnapCtlTimeout,
+)
+
+
+class CircuitState(Enum):
+    """Possible states of a :class:`CircuitBreaker`."""
+
+    #: Calls go through
+    CLOSED = "closed"
+    #: Calls fail fast
+    OPEN = "open"
+    #: A single probe call goes through, to check whether snapd is back
+    HALF_OPEN = "half-open"
+
+
+class SnapCtlCircuitOpen(SnapCtlError):
+    """A snapctl call was not made since snapd is unavailable.
+
+    :param retry_after: seconds until a call is attempted again.
+
+    """
+
+    #: Seconds until a call is attempted again
+    retry_after: float
+
+    def __init__(self, retry_after: float):
+        super().__init__(1)
+        self.retry_after = retry_after
+        self.args = (
+            "Calls to snapctl suspended after repeated failures, retrying "
+            f"in {retry_after:g} seconds",
+        )
+
+
+# error reported by the snapctl executable when snapd is not reachable
+_UNREACHABLE_ERROR = "cannot communicate with server"
+
+
+def is_transport_failure(error: BaseException) -> bool:
+    """Return whether an error means snapd couldn't be reached.
+
+    This is the case for connection errors, timeouts, calls suspended by a
+    :class:`CircuitBreaker`, and errors from the :data:`snapctl` executable
+    about not reaching snapd. Other errors, like failing commands, mean that
+    snapd is responding.
+
+    """
+    if isinstance(error, (OSError, SnapCtlTimeout, SnapCtlCircuitOpen)):
+        return True
+    return (
+        isinstance(error, SnapCtlError) and _UNREACHABLE_ERROR in error.error
+    )
+
+
+class CircuitBreaker:
+    """Fail fast when snapd is unavailable.
+
+    After ``failure_threshold`` consecutive calls fail because snapd can't be
+    reached, the circuit opens, and calls fail immediately with
+    :class:`SnapCtlCircuitOpen` for ``cooldown`` seconds. After that, a
+    single probe call is let through: if it succeeds, the circuit closes
+    again, otherwise it stays open for another cooldown period.
+
+    :param failure_threshold: number of consecutive failures opening the
+      circuit.
+    :param cooldown: seconds to wait before probing whether snapd is back.
+    :param on_state_change: an optional function called with the old and new
+      state when the state changes.
+
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown: float = 10.0,
+        on_state_change: Optional[
+            Callable[[CircuitState, CircuitState], None]
+        ] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.on_state_change = on_state_change
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        """The current state of the circuit."""
+        return self._state
+
+    def call(
+        self, args: Sequence[str], run: Callable[[Sequence[str]], str]
+    ) -> str:
+        """Run a command through the circuit breaker.
+
+        :param args: command args.
+        :param run: the function to run the command.
+        :raises SnapCtlCircuitOpen: if the circuit is open.
+
+        """
+        self.acquire()
+        try:
+            output = run(args)
+        except BaseException as error:
+            self.release(error)
+            raise
+        self.release()
+        return output
+
+    def acquire(self) -> None:
+        """Check whether a call can be made.
+
+        :raises SnapCtlCircuitOpen: if the circuit is open.
+
+        """
+        changes: List[Tuple[CircuitState, CircuitState]] = []
+        with self._lock:
+            if self._state == CircuitState.OPEN:
+                retry_after = self._opened_at + self.cooldown - monotonic()
+                if retry_after > 0:
+                    raise SnapCtlCircuitOpen(retry_after)
+                self._set_state(CircuitState.HALF_OPEN, changes)
+            elif self._state == CircuitState.HALF_OPEN and self._probing:
+                # another call is already probing
+                raise SnapCtlCircuitOpen(0)
+            self._probing = self._state == CircuitState.HALF_OPEN
+        self._notify(changes)
+
+    def release(self, error: Optional[BaseException] = None) -> None:
+        """Record the result of a call.
+
+        :param error: the error raised by the call, if any.
+
+        """
+        changes: List[Tuple[CircuitState, CircuitState]] = []
+        with self._lock:
+            probing, self._probing = self._probing, False
+            if error is not None and is_transport_failure(error):
+                self._failures += 1
+                if probing or self._failures >= self.failure_threshold:
+                    self._opened_at = monotonic()
+                    self._set_state(CircuitState.OPEN, changes)
+            elif error is None or isinstance(error, SnapCtlError):
+                # snapd responded
+                self._failures = 0
+                self._set_state(CircuitState.CLOSED, changes)
+        self._notify(changes)
+
+    def _set_state(
+        self,
+        state: CircuitState,
+        changes: List[Tuple[CircuitState, CircuitState]],
+    ) -> None:
+        if state != self._state:
+            changes.append((self._state, state))
+            self._state = state
+
+    def _notify(
+        self, changes: List[Tuple[CircuitState, CircuitState]]
+    ) -> None:
+        if self.on_state_change is None:
+            return
+        for old, new in changes:
+            self.on_state_change(old, new)
@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import (
+    Callable,
+    Dict,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ._breaker import is_transport_failure
+from ._transport import (
+    is_read_only,
+    SnapCtlError,
+)
+
+
+class _CacheEntry(NamedTuple):
+    """A cached outcome of a command."""
+
+    expiry: float
+    output: str
+    error: Optional[SnapCtlError]
+
+
+class SnapCtlCache:
+    """A read-through cache for output of read-only :data:`snapctl` commands.
+
+    Output (or failure) of read-only commands is cached for a per-command
+    time-to-live, and least recently used entries are evicted when the cache
+    is full.
+
+    Commands that change state invalidate cached results for the commands they
+    affect.
+
+    :param ttls: a dict with time-to-live in seconds, by command name.
+      Commands not listed (or with a TTL of 0) are not cached.
+    :param max_size: the maximum number of entries in the cache.
+
+    """
+
+    #: Default time-to-live for cached commands
+    DEFAULT_TTLS: Dict[str, float] = {
+        "get": 5.0,
+        "is-connected": 5.0,
+        "refresh": 1.0,
+        "services": 1.0,
+        "system-mode": 60.0,
+    }
+
+    # Cached commands invalidated by each mutating command
+    _INVALIDATES: Dict[str, Tuple[str, ...]] = {
+        "refresh": ("refresh",),
+        "restart": ("services",),
+        "set": ("get",),
+        "start": ("services",),
+        "stop": ("services",),
+        "unset": ("get",),
+    }
+
+    #: Number of lookups served from the cache
+    hits: int = 0
+    #: Number of lookups not found in the cache
+    misses: int = 0
+    #: Number of entries evicted because the cache was full
+    evictions: int = 0
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        max_size: int = 128,
+    ):
+        self.ttls = self.DEFAULT_TTLS.copy()
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_size = max_size
+        self._entries: OrderedDict[
+            Tuple[str, ...], _CacheEntry
+        ] = OrderedDict()
+        # bumped on invalidation, to avoid storing results of commands that
+        # were running while a change was made
+        self._generations: Dict[str, int] = {}
+        self._clear_generation = 0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def call(
+        self, args: Sequence[str], run: Callable[[Sequence[str]], str]
+    ) -> str:
+        """Return output for a command, calling ``run`` if not cached.
+
+        :param args: command args.
+        :param run: the function to run the command.
+
+        """
+        key = tuple(args)
+        ttl = self._ttl(key)
+        if not ttl:
+            try:
+                return run(args)
+            finally:
+                # a failed or timed out change might still have been applied
+                self._invalidate_for(key)
+
+        entry = self._lookup(key)
+        if entry is None:
+            generation = self._generation(key[0])
+            try:
+                output = run(args)
+            except SnapCtlError as error:
+                if is_transport_failure(error):
+                    # don't cache transient failures
+                    raise
+                entry = _CacheEntry(monotonic() + ttl, "", error)
+            else:
+                entry = _CacheEntry(monotonic() + ttl, output, None)
+            self._store(key, entry, generation)
+        if entry.error:
+            raise entry.error
+        return entry.output
+
+    def last_known(self, args: Sequence[str]) -> Optional[str]:
+        """Return the last successful output for a command, even if expired.
+
+        :param args: command args.
+        :return: the output, or None if not in the cache.
+
+        """
+        with self._lock:
+            entry = self._entries.get(tuple(args))
+        if entry is None or entry.error:
+            return None
+        return entry.output
+
+    def invalidate(self, *commands: str) -> None:
+        """Drop cached entries for the specified commands.
+
+        :param commands: command names to invalidate. If not specified, the
+          whole cache is cleared.
+
+        """
+        with self._lock:
+            if not commands:
+                self._entries.clear()
+                self._clear_generation += 1
+                return
+            for command in commands:
+                self._generations[command] = (
+                    self._generations.get(command, 0) + 1
+                )
+            for key in list(self._entries):
+                if key[0] in commands:
+                    del self._entries[key]
+
+    def _ttl(self, key: Tuple[str, ...]) -> float:
+        if not is_read_only(key):
+            return 0
+        return self.ttls.get(key[0], 0)
+
+    def _lookup(self, key: Tuple[str, ...]) -> Optional[_CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expiry <= monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _generation(self, command: str) -> Tuple[int, int]:
+        with self._lock:
+            return self._clear_generation, self._generations.get(command, 0)
+
+    def _store(
+        self,
+        key: Tuple[str, ...],
+        entry: _CacheEntry,
+        generation: Tuple[int, int],
+    ) -> None:
+        with self._lock:
+            current = self._clear_generation, self._generations.get(key[0], 0)
+            if current != generation:
+                # invalidated while the command was running, the result might
+                # be stale
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _invalidate_for(self, key: Tuple[str, ...]) -> None:
+        if not key:
+            return
+        commands = self._INVALIDATES.get(key[0])
+        if commands:
+            self.invalidate(*commands)
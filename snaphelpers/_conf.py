@@ -1,13 +1,43 @@
 from copy import deepcopy
+from hashlib import sha256
+import json
+import mmap
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import (
+    monotonic,
+    sleep,
+)
+from types import TracebackType
 from typing import (
     Any,
+    Awaitable,
+    Callable,
+    cast,
     Dict,
+    Iterator,
     List,
     Optional,
     Sequence,
+    Tuple,
+    Type,
+    Union,
 )
 
-from ._ctl import SnapCtl
+from ._ctl import (
+    AsyncSnapCtl,
+    SnapCtl,
+)
+from ._inotify import Inotify
+from ._shared import SharedConfigCache
+from ._view import FrozenMapping
+from ._watch import (
+    AsyncSnapConfigWatcher,
+    ConfigDiff,
+    diff_config,
+    SnapConfigWatcher,
+)
 
 
 class UnknownConfigKey(Exception):
@@ -32,42 +62,63 @@ class InvalidKey(Exception):
         super().__init__(f"Invalid top-level key: {key}")
 
 
-class SnapConfigOptions:
-    """Allow accessing a set of Snap config options with a dict-like interface.
+class SnapConfigAccessor:
+    """Access the value of a key in a :class:`SnapConfigOptions`.
 
-    Nested keys can be accessed using dotted notation::
+    The accessor follows updates of the options, so it can be created once and
+    called repeatedly.
 
-        config['foo.bar.baz']
+    """
 
-    :param keys: the top-level configuration keys.
+    __slots__ = ("key", "_options")
 
-    """
+    #: The accessed key
+    key: str
+
+    def __init__(self, options: "_SnapConfigOptionsBase", key: str):
+        self.key = key
+        self._options = options
+
+    def __call__(self) -> Any:
+        """Return the value for the key.
+
+        :raises UnknownConfigKey: if the key is not found.
+
+        """
+        try:
+            return self._options._index[self.key]
+        except KeyError:
+            raise UnknownConfigKey(self.key)
+
+    def get(self, default: Any = None) -> Any:
+        """Return the value for the key, with a default.
+
+        :param default: value to return if the key is not found.
+
+        """
+        return self._options._index.get(self.key, default)
+
+
+class _SnapConfigOptionsBase:
+    """Dict-like access to a set of fetched config options."""
 
     _config: Optional[Dict[str, Any]] = None
 
-    def __init__(self, keys: Sequence[str], snapctl: Optional[SnapCtl] = None):
+    def __init__(self, keys: Sequence[str]):
         self._keys = list(keys)
-        self._snapctl = snapctl or SnapCtl()
+        # values for all keys by their full dotted name
+        self._index: Dict[str, Any] = {}
 
     def __getitem__(self, item: str) -> Any:
         """Return value for a configuration key."""
-        config = self._config
-        for key in item.split("."):
-            if not isinstance(config, dict):
-                raise UnknownConfigKey(item)
-            try:
-                config = config[key]
-            except KeyError:
-                raise UnknownConfigKey(item)
-        return config
+        try:
+            return self._index[item]
+        except KeyError:
+            raise UnknownConfigKey(item)
 
     def __contains__(self, item: str) -> bool:
         """Whether the configuration conains a key."""
-        try:
-            self[item]
-        except UnknownConfigKey:
-            return False
-        return True
+        return item in self._index
 
     def get(self, key: str, default: Any = None) -> Any:
         """Return value for a key, with a default.
@@ -76,42 +127,526 @@ class SnapConfigOptions:
         :param default: value to return if the key is not found.
 
         """
-        try:
-            return self[key]
-        except UnknownConfigKey:
-            return default
+        return self._index.get(key, default)
 
-    def fetch(self) -> None:
-        """Fetch (or refresh) configuration for the set of keys."""
-        self._config = self._snapctl.config_get(*self._keys)
+    def accessor(self, key: str) -> SnapConfigAccessor:
+        """Return a :class:`SnapConfigAccessor` for a key.
+
+        :param key: name of the key, possibly with dotted notation.
+
+        """
+        return SnapConfigAccessor(self, key)
 
     def as_dict(self) -> Dict[str, Any]:
-        """Return the configuration as a :class:`dict`."""
+        """Return a copy of the configuration as a :class:`dict`."""
         if self._config is None:
             return {}
         return deepcopy(self._config)
 
+    def as_mapping(self) -> FrozenMapping:
+        """Return a read-only view of the configuration, without copying it.
+
+        Nested dicts and lists are returned as read-only views too. A mutable
+        copy can be obtained via :meth:`FrozenMapping.copy`.
+
+        """
+        if self._config is None:
+            return FrozenMapping({})
+        return FrozenMapping(self._config)
+
+    def _set_config(self, config: Dict[str, Any]) -> None:
+        self._config = config
+        self._index = _flatten(config)
+
+
+def _flatten(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a flat dict with values for all keys in dotted notation."""
+    index: Dict[str, Any] = {}
+    stack: List[Tuple[str, Dict[str, Any]]] = [("", config)]
+    while stack:
+        prefix, entries = stack.pop()
+        for key, value in entries.items():
+            full_key = prefix + key
+            index[full_key] = value
+            if isinstance(value, dict):
+                stack.append((full_key + ".", value))
+    return index
+
+
+class SnapConfigOptions(_SnapConfigOptionsBase):
+    """Allow accessing a set of Snap config options with a dict-like interface.
+
+    Nested keys can be accessed using dotted notation::
+
+        config['foo.bar.baz']
+
+    :param keys: the top-level configuration keys.
+
+    """
+
+    def __init__(self, keys: Sequence[str], snapctl: Optional[SnapCtl] = None):
+        super().__init__(keys)
+        self._snapctl = snapctl or SnapCtl()
+
+    def fetch(self) -> None:
+        """Fetch (or refresh) configuration for the set of keys."""
+        self._set_config(self._snapctl.config_get(*self._keys))
+
+
+class AsyncSnapConfigOptions(_SnapConfigOptionsBase):
+    """Asynchronous version of :class:`SnapConfigOptions`.
+
+    :param keys: the top-level configuration keys.
+
+    """
+
+    def __init__(
+        self, keys: Sequence[str], snapctl: Optional[AsyncSnapCtl] = None
+    ):
+        super().__init__(keys)
+        self._snapctl = snapctl or AsyncSnapCtl()
+
+    async def fetch(self) -> None:
+        """Fetch (or refresh) configuration for the set of keys."""
+        self._set_config(await self._snapctl.config_get(*self._keys))
+
+
+def _check_top_level_keys(keys: Sequence[str]) -> None:
+    for key in keys:
+        if "." in key:
+            raise InvalidKey(key)
+
+
+def _top_level_key(key: str) -> str:
+    return key.split(".", maxsplit=1)[0]
+
+
+def _changed_options(
+    options: Dict[str, Any], snapshot: _SnapConfigOptionsBase
+) -> Dict[str, Any]:
+    """Return options whose value differs from the one in the snapshot."""
+    changed = {}
+    for key, value in options.items():
+        try:
+            current = snapshot[key]
+        except UnknownConfigKey:
+            changed[key] = value
+            continue
+        # compare JSON serializations, since this is what's stored, and e.g.
+        # `1 == True` in Python
+        if json.dumps(current, sort_keys=True) != json.dumps(
+            value, sort_keys=True
+        ):
+            changed[key] = value
+    return changed
+
+
+# Marker for unset keys in transactions
+_UNSET = object()
+
+
+class SnapConfigTransaction:
+    """Buffer configuration changes, and apply them with a single call.
+
+    This is used as a context manager, and changes are applied when exiting the
+    context, unless an exception is raised::
+
+        with config.transaction() as tx:
+            tx.set({'foo.bar': 'baz'})
+            tx.unset(['asdf'])
+
+    Multiple changes to the same keys are folded together, so that each key is
+    written only once.
+
+    """
+
+    #: Number of keys written by the transaction
+    written: int = 0
+
+    def __init__(
+        self,
+        snapctl: Optional[SnapCtl] = None,
+        on_commit: Optional[Callable[[], None]] = None,
+    ):
+        self._snapctl = snapctl or SnapCtl()
+        self._on_commit = on_commit
+        self._changes: Dict[str, Any] = {}
+
+    def __enter__(self) -> "SnapConfigTransaction":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.commit()
+
+    def set(self, options: Dict[str, Any]) -> None:
+        """Set config options.
+
+        :param options: a dict with configs. Keys can use dotted notation.
+
+        """
+        for key, value in options.items():
+            self._change(key, deepcopy(value))
+
+    def unset(self, options: List[str]) -> None:
+        """Unset snap configuration keys.
+
+        :param options: A list of keys to unset. Keys can use dotted notation.
+
+        """
+        for key in options:
+            self._change(key, _UNSET)
+
+    def commit(self) -> int:
+        """Apply pending changes, returning the number of keys written."""
+        changes, self._changes = self._changes, {}
+        configs = {
+            key: value for key, value in changes.items() if value is not _UNSET
+        }
+        unset = [key for key, value in changes.items() if value is _UNSET]
+        if changes:
+            self._snapctl.config_update(configs, unset=unset)
+            if self._on_commit:
+                self._on_commit()
+        self.written += len(changes)
+        return len(changes)
+
+    def _change(self, key: str, value: Any) -> None:
+        # pending changes for subkeys are overridden
+        prefix = key + "."
+        for pending in [
+            pending for pending in self._changes if pending.startswith(prefix)
+        ]:
+            del self._changes[pending]
+        # if there's a pending change for a parent key, merge this one in it,
+        # so that pending keys never overlap and can be written in any order
+        tokens = key.split(".")
+        for index in range(1, len(tokens)):
+            parent = ".".join(tokens[:index])
+            if parent in self._changes:
+                self._changes[parent] = _merge_change(
+                    self._changes[parent], tokens[index:], value
+                )
+                return
+        self._changes[key] = value
+
+
+def _merge_change(current: Any, path: List[str], value: Any) -> Any:
+    """Merge a change for a subkey into the value of a parent key."""
+    if not isinstance(current, dict):
+        if value is _UNSET:
+            # nothing to unset
+            return current
+        current = {}
+    config = current
+    for token in path[:-1]:
+        entry = config.get(token)
+        if not isinstance(entry, dict):
+            if value is _UNSET:
+                return current
+            entry = config[token] = {}
+        config = entry
+    if value is _UNSET:
+        config.pop(path[-1], None)
+    else:
+        config[path[-1]] = value
+    return current
+
+
+class ConfigSnapshotFile:
+    """A file storing a snapshot of the whole snap configuration.
+
+    The snapshot is tied to the snap revision, and includes a hash of the
+    content, so that snapshots from other revisions or corrupted ones are
+    ignored. The snapshot is only updated by :meth:`write`, so it must be
+    written again (or marked stale) when configuration changes.
+
+    :param path: the path of the file.
+    :param revision: the current snap revision.
+
+    """
+
+    #: Version of the file format
+    VERSION = 1
+
+    def __init__(self, path: Path, revision: str):
+        self.path = path
+        self.revision = revision
+
+    def write(self, config: Dict[str, Any]) -> None:
+        """Atomically write the snapshot file.
+
+        :param config: the whole snap configuration.
+
+        """
+        self._write_content(
+            {
+                "version": self.VERSION,
+                "revision": self.revision,
+                "hash": _config_hash(config),
+                "config": config,
+            }
+        )
+
+    def mark_stale(self) -> None:
+        """Mark the snapshot as no longer current.
+
+        A stale snapshot is not returned by :meth:`read`, but its content is
+        kept, so that changes can still be computed against it.
+
+        """
+        content = self._read_content()
+        if content is not None and not content.get("stale"):
+            content["stale"] = True
+            self._write_content(content)
+
+    def remove(self) -> None:
+        """Remove the snapshot file, if it exists."""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def read(
+        self, use_mmap: bool = False, include_stale: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """Return the configuration from the snapshot.
+
+        :param use_mmap: whether to memory-map the file for reading.
+        :param include_stale: whether to return the configuration even if the
+          snapshot is marked stale.
+        :return: the configuration, or None if the file is missing, invalid,
+          for a different revision, or stale.
+
+        """
+        content = self._read_content(use_mmap=use_mmap)
+        if content is None or (content.get("stale") and not include_stale):
+            return None
+        return cast(Dict[str, Any], content["config"])
+
+    def _read_content(
+        self, use_mmap: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            with self.path.open("rb") as fd:
+                if use_mmap:
+                    with mmap.mmap(
+                        fd.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as mapped:
+                        data = mapped.read()
+                else:
+                    data = fd.read()
+            content = json.loads(data)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(content, dict):
+            return None
+        config = content.get("config")
+        if (
+            content.get("version") != self.VERSION
+            or content.get("revision") != self.revision
+            or not isinstance(config, dict)
+            or content.get("hash") != _config_hash(config)
+        ):
+            return None
+        return content
+
+    def _write_content(self, content: Dict[str, Any]) -> None:
+        with NamedTemporaryFile(
+            "w",
+            dir=self.path.parent,
+            prefix=f".{self.path.name}.",
+            delete=False,
+        ) as fd:
+            try:
+                json.dump(content, fd)
+                fd.flush()
+                os.fsync(fd.fileno())
+            except BaseException:
+                os.unlink(fd.name)
+                raise
+        os.replace(fd.name, self.path)
+
+
+class ConfigSnapshotListener:
+    """Wait for configuration snapshots published by the ``configure`` hook.
+
+    The hook publishes configuration with :meth:`SnapConfig.save_snapshot`.
+    The listener is woken up via inotify when the snapshot file is replaced,
+    and returns the new configuration. Where inotify is not available, the
+    file is polled for changes instead.
+
+    Only snapshots with content different from the one at the time the
+    listener is created (or from the last returned one) are returned.
+
+    :param snapshot_file: the :class:`ConfigSnapshotFile` to watch.
+    :param snapctl: the :class:`SnapCtl` for returned options.
+    :param poll_interval: the interval for polling the file, in seconds, if
+      inotify is not available.
+
+    """
+
+    def __init__(
+        self,
+        snapshot_file: ConfigSnapshotFile,
+        snapctl: Optional[SnapCtl] = None,
+        poll_interval: float = 1.0,
+    ):
+        self.snapshot_file = snapshot_file
+        self.poll_interval = poll_interval
+        self._snapctl = snapctl
+        self._inotify: Optional[Inotify] = None
+        try:
+            self._inotify = Inotify(str(snapshot_file.path.parent))
+        except OSError:
+            pass
+        self._stat = self._file_stat()
+        config = snapshot_file.read()
+        self._hash = _config_hash(config) if config is not None else ""
+
+    def __enter__(self) -> "ConfigSnapshotListener":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[SnapConfigOptions]:
+        """Return new configuration options, as they're published."""
+        while True:
+            yield cast(SnapConfigOptions, self.wait())
+
+    def close(self) -> None:
+        """Stop listening for changes."""
+        if self._inotify is not None:
+            self._inotify.close()
+
+    def wait(
+        self, timeout: Optional[float] = None
+    ) -> Optional[SnapConfigOptions]:
+        """Wait for a new configuration snapshot to be published.
+
+        :param timeout: how long to wait, in seconds. If None, wait
+          indefinitely.
+        :return: a :class:`SnapConfigOptions` with the whole configuration,
+          or None if no snapshot was published before the timeout.
+
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - monotonic(), 0.0)
+            if self._changed(remaining):
+                options = self._load()
+                if options is not None:
+                    return options
+            if remaining == 0.0:
+                return None
+
+    def _changed(self, timeout: Optional[float]) -> bool:
+        if self._inotify is not None:
+            return self.snapshot_file.path.name in self._inotify.read(timeout)
+        interval = self.poll_interval
+        if timeout is not None:
+            interval = min(interval, timeout)
+        sleep(interval)
+        stat = self._file_stat()
+        changed = stat != self._stat
+        self._stat = stat
+        return changed
+
+    def _file_stat(self) -> Tuple[int, int, int]:
+        try:
+            stat = self.snapshot_file.path.stat()
+        except OSError:
+            return 0, 0, 0
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> Optional[SnapConfigOptions]:
+        config = self.snapshot_file.read()
+        if config is None:
+            return None
+        config_hash = _config_hash(config)
+        if config_hash == self._hash:
+            return None
+        self._hash = config_hash
+        options = SnapConfigOptions([], snapctl=self._snapctl)
+        options._set_config(config)
+        return options
+
+
+def _config_hash(config: Dict[str, Any]) -> str:
+    data = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return sha256(data.encode("utf-8")).hexdigest()
+
 
 class SnapConfig:
     """Interact with the snap configuration.
 
     It allows getting and setting configuration options.
 
+    :param snapctl: the :class:`SnapCtl` to use.
+    :param prefetch: whether to fetch the whole configuration at the first
+      read, and serve following reads from it. See :meth:`snapshot`.
+    :param snapshot_file: an optional :class:`ConfigSnapshotFile` to save and
+      load configuration snapshots.
+    :param shared_cache: an optional :class:`SharedConfigCache` to share the
+      configuration with other processes. If set, reads are always served
+      from the shared cache, which is populated at the first read by any
+      process.
+
     """
 
-    def __init__(self, snapctl: Optional[SnapCtl] = None):
+    def __init__(
+        self,
+        snapctl: Optional[SnapCtl] = None,
+        prefetch: bool = False,
+        snapshot_file: Optional[ConfigSnapshotFile] = None,
+        shared_cache: Optional[SharedConfigCache] = None,
+    ):
         self._snapctl = snapctl or SnapCtl()
+        self._prefetch = prefetch
+        self._snapshot: Optional[SnapConfigOptions] = None
+        self._snapshot_file = snapshot_file
+        self._shared_cache = shared_cache
+        self._shared_generation = 0
+
+    def __contains__(self, key: str) -> bool:
+        """Whether the configuration contains a key."""
+        options = self._current_snapshot()
+        if options is None:
+            options = self.get_options(_top_level_key(key))
+        return key in options
 
     def get_options(self, *keys: str) -> SnapConfigOptions:
         """Return a :data:`SnapConfigOptions` for the specified keys.
 
         :param keys: keys to read configuration for.
         """
-        for key in keys:
-            if "." in key:
-                raise InvalidKey(key)
+        _check_top_level_keys(keys)
         options = SnapConfigOptions(keys=keys, snapctl=self._snapctl)
-        options.fetch()
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            options.fetch()
+        else:
+            # copy values, so that changes don't affect the snapshot
+            options._set_config(
+                {
+                    key: deepcopy(snapshot._index[key])
+                    for key in keys
+                    if key in snapshot._index
+                }
+            )
         return options
 
     def get(self, key: str) -> Any:
@@ -121,9 +656,138 @@ class SnapConfig:
         :raises UnknownConfigKey: if the option doesn't exist.
 
         """
-        top_key = key.split(".", maxsplit=1)[0]
-        options = self.get_options(top_key)
-        return options[key]
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return self.get_options(_top_level_key(key))[key]
+        # copy the value, so that changes don't affect the snapshot
+        return deepcopy(snapshot[key])
+
+    def snapshot(self) -> SnapConfigOptions:
+        """Fetch the whole configuration, and serve following reads from it.
+
+        After this is called, :meth:`get`, :meth:`get_options` and ``in``
+        checks don't call :data:`snapctl`, until :meth:`refresh` is called.
+
+        Changing the configuration through this object discards the snapshot,
+        and the whole configuration is fetched again at the next read.
+
+        """
+        self._prefetch = True
+        self.refresh()
+        return cast(SnapConfigOptions, self._current_snapshot())
+
+    def refresh(self) -> None:
+        """Fetch the whole configuration again, if a snapshot is used.
+
+        If a shared cache is used, the configuration is published to it, so
+        that all processes see the change. In this case, this should be called
+        from the ``configure`` hook.
+
+        """
+        if self._shared_cache is not None:
+            self._shared_cache.publish(self._fetch_all())
+        elif self._prefetch:
+            self._snapshot = self._snapshot_options(self._fetch_all())
+
+    def watch(
+        self,
+        keys: Sequence[str],
+        callback: Callable[[ConfigDiff, SnapConfigOptions], None],
+        interval: float = 1.0,
+        max_interval: float = 30.0,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> SnapConfigWatcher[SnapConfigOptions]:
+        """Watch configuration for changes in a thread.
+
+        Configuration for the specified keys is fetched periodically via
+        :data:`snapctl`, and ``callback`` is called with a :class:`ConfigDiff`
+        and the new :class:`SnapConfigOptions` when it changes.
+
+        :param keys: top-level keys to watch. If empty, the whole
+          configuration is watched.
+        :param callback: the function to call with changes.
+        :param interval: the initial polling interval, in seconds.
+        :param max_interval: the maximum polling interval, in seconds, used
+          when configuration doesn't change.
+        :param on_error: an optional function called with errors raised while
+          watching. See :class:`SnapConfigWatcher`.
+        :return: the started :class:`SnapConfigWatcher`.
+
+        """
+        _check_top_level_keys(keys)
+
+        def fetch() -> SnapConfigOptions:
+            options = SnapConfigOptions(keys, snapctl=self._snapctl)
+            options.fetch()
+            return options
+
+        watcher = SnapConfigWatcher(
+            fetch,
+            callback,
+            interval=interval,
+            max_interval=max_interval,
+            on_error=on_error,
+        )
+        watcher.start()
+        return watcher
+
+    def save_snapshot(self) -> ConfigDiff:
+        """Save the whole configuration to the snapshot file.
+
+        This is meant to be called from the ``configure`` hook, so that
+        services can load configuration with :meth:`load_snapshot`. The file
+        is only kept current by calling this method: changing configuration
+        through this object marks it stale.
+
+        If a shared cache is used, the configuration is also published to it.
+
+        :return: a :class:`ConfigDiff` with changes from the previous snapshot,
+          which can be passed to :meth:`SnapServices.restart_affected`. A
+          stale previous snapshot is still used for the comparison. If there
+          is no valid previous snapshot, all keys are reported as added.
+
+        """
+        snapshot_file = self._get_snapshot_file()
+        previous = snapshot_file.read(include_stale=True) or {}
+        config = self._fetch_all()
+        snapshot_file.write(config)
+        if self._shared_cache is not None:
+            self._shared_cache.publish(config)
+        return diff_config(previous, config)
+
+    def listen(self, poll_interval: float = 1.0) -> ConfigSnapshotListener:
+        """Return a listener for snapshots saved by the ``configure`` hook.
+
+        This allows services to be notified of configuration changes, without
+        polling :data:`snapctl`. See :class:`ConfigSnapshotListener`.
+
+        :param poll_interval: the interval for polling the snapshot file, in
+          seconds, if inotify is not available.
+
+        """
+        return ConfigSnapshotListener(
+            self._get_snapshot_file(),
+            snapctl=self._snapctl,
+            poll_interval=poll_interval,
+        )
+
+    def load_snapshot(self, use_mmap: bool = False) -> bool:
+        """Load configuration from the snapshot file, and serve reads from it.
+
+        If the file is missing or stale, the whole configuration is fetched
+        via :data:`snapctl` instead, as in :meth:`snapshot`.
+
+        :param use_mmap: whether to memory-map the file for reading.
+        :return: whether configuration was loaded from the file.
+
+        """
+        config = self._get_snapshot_file().read(use_mmap=use_mmap)
+        if config is None:
+            self.snapshot()
+            return False
+        self._prefetch = True
+        self._snapshot = self._snapshot_options(config)
+        return True
 
     def set(self, options: Dict[str, Any]) -> None:
         """Set config options.
@@ -132,6 +796,34 @@ class SnapConfig:
 
         """
         self._snapctl.config_set(options)
+        self._discard_snapshot()
+
+    def apply(
+        self,
+        options: Dict[str, Any],
+        snapshot: Optional[SnapConfigOptions] = None,
+    ) -> Dict[str, Any]:
+        """Set config options, only writing those whose value changed.
+
+        Current values are compared with the ones in ``snapshot``. If it's not
+        passed, current configuration for the affected top-level keys is
+        fetched with a single call.
+
+        :param options: a dict with configs. Keys can use dotted notation.
+        :param snapshot: optional :class:`SnapConfigOptions` with current
+          configuration.
+        :return: a dict with the options that were actually written.
+
+        """
+        if not options:
+            return {}
+        if snapshot is None:
+            top_keys = dict.fromkeys(_top_level_key(key) for key in options)
+            snapshot = self.get_options(*top_keys)
+        changed = _changed_options(options, snapshot)
+        if changed:
+            self.set(changed)
+        return changed
 
     def unset(self, options: List[str]) -> None:
         """Unset snap configuration keys.
@@ -140,3 +832,147 @@ class SnapConfig:
 
         """
         self._snapctl.config_unset(*options)
+        self._discard_snapshot()
+
+    def transaction(self) -> SnapConfigTransaction:
+        """Return a :class:`SnapConfigTransaction` to batch config changes."""
+        return SnapConfigTransaction(
+            snapctl=self._snapctl, on_commit=self._discard_snapshot
+        )
+
+    def _get_snapshot_file(self) -> ConfigSnapshotFile:
+        if self._snapshot_file is None:
+            raise ValueError("No configuration snapshot file set")
+        return self._snapshot_file
+
+    def _fetch_all(self) -> Dict[str, Any]:
+        return self._snapctl.config_get()
+
+    def _snapshot_options(self, config: Dict[str, Any]) -> SnapConfigOptions:
+        options = SnapConfigOptions([], snapctl=self._snapctl)
+        options._set_config(config)
+        return options
+
+    def _current_snapshot(self) -> Optional[SnapConfigOptions]:
+        if self._shared_cache is not None:
+            generation, config = self._shared_cache.get_or_publish(
+                self._fetch_all
+            )
+            # only rebuild options when the shared content changes
+            if self._snapshot is None or generation != self._shared_generation:
+                self._snapshot = self._snapshot_options(config)
+                self._shared_generation = generation
+        elif self._prefetch and self._snapshot is None:
+            self.refresh()
+        return self._snapshot
+
+    def _discard_snapshot(self) -> None:
+        self._snapshot = None
+        if self._snapshot_file is not None:
+            # keep the content, as the base for the next saved diff
+            self._snapshot_file.mark_stale()
+        if self._shared_cache is not None:
+            self._shared_cache.invalidate()
+
+
+class AsyncSnapConfig:
+    """Asynchronous version of :class:`SnapConfig`."""
+
+    def __init__(self, snapctl: Optional[AsyncSnapCtl] = None):
+        self._snapctl = snapctl or AsyncSnapCtl()
+
+    async def get_options(self, *keys: str) -> AsyncSnapConfigOptions:
+        """Return a :data:`AsyncSnapConfigOptions` for the specified keys.
+
+        :param keys: keys to read configuration for.
+        """
+        _check_top_level_keys(keys)
+        options = AsyncSnapConfigOptions(keys=keys, snapctl=self._snapctl)
+        await options.fetch()
+        return options
+
+    async def get(self, key: str) -> Any:
+        """Return value for a single key.
+
+        :param key: key to get config for, possibly with dotted notation.
+        :raises UnknownConfigKey: if the option doesn't exist.
+
+        """
+        options = await self.get_options(_top_level_key(key))
+        return options[key]
+
+    async def set(self, options: Dict[str, Any]) -> None:
+        """Set config options.
+
+        :param options: a dict with configs. Keys can use dotted notation.
+
+        """
+        await self._snapctl.config_set(options)
+
+    async def apply(
+        self,
+        options: Dict[str, Any],
+        snapshot: Optional[AsyncSnapConfigOptions] = None,
+    ) -> Dict[str, Any]:
+        """Set config options, only writing those whose value changed.
+
+        See :meth:`SnapConfig.apply`.
+
+        :param options: a dict with configs. Keys can use dotted notation.
+        :param snapshot: optional :class:`AsyncSnapConfigOptions` with current
+          configuration.
+        :return: a dict with the options that were actually written.
+
+        """
+        if not options:
+            return {}
+        if snapshot is None:
+            top_keys = dict.fromkeys(_top_level_key(key) for key in options)
+            snapshot = await self.get_options(*top_keys)
+        changed = _changed_options(options, snapshot)
+        if changed:
+            await self.set(changed)
+        return changed
+
+    async def watch(
+        self,
+        keys: Sequence[str],
+        callback: Callable[
+            [ConfigDiff, AsyncSnapConfigOptions], Union[None, Awaitable[None]]
+        ],
+        interval: float = 1.0,
+        max_interval: float = 30.0,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> AsyncSnapConfigWatcher[AsyncSnapConfigOptions]:
+        """Watch configuration for changes in a task.
+
+        See :meth:`SnapConfig.watch`. The callback can also be a coroutine
+        function.
+
+        :return: the started :class:`AsyncSnapConfigWatcher`.
+
+        """
+        _check_top_level_keys(keys)
+
+        async def fetch() -> AsyncSnapConfigOptions:
+            options = AsyncSnapConfigOptions(keys, snapctl=self._snapctl)
+            await options.fetch()
+            return options
+
+        watcher = AsyncSnapConfigWatcher(
+            fetch,
+            callback,
+            interval=interval,
+            max_interval=max_interval,
+            on_error=on_error,
+        )
+        await watcher.start()
+        return watcher
+
+    async def unset(self, options: List[str]) -> None:
+        """Unset snap configuration keys.
+
+        :param options: A list of keys to unset. Keys can use dotted notation.
+
+        """
+        await self._snapctl.config_unset(*options)
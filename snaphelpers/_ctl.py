@@ -1,17 +1,34 @@
-from __future__ import annotations  # for subscritable Popen type
+from __future__ import annotations  # for subscritable builtin types
 
+import asyncio
+from contextlib import (
+    contextmanager,
+    nullcontext,
+    suppress,
+)
+from contextvars import ContextVar
 from enum import Enum
+from functools import (
+    lru_cache,
+    partial,
+)
 import json
-import re
-from subprocess import (
-    PIPE,
-    Popen,
+from operator import itemgetter
+import os
+import signal
+from subprocess import PIPE
+import sys
+from time import (
+    monotonic,
+    perf_counter,
 )
 from typing import (
     Any,
+    Callable,
     cast,
+    ContextManager,
     Dict,
-    IO,
+    Iterator,
     NamedTuple,
     Optional,
     Sequence,
@@ -19,7 +36,32 @@ from typing import (
 
 import yaml
 
+from ._breaker import (
+    CircuitBreaker,
+    is_transport_failure,
+    SnapCtlCircuitOpen,
+)
+from ._cache import SnapCtlCache
 from ._env import SnapEnviron
+from ._flight import (
+    AsyncSingleFlight,
+    SingleFlight,
+)
+from ._instrument import (
+    SnapCtlCall,
+    SnapCtlInstrument,
+)
+from ._limit import (
+    AsyncConcurrencyLimit,
+    ConcurrencyLimit,
+)
+from ._transport import (
+    check_args_size,
+    ExecTransport,
+    SnapCtlError,
+    SnapCtlTimeout,
+    SnapCtlTransport,
+)
 
 
 class ServiceInfo(NamedTuple):
@@ -32,7 +74,7 @@ class ServiceInfo(NamedTuple):
     #: Whether the service is active
     active: bool
     #: Additional metadata about the service
-    notes: list[str]
+    notes: tuple[str, ...]
 
 
 class SnapHealthStatus(Enum):
@@ -44,42 +86,337 @@ class SnapHealthStatus(Enum):
     ERROR = "error"
 
 
-class SnapCtlError(Exception):
-    """A snapctl command failed."""
+@lru_cache(maxsize=256)
+def _parse_notes(notes: str) -> tuple[str, ...]:
+    if notes == "-":
+        return ()
+    return tuple(sys.intern(note) for note in notes.split(","))
 
-    #: The process return code
-    returncode: int
-    #: The error message
-    error: str
 
-    def __init__(self, process: Popen[bytes]):
-        self.returncode = process.returncode
-        self.error = cast(IO[bytes], process.stderr).read().decode("utf-8")
-        super().__init__(
-            f"Call to snapctl failed with error {self.returncode}: "
-            + self.error
-        )
+# Deadline for snapctl calls in the current context, as a monotonic time
+_DEADLINE: ContextVar[Optional[float]] = ContextVar(
+    "snapctl_deadline", default=None
+)
+# Logs capturing snapctl calls in the current context
+_CALL_LOGS: ContextVar[tuple[list[SnapCtlCall], ...]] = ContextVar(
+    "snapctl_call_logs", default=()
+)
 
 
-class SnapCtl:
-    """Run the :data:`snapctl` command."""
+class _SnapCtlBase:
+    """Common logic for building :data:`snapctl` calls and parsing output."""
 
-    _SERVICE_RE = re.compile(
-        r"[^.]+\.(?P<name>\S+)\s+"
-        r"(?P<startup>\S+)\s+"
-        r"(?P<current>\S+)\s+"
-        r"(?P<notes>\S+)"
-    )
+    #: Default timeout for commands, in seconds
+    timeout: Optional[float]
+    #: The circuit breaker for calls, if enabled
+    breaker: Optional[CircuitBreaker]
+    #: Instruments called for each call
+    instruments: list[SnapCtlInstrument]
+
+    # Maximum total size of arguments for a single command. This is kept well
+    # below the system limit since the environment also counts towards it.
+    _MAX_ARGS_SIZE = os.sysconf("SC_ARG_MAX") // 2
+
+    # columns in "snapctl services" output
+    _SERVICE_COLUMNS = ("Service", "Startup", "Current", "Notes")
 
     def __init__(
         self,
         executable: str = "/usr/bin/snapctl",
         env: Optional[SnapEnviron] = None,
+        timeout: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        instruments: Sequence[SnapCtlInstrument] = (),
     ):
         if env is None:
             env = SnapEnviron()
         self._executable = executable
         self._instance_name = env.INSTANCE_NAME
+        self.timeout = timeout
+        self.breaker = breaker
+        self.instruments = list(instruments)
+        # parsed services info by output line, from the last call
+        self._service_lines: dict[str, ServiceInfo] = {}
+
+    @contextmanager
+    def deadline(self, timeout: float) -> Iterator[None]:
+        """Context manager setting a deadline for calls made in the context.
+
+        Each call made before the deadline gets the remaining time as
+        timeout, and calls made after it fail with :class:`SnapCtlTimeout`.
+        Nested deadlines can only shorten the outer ones.
+
+        The deadline applies to all calls in the current thread or
+        :mod:`asyncio` task.
+
+        :param timeout: time until the deadline, in seconds.
+
+        """
+        deadline = monotonic() + timeout
+        current = _DEADLINE.get()
+        if current is not None:
+            deadline = min(deadline, current)
+        token = _DEADLINE.set(deadline)
+        try:
+            yield
+        finally:
+            _DEADLINE.reset(token)
+
+    @contextmanager
+    def capture_calls(self) -> Iterator[list[SnapCtlCall]]:
+        """Context manager capturing calls made in the context.
+
+        It returns a list, which gets a :class:`SnapCtlCall` for each call
+        running :data:`snapctl` (calls served from a cache or shared with
+        other in-flight ones are not included).
+
+        As for :meth:`deadline`, this captures all calls in the current
+        thread or :mod:`asyncio` task.
+
+        """
+        log: list[SnapCtlCall] = []
+        token = _CALL_LOGS.set(_CALL_LOGS.get() + (log,))
+        try:
+            yield log
+        finally:
+            _CALL_LOGS.reset(token)
+
+    def _call_started(self, args: Sequence[str]) -> Optional[float]:
+        """Notify instruments of a call, returning its start time.
+
+        If the call is not instrumented, None is returned.
+
+        """
+        if not self.instruments and not _CALL_LOGS.get():
+            return None
+        for instrument in self.instruments:
+            instrument.before(args)
+        return perf_counter()
+
+    def _call_finished(
+        self,
+        args: Sequence[str],
+        start: float,
+        output_size: int = 0,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        returncode: Optional[int] = 0
+        if isinstance(error, SnapCtlError):
+            returncode = error.returncode
+        elif error is not None:
+            returncode = None
+        call = SnapCtlCall(
+            tuple(args), perf_counter() - start, returncode, output_size
+        )
+        for instrument in self.instruments:
+            instrument.after(call)
+        for log in _CALL_LOGS.get():
+            log.append(call)
+
+    def _call_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        if timeout is None:
+            timeout = self.timeout
+        deadline = _DEADLINE.get()
+        if deadline is None:
+            return timeout
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise SnapCtlTimeout(0)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def _services_args(
+        self,
+        cmd: str,
+        services: Sequence[str],
+        options: Optional[dict[str, bool]] = None,
+    ) -> list[str]:
+        opts: list[str] = []
+        if options:
+            opts = [
+                f"--{option}" for option, value in options.items() if value
+            ]
+        if services:
+            service_names = [
+                f"{self._instance_name}.{service}" for service in services
+            ]
+        else:
+            service_names = [self._instance_name]
+        return [cmd, *opts, *service_names]
+
+    def _parse_services(self, output: str) -> list[ServiceInfo]:
+        lines = output.splitlines()
+        if not lines:
+            return []
+        columns = self._service_columns(lines[0])
+        # info for unchanged lines is reused from the previous call
+        previous = self._service_lines
+        service_lines = {}
+        service_infos = []
+        for line in lines[1:]:
+            info = previous.get(line)
+            if info is None:
+                info = self._parse_service_line(line, columns)
+                if info is None:
+                    continue
+            service_lines[line] = info
+            service_infos.append(info)
+        self._service_lines = service_lines
+        return service_infos
+
+    def _service_columns(
+        self, header: str
+    ) -> Callable[[list[str]], tuple[str, ...]]:
+        columns = header.split()
+        try:
+            indexes = [
+                columns.index(column) for column in self._SERVICE_COLUMNS
+            ]
+        except ValueError:
+            # unexpected header, assume default columns
+            indexes = list(range(len(self._SERVICE_COLUMNS)))
+        getter: Callable[[list[str]], tuple[str, ...]] = itemgetter(*indexes)
+        return getter
+
+    def _parse_service_line(
+        self, line: str, columns: Callable[[list[str]], tuple[str, ...]]
+    ) -> Optional[ServiceInfo]:
+        try:
+            service, startup, current, notes = columns(line.split())
+        except IndexError:
+            return None
+        name = service.partition(".")[2]
+        if not name:
+            return None
+        return ServiceInfo(
+            name=sys.intern(name),
+            enabled=startup == "enabled",
+            active=current == "active",
+            notes=_parse_notes(notes),
+        )
+
+    def _set_args(self, configs: dict[str, Any]) -> list[str]:
+        return [f"{key}={json.dumps(value)}" for key, value in configs.items()]
+
+    def _unset_args(self, configs: tuple[str, ...]) -> list[str]:
+        return [f"{key}!" for key in configs]
+
+    def _split_args(self, args: list[str]) -> list[list[str]]:
+        """Split arguments in batches that fit in a single command."""
+        batches: list[list[str]] = []
+        batch: list[str] = []
+        size = 0
+        for arg in args:
+            arg_size = len(arg.encode("utf-8")) + 1
+            if batch and size + arg_size > self._MAX_ARGS_SIZE:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(arg)
+            size += arg_size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _connection_get_args(
+        self,
+        name: str,
+        keys: tuple[str, ...],
+        remote_type: Optional[str] = None,
+    ) -> list[str]:
+        args = ["get", "-d"]
+        if remote_type:
+            args.append(f"--{remote_type}")
+        args.append(f":{name}")
+        args.extend(keys)
+        return args
+
+    def _set_health_args(
+        self,
+        status: SnapHealthStatus,
+        message: Optional[str] = None,
+        code: Optional[str] = None,
+    ) -> list[str]:
+        args = ["set-health", status.value]
+        if message is not None:
+            args.append(message)
+        if code is not None:
+            args.extend(["--code", code])
+        return args
+
+    def _refresh_args(self, action: Optional[str] = None) -> list[str]:
+        args = ["refresh", "--pending"]
+        if action:
+            args.append(f"--{action}")
+        return args
+
+    def _parse_json(self, output: str) -> dict[str, Any]:
+        return cast(Dict[str, Any], json.loads(output))
+
+    def _parse_yaml(self, output: str) -> dict[str, Any]:
+        return cast(Dict[str, Any], yaml.safe_load(output))
+
+
+class SnapCtl(_SnapCtlBase):
+    """Run the :data:`snapctl` command.
+
+    By default, commands are run by executing :data:`snapctl`. A different
+    :class:`SnapCtlTransport` can be passed, such as a
+    :class:`SocketTransport` which talks directly to snapd.
+
+    If a :class:`SnapCtlCache` is passed, output of read-only commands is
+    cached, and invalidated by commands changing state.
+
+    If a ``timeout`` is passed, commands not completing in time fail with
+    :class:`SnapCtlTimeout`. It can be overridden for single calls to
+    :meth:`run`, and further limited with :meth:`deadline`.
+
+    If a :class:`CircuitBreaker` is passed, calls fail fast with
+    :class:`SnapCtlCircuitOpen` while snapd is unavailable. With a cache,
+    the last known output for read-only commands is returned instead.
+
+    If a :class:`SingleFlight` is passed, concurrent calls from multiple
+    threads for the same read-only command share a single call.
+
+    If a :class:`ConcurrencyLimit` is passed, the number of concurrent calls
+    is limited. Calls over the limit wait for a free slot, and time waiting
+    counts towards the timeout.
+
+    Passed :class:`SnapCtlInstrument` instances are called before and after
+    each call running :data:`snapctl`.
+
+    """
+
+    #: The cache for read-only commands, if enabled
+    cache: Optional[SnapCtlCache]
+    #: Sharing of concurrent read-only commands, if enabled
+    single_flight: Optional[SingleFlight]
+    #: The limit for concurrent calls, if enabled
+    limit: Optional[ConcurrencyLimit]
+
+    def __init__(
+        self,
+        executable: str = "/usr/bin/snapctl",
+        env: Optional[SnapEnviron] = None,
+        transport: Optional[SnapCtlTransport] = None,
+        cache: Optional[SnapCtlCache] = None,
+        timeout: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        single_flight: Optional[SingleFlight] = None,
+        limit: Optional[ConcurrencyLimit] = None,
+        instruments: Sequence[SnapCtlInstrument] = (),
+    ):
+        super().__init__(
+            executable=executable,
+            env=env,
+            timeout=timeout,
+            breaker=breaker,
+            instruments=instruments,
+        )
+        if transport is None:
+            transport = ExecTransport(executable=executable)
+        self._transport = transport
+        self.cache = cache
+        self.single_flight = single_flight
+        self.limit = limit
 
     def start(self, *services: str, enable: bool = False) -> None:
         """Start all or specified services in the snap.
@@ -118,25 +455,9 @@ class SnapCtl:
           If not specified, all services are returned.
 
         """
-        lines = self._run_for_services("services", services)
-        service_infos = []
-        # skip header
-        for line in lines.splitlines()[1:]:
-            match = self._SERVICE_RE.match(line)
-            if match:
-                info = match.groupdict()
-                notes: list[str] = []
-                if info["notes"] != "-":
-                    notes = info["notes"].split(",")
-                service_infos.append(
-                    ServiceInfo(
-                        name=info["name"],
-                        enabled=info["startup"] == "enabled",
-                        active=info["current"] == "active",
-                        notes=notes,
-                    )
-                )
-        return service_infos
+        return self._parse_services(
+            self._run_for_services("services", services)
+        )
 
     def config_get(self, *keys: str) -> dict[str, Any]:
         """Return the snap configuration.
@@ -144,9 +465,7 @@ class SnapCtl:
         :param keys: a list of config keys to return.
 
         """
-        conf: dict[str, Any]
-        conf = json.loads(self.run("get", "-d", *keys))
-        return conf
+        return self._parse_json(self.run("get", "-d", *keys))
 
     def config_set(self, configs: dict[str, Any]) -> None:
         """Set snap configuration.
@@ -164,6 +483,24 @@ class SnapCtl:
         """
         self.run("set", *self._unset_args(keys))
 
+    def config_update(
+        self, configs: dict[str, Any], unset: Sequence[str] = ()
+    ) -> None:
+        """Set and unset snap configuration keys in a single call.
+
+        If the arguments exceed the system limit for a single command, they're
+        split across multiple calls. Each value must still fit in a single
+        command-line argument when running the :data:`snapctl` executable
+        (see :class:`ExecTransport`).
+
+        :param configs: a dict with configs. Keys can use dotted notation.
+        :param unset: config keys to unset.
+
+        """
+        args = self._set_args(configs) + self._unset_args(tuple(unset))
+        for batch in self._split_args(args):
+            self.run("set", *batch)
+
     def connection_set(self, name: str, configs: dict[str, Any]) -> None:
         """Set plug or slot configuration.
 
@@ -187,10 +524,14 @@ class SnapCtl:
 
         :param name: the plug or slot name.
 
+        :raises SnapCtlError: if snapd can't be reached.
+
         """
         try:
             self.run("is-connected", name)
-        except SnapCtlError:
+        except SnapCtlError as error:
+            if is_transport_failure(error):
+                raise
             return False
         return True
 
@@ -233,17 +574,11 @@ class SnapCtl:
         :param code: an optional code string
 
         """
-        args = [status.value]
-        if message is not None:
-            args.append(message)
-        if code is not None:
-            args.extend(["--code", code])
-        self.run("set-health", *args)
+        self.run(*self._set_health_args(status, message=message, code=code))
 
     def system_mode(self) -> dict[str, Any]:
         """Return info on the device current system mode."""
-        mode: dict[str, Any] = yaml.safe_load(self.run("system-mode"))
-        return mode
+        return self._parse_yaml(self.run("system-mode"))
 
     def refresh(self, action: Optional[str] = None) -> dict[str, Any]:
         """Return refresh state of the snap, optionally requesting an action.
@@ -255,23 +590,114 @@ class SnapCtl:
           or ``hold``.
 
         """
-        args = ["--pending"]
-        if action:
-            args.append(f"--{action}")
-        return cast(Dict[str, Any], yaml.safe_load(self.run("refresh", *args)))
+        return self._parse_yaml(self.run(*self._refresh_args(action=action)))
 
-    def run(self, *args: str) -> str:
+    def run(self, *args: str, timeout: Optional[float] = None) -> str:
         """Execute the command and return its output.
 
         :param args: command args.
+        :param timeout: optional timeout for the command, in seconds. If not
+          specified, :attr:`timeout` is used.
+        :raises SnapCtlTimeout: if the command doesn't complete in time.
+        :raises SnapCtlCircuitOpen: if calls are suspended by the circuit
+          breaker.
 
         """
-        process = Popen([self._executable, *args], stdout=PIPE, stderr=PIPE)
-        process.wait()
-        if process.returncode:
-            raise SnapCtlError(process)
-        output: bytes = cast(IO[bytes], process.stdout).read()
-        return output.decode("utf-8")
+        run: Callable[..., str] = self._call
+        timeout = self._call_timeout(timeout)
+        # waiting for a slot happens outside the circuit breaker, so that
+        # timing out in the queue doesn't count as a failure to reach snapd
+        if self.limit is not None:
+            run = partial(self.limit.call, run=run, timeout=timeout)
+        elif timeout is not None:
+            run = partial(run, timeout=timeout)
+        if self.single_flight is not None:
+            run = partial(self.single_flight.call, run=run, timeout=timeout)
+        if self.cache is None:
+            return run(args)
+        try:
+            return self.cache.call(args, run)
+        except SnapCtlCircuitOpen:
+            output = self.cache.last_known(args)
+            if output is None:
+                raise
+            return output
+
+    def run_stream(
+        self, *args: str, timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """Execute the command and yield chunks of its output.
+
+        This is useful for commands with large output (e.g. ``get -d`` on a
+        large configuration), since the output is not held in memory. It's
+        also not cached.
+
+        :param args: command args.
+        :param timeout: optional timeout for the command, in seconds. If not
+          specified, :attr:`timeout` is used.
+        :raises SnapCtlTimeout: if the command doesn't complete in time.
+
+        """
+        timeout = self._call_timeout(timeout)
+        slot: ContextManager[Optional[float]] = nullcontext(timeout)
+        if self.limit is not None:
+            slot = self.limit.slot(timeout=timeout)
+        try:
+            with slot as timeout:
+                if self.breaker is not None:
+                    self.breaker.acquire()
+                try:
+                    yield from self._instrumented_stream(args, timeout)
+                except BaseException as error:
+                    if self.breaker is not None:
+                        self.breaker.release(error)
+                    raise
+                if self.breaker is not None:
+                    self.breaker.release()
+        finally:
+            if self.cache is not None:
+                self.cache._invalidate_for(args)
+
+    def _call(self, args: Sequence[str], **kwargs: Any) -> str:
+        run = partial(self._instrumented_run, self._transport.run)
+        if self.breaker is None:
+            return run(args, **kwargs)
+        return self.breaker.call(args, partial(run, **kwargs))
+
+    def _instrumented_run(
+        self, run: Callable[..., str], args: Sequence[str], **kwargs: Any
+    ) -> str:
+        start = self._call_started(args)
+        if start is None:
+            return run(args, **kwargs)
+        try:
+            output = run(args, **kwargs)
+        except BaseException as error:
+            self._call_finished(args, start, error=error)
+            raise
+        self._call_finished(args, start, output_size=len(output))
+        return output
+
+    def _instrumented_stream(
+        self, args: Sequence[str], timeout: Optional[float]
+    ) -> Iterator[str]:
+        start = self._call_started(args)
+        if start is None:
+            yield from self._transport.run_stream(args, timeout=timeout)
+            return
+        size = 0
+        try:
+            for chunk in self._transport.run_stream(args, timeout=timeout):
+                size += len(chunk)
+                yield chunk
+        except BaseException as error:
+            self._call_finished(args, start, output_size=size, error=error)
+            raise
+        self._call_finished(args, start, output_size=size)
+
+    def close(self) -> None:
+        """Release resources held by the transport."""
+        self._transport.close()
 
     def _run_for_services(
         self,
@@ -279,35 +705,352 @@ class SnapCtl:
         services: Sequence[str],
         options: Optional[dict[str, bool]] = None,
     ) -> str:
-        opts: list[str] = []
-        if options:
-            opts = [
-                f"--{option}" for option, value in options.items() if value
-            ]
-        if services:
-            service_names = [
-                f"{self._instance_name}.{service}" for service in services
-            ]
-        else:
-            service_names = [self._instance_name]
-        return self.run(cmd, *opts, *service_names)
+        return self.run(*self._services_args(cmd, services, options=options))
 
-    def _set_args(self, configs: dict[str, Any]) -> list[str]:
-        return [f"{key}={json.dumps(value)}" for key, value in configs.items()]
+    def _connection_get(
+        self,
+        name: str,
+        keys: tuple[str, ...],
+        remote_type: Optional[str] = None,
+    ) -> dict[str, Any]:
+        return self._parse_json(
+            self.run(
+                *self._connection_get_args(name, keys, remote_type=remote_type)
+            )
+        )
 
-    def _unset_args(self, configs: tuple[str, ...]) -> list[str]:
-        return [f"{key}!" for key in configs]
 
-    def _connection_get(
+class AsyncSnapCtl(_SnapCtlBase):
+    """Run the :data:`snapctl` command from an :mod:`asyncio` event loop.
+
+    This provides the same methods as :class:`SnapCtl`, as coroutines.
+    Commands are run via :func:`asyncio.create_subprocess_exec`, so they don't
+    block the event loop.
+
+    Timeouts and circuit breakers work as for :class:`SnapCtl`. An
+    :class:`AsyncSingleFlight` can be passed to share calls for the same
+    read-only command among concurrent tasks, and an
+    :class:`AsyncConcurrencyLimit` to limit the number of concurrent calls.
+    Instruments work as for :class:`SnapCtl`.
+
+    """
+
+    #: Sharing of concurrent read-only commands, if enabled
+    single_flight: Optional[AsyncSingleFlight]
+    #: The limit for concurrent calls, if enabled
+    limit: Optional[AsyncConcurrencyLimit]
+
+    def __init__(
+        self,
+        executable: str = "/usr/bin/snapctl",
+        env: Optional[SnapEnviron] = None,
+        timeout: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        single_flight: Optional[AsyncSingleFlight] = None,
+        limit: Optional[AsyncConcurrencyLimit] = None,
+        instruments: Sequence[SnapCtlInstrument] = (),
+    ):
+        super().__init__(
+            executable=executable,
+            env=env,
+            timeout=timeout,
+            breaker=breaker,
+            instruments=instruments,
+        )
+        self.single_flight = single_flight
+        self.limit = limit
+
+    async def start(self, *services: str, enable: bool = False) -> None:
+        """Start all or specified services in the snap.
+
+        :param services: a list of services defined in the snap to start.
+          If not specified, all services will be started.
+        :param enable: whether to also enable services at startup.
+
+        """
+        await self._run_for_services(
+            "start", services, options={"enable": enable}
+        )
+
+    async def stop(self, *services: str, disable: bool = False) -> None:
+        """Stop all or specified services in the snap.
+
+        :param services: a list of services defined in the snap to stop.
+          If not specified, all services will be stopped.
+        :param disable: whether to also disable services at startup.
+
+        """
+        await self._run_for_services(
+            "stop", services, options={"disable": disable}
+        )
+
+    async def restart(self, *services: str, reload: bool = False) -> None:
+        """Restart all or specified services in the snap.
+
+        :param services: a list of services defined in the snap to restart.
+          If not specified, all services will be restarted.
+        :param reload: whether to reload services if supported.
+
+        """
+        await self._run_for_services(
+            "restart", services, options={"reload": reload}
+        )
+
+    async def services(self, *services: str) -> list[ServiceInfo]:
+        """Return info about services in the snap.
+
+        :param services: a list of services to return info for.
+          If not specified, all services are returned.
+
+        """
+        return self._parse_services(
+            await self._run_for_services("services", services)
+        )
+
+    async def config_get(self, *keys: str) -> dict[str, Any]:
+        """Return the snap configuration.
+
+        :param keys: a list of config keys to return.
+
+        """
+        return self._parse_json(await self.run("get", "-d", *keys))
+
+    async def config_set(self, configs: dict[str, Any]) -> None:
+        """Set snap configuration.
+
+        :param configs: a dict with configs. Keys can use dotted notation.
+
+        """
+        await self.run("set", *self._set_args(configs))
+
+    async def config_unset(self, *keys: str) -> None:
+        """Unset snap configuration keys.
+
+        :param keys: config keys to unset.
+
+        """
+        await self.run("set", *self._unset_args(keys))
+
+    async def config_update(
+        self, configs: dict[str, Any], unset: Sequence[str] = ()
+    ) -> None:
+        """Set and unset snap configuration keys in a single call.
+
+        If the arguments exceed the system limit for a single command, they're
+        split across multiple calls. Each value must still fit in a single
+        command-line argument.
+
+        :param configs: a dict with configs. Keys can use dotted notation.
+        :param unset: config keys to unset.
+
+        """
+        args = self._set_args(configs) + self._unset_args(tuple(unset))
+        for batch in self._split_args(args):
+            await self.run("set", *batch)
+
+    async def connection_set(self, name: str, configs: dict[str, Any]) -> None:
+        """Set plug or slot configuration.
+
+        :param name: the plug/slot name.
+        :param configs: a dict with configs. Keys can use dotted notation.
+
+        """
+        await self.run("set", f":{name}", *self._set_args(configs))
+
+    async def connection_unset(self, name: str, *keys: str) -> None:
+        """Unset plug or slot configuration.
+
+        :param name: the plug/slot name.
+        :param keys: keys to unset. Dotted notation can be used.
+
+        """
+        await self.run("set", f":{name}", *self._unset_args(keys))
+
+    async def is_connected(self, name: str) -> bool:
+        """Return whether a plug or slot is connected.
+
+        :param name: the plug or slot name.
+
+        :raises SnapCtlError: if snapd can't be reached.
+
+        """
+        try:
+            await self.run("is-connected", name)
+        except SnapCtlError as error:
+            if is_transport_failure(error):
+                raise
+            return False
+        return True
+
+    async def plug_get(
+        self, name: str, *keys: str, remote: bool = False
+    ) -> dict[str, Any]:
+        """Return plug configuration.
+
+        :param name: the plug name.
+        :param keys: a list of config keys to return.
+        :param remote: if True, return configs from the remote end.
+
+        """
+        remote_type = "slot" if remote else None
+        return await self._connection_get(name, keys, remote_type=remote_type)
+
+    async def slot_get(
+        self, name: str, *keys: str, remote: bool = False
+    ) -> dict[str, Any]:
+        """Return slot configuration.
+
+        :param name: the slot name.
+        :param keys: a list of config keys to return.
+        :param remote: if True, return configs from the remote end.
+
+        """
+        remote_type = "plug" if remote else None
+        return await self._connection_get(name, keys, remote_type=remote_type)
+
+    async def set_health(
+        self,
+        status: SnapHealthStatus,
+        message: Optional[str] = None,
+        code: Optional[str] = None,
+    ) -> None:
+        """Set snap health.
+
+        :param status: the status to set
+        :param message: an optional message string
+        :param code: an optional code string
+
+        """
+        await self.run(
+            *self._set_health_args(status, message=message, code=code)
+        )
+
+    async def system_mode(self) -> dict[str, Any]:
+        """Return info on the device current system mode."""
+        return self._parse_yaml(await self.run("system-mode"))
+
+    async def refresh(self, action: Optional[str] = None) -> dict[str, Any]:
+        """Return refresh state of the snap, optionally requesting an action.
+
+        To perform actions, the snap must have the ``snap-refresh-control``
+        interface.
+
+        :param action: Optional refresh action to perform, either ``proceed``
+          or ``hold``.
+
+        """
+        return self._parse_yaml(
+            await self.run(*self._refresh_args(action=action))
+        )
+
+    async def run(self, *args: str, timeout: Optional[float] = None) -> str:
+        """Execute the command and return its output.
+
+        :param args: command args.
+        :param timeout: optional timeout for the command, in seconds. If not
+          specified, :attr:`timeout` is used.
+        :raises SnapCtlTimeout: if the command doesn't complete in time.
+        :raises SnapCtlCircuitOpen: if calls are suspended by the circuit
+          breaker.
+
+        """
+        check_args_size(args)
+        timeout = self._call_timeout(timeout)
+        if self.single_flight is None:
+            return await self._call(args, timeout=timeout)
+        return await self.single_flight.call(
+            args, partial(self._call, timeout=timeout), timeout=timeout
+        )
+
+    async def _call(
+        self, args: Sequence[str], timeout: Optional[float]
+    ) -> str:
+        # waiting for a slot happens outside the circuit breaker, so that
+        # timing out in the queue doesn't count as a failure to reach snapd
+        if self.limit is None:
+            return await self._breaker_exec(args, timeout)
+        async with self.limit.slot(timeout=timeout) as remaining:
+            return await self._breaker_exec(args, remaining)
+
+    async def _breaker_exec(
+        self, args: Sequence[str], timeout: Optional[float]
+    ) -> str:
+        if self.breaker is None:
+            return await self._instrumented_exec(args, timeout)
+        self.breaker.acquire()
+        try:
+            output = await self._instrumented_exec(args, timeout)
+        except BaseException as error:
+            self.breaker.release(error)
+            raise
+        self.breaker.release()
+        return output
+
+    async def _instrumented_exec(
+        self, args: Sequence[str], timeout: Optional[float]
+    ) -> str:
+        start = self._call_started(args)
+        if start is None:
+            return await self._exec(args, timeout)
+        try:
+            output = await self._exec(args, timeout)
+        except BaseException as error:
+            self._call_finished(args, start, error=error)
+            raise
+        self._call_finished(args, start, output_size=len(output))
+        return output
+
+    async def _exec(
+        self, args: Sequence[str], timeout: Optional[float]
+    ) -> str:
+        process = await asyncio.create_subprocess_exec(
+            self._executable,
+            *args,
+            stdout=PIPE,
+            stderr=PIPE,
+            # run in a separate process group, so that child processes
+            # holding output pipes can be killed on timeout or cancellation
+            start_new_session=True,
+        )
+        try:
+            output, error = await asyncio.wait_for(
+                process.communicate(), timeout
+            )
+        except asyncio.TimeoutError:
+            await self._kill(process)
+            raise SnapCtlTimeout(cast(float, timeout))
+        except BaseException:
+            # e.g. the task was cancelled
+            await asyncio.shield(self._kill(process))
+            raise
+        if process.returncode:
+            raise SnapCtlError(process.returncode, error.decode("utf-8"))
+        return output.decode("utf-8")
+
+    async def _kill(self, process: asyncio.subprocess.Process) -> None:
+        """Kill the process group of a process, and reap it."""
+        with suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+
+    async def _run_for_services(
+        self,
+        cmd: str,
+        services: Sequence[str],
+        options: Optional[dict[str, bool]] = None,
+    ) -> str:
+        return await self.run(
+            *self._services_args(cmd, services, options=options)
+        )
+
+    async def _connection_get(
         self,
         name: str,
         keys: tuple[str, ...],
         remote_type: Optional[str] = None,
     ) -> dict[str, Any]:
-        args = ["get", "-d"]
-        if remote_type:
-            args.append(f"--{remote_type}")
-        args.append(f":{name}")
-        args.extend(keys)
-        conf: dict[str, Any] = json.loads(self.run(*args))
-        return conf
+        return self._parse_json(
+            await self.run(
+                *self._connection_get_args(name, keys, remote_type=remote_type)
+            )
+        )
@@ -0,0 +1,155 @@
+import asyncio
+from concurrent import futures
+from threading import Lock
+from typing import (
+    Awaitable,
+    Callable,
+    cast,
+    Dict,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ._transport import (
+    is_read_only,
+    SnapCtlTimeout,
+)
+
+
+class _SingleFlightBase:
+    #: Number of calls that were run
+    calls: int = 0
+    #: Number of calls that shared the result of an in-flight call
+    shared: int = 0
+
+
+class SingleFlight(_SingleFlightBase):
+    """Collapse concurrent identical read-only commands into a single call.
+
+    While a read-only command is running, other threads calling the same
+    command (with the same args) wait for it to complete and get the same
+    output or error, instead of running their own.
+
+    Calls started before a command changing state completes are not shared
+    with callers coming after it.
+
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Tuple[str, ...], "futures.Future[str]"] = {}
+        self._lock = Lock()
+
+    def call(
+        self,
+        args: Sequence[str],
+        run: Callable[[Sequence[str]], str],
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Return output for a command, sharing an in-flight call if any.
+
+        :param args: command args.
+        :param run: the function to run the command.
+        :param timeout: how long to wait for an in-flight call, in seconds.
+        :raises SnapCtlTimeout: if the in-flight call doesn't complete in time.
+
+        """
+        if not is_read_only(args):
+            output = run(args)
+            with self._lock:
+                self._flights.clear()
+            return output
+
+        key = tuple(args)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = futures.Future()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            try:
+                return flight.result(timeout)
+            except futures.TimeoutError:
+                raise SnapCtlTimeout(cast(float, timeout))
+
+        try:
+            output = run(args)
+        except BaseException as error:
+            flight.set_exception(error)
+            raise
+        else:
+            flight.set_result(output)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        return output
+
+
+class AsyncSingleFlight(_SingleFlightBase):
+    """Asynchronous version of :class:`SingleFlight`.
+
+    Concurrent tasks calling the same read-only command share a single call.
+    If the task running the call is cancelled, waiting tasks run the command
+    again.
+
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Tuple[str, ...], "asyncio.Future[str]"] = {}
+
+    async def call(
+        self,
+        args: Sequence[str],
+        run: Callable[[Sequence[str]], Awaitable[str]],
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Return output for a command, sharing an in-flight call if any.
+
+        :param args: command args.
+        :param run: the coroutine function to run the command.
+        :param timeout: how long to wait for an in-flight call, in seconds.
+        :raises SnapCtlTimeout: if the in-flight call doesn't complete in time.
+
+        """
+        if not is_read_only(args):
+            output = await run(args)
+            self._flights.clear()
+            return output
+
+        key = tuple(args)
+        while key in self._flights:
+            flight = self._flights[key]
+            self.shared += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight), timeout)
+            except asyncio.TimeoutError:
+                raise SnapCtlTimeout(cast(float, timeout))
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the task running the call was cancelled, try again
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self.calls += 1
+        try:
+            output = await run(args)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as error:
+            flight.set_exception(error)
+            # the error is raised here, don't warn if there are no waiters
+            flight.exception()
+            raise
+        else:
+            flight.set_result(output)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        return output
@@ -2,6 +2,7 @@ import re
 from typing import Optional
 
 from ._ctl import (
+    AsyncSnapCtl,
     SnapCtl,
     SnapHealthStatus,
 )
@@ -51,8 +52,53 @@ class SnapHealth:
     def _set_health(
         self, status: SnapHealthStatus, message: str, code: Optional[str]
     ) -> None:
-        if not message:
-            raise ValueError("Health status message must not be empty")
-        if code is not None and not STATUS_CODE_RE.match(code):
-            raise ValueError("Invalid health status code format")
+        _validate_health(message, code)
         self._snapctl.set_health(status, message=message, code=code)
+
+
+class AsyncSnapHealth:
+    """Asynchronous version of :class:`SnapHealth`."""
+
+    def __init__(self, snapctl: Optional[AsyncSnapCtl] = None):
+        self._snapctl = snapctl or AsyncSnapCtl()
+
+    async def okay(self) -> None:
+        """Set the status of the snap to "okay"."""
+        await self._snapctl.set_health(SnapHealthStatus.OKAY)
+
+    async def waiting(self, message: str, code: Optional[str] = None) -> None:
+        """Set the status of the snap to "waiting".
+
+        :param message: a message string for the status
+        :param code: an optional code string
+        """
+        await self._set_health(SnapHealthStatus.WAITING, message, code)
+
+    async def blocked(self, message: str, code: Optional[str] = None) -> None:
+        """Set the status of the snap to "blocked".
+
+        :param message: a message string for the status
+        :param code: an optional code string
+        """
+        await self._set_health(SnapHealthStatus.BLOCKED, message, code)
+
+    async def error(self, message: str, code: Optional[str] = None) -> None:
+        """Set the status of the snap to "error".
+
+        :param message: a message string for the status
+        :param code: an optional code string
+        """
+        await self._set_health(SnapHealthStatus.ERROR, message, code)
+
+    async def _set_health(
+        self, status: SnapHealthStatus, message: str, code: Optional[str]
+    ) -> None:
+        _validate_health(message, code)
+        await self._snapctl.set_health(status, message=message, code=code)
+
+
+def _validate_health(message: str, code: Optional[str]) -> None:
+    if not message:
+        raise ValueError("Health status message must not be empty")
+    if code is not None and not STATUS_CODE_RE.match(code):
+        raise ValueError("Invalid health status code format")
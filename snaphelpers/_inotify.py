@@ -0,0 +1,88 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from typing import (
+    List,
+    Optional,
+)
+
+# flags from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+
+
+def _libc() -> ctypes.CDLL:
+    name = ctypes.util.find_library("c")
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not available")
+    return libc
+
+
+class Inotify:
+    """Watch a directory for changes to files, using inotify.
+
+    :param path: the directory to watch.
+    :param mask: the mask of events to watch for.
+    :raises OSError: if inotify is not available.
+
+    """
+
+    def __init__(self, path: str, mask: int = IN_CLOSE_WRITE | IN_MOVED_TO):
+        libc = _libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            _raise_errno()
+        if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+            os.close(fd)
+            _raise_errno()
+        self._fd: Optional[int] = fd
+
+    def fileno(self) -> int:
+        """Return the inotify file descriptor."""
+        if self._fd is None:
+            raise ValueError("Inotify instance is closed")
+        return self._fd
+
+    def close(self) -> None:
+        """Close the inotify file descriptor."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def read(self, timeout: Optional[float] = None) -> List[str]:
+        """Wait for events, returning names of changed files.
+
+        :param timeout: how long to wait for events, in seconds. If None, wait
+          indefinitely.
+        :return: a list of file names, empty if no event happened.
+
+        """
+        fd = self.fileno()
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            names.append(os.fsdecode(name))
+        return names
+
+
+def _raise_errno() -> None:
+    errno = ctypes.get_errno()
+    raise OSError(errno, os.strerror(errno))
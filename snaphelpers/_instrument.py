@@ -0,0 +1,133 @@
+from bisect import bisect_left
+from threading import Lock
+from typing import (
+    Dict,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+
+class SnapCtlCall(NamedTuple):
+    """A record of a :data:`snapctl` call."""
+
+    #: The command args
+    args: Tuple[str, ...]
+    #: Wall time of the call, in seconds
+    duration: float
+    #: The command return code, or None if it couldn't be run
+    returncode: Optional[int]
+    #: Size of the output, in characters
+    output_size: int
+
+    @property
+    def command(self) -> str:
+        """The :data:`snapctl` subcommand."""
+        return self.args[0] if self.args else ""
+
+
+class SnapCtlInstrument:
+    """Base class for instruments called for each :data:`snapctl` call.
+
+    Subclasses can override :meth:`before` and :meth:`after`.
+
+    """
+
+    def before(self, args: Sequence[str]) -> None:
+        """Called before running a command.
+
+        :param args: command args.
+
+        """
+
+    def after(self, call: SnapCtlCall) -> None:
+        """Called after a command completes or fails.
+
+        :param call: the :class:`SnapCtlCall` with details of the call.
+
+        """
+
+
+class CommandMetrics:
+    """Metrics for calls of a :data:`snapctl` subcommand.
+
+    :param bounds: upper bounds of histogram buckets, in seconds.
+
+    """
+
+    #: Number of calls
+    count: int = 0
+    #: Number of failed calls
+    errors: int = 0
+    #: Total time of calls, in seconds
+    total_time: float = 0.0
+
+    def __init__(self, bounds: Sequence[float]):
+        #: Upper bounds of histogram buckets, in seconds
+        self.bounds = tuple(bounds)
+        #: Number of calls by duration bucket. The last bucket counts calls
+        #: taking longer than the highest bound.
+        self.buckets = [0] * (len(self.bounds) + 1)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(count={self.count}, "
+            f"errors={self.errors}, total_time={self.total_time:.6f})"
+        )
+
+    @property
+    def mean_time(self) -> float:
+        """Average time of calls, in seconds."""
+        return self.total_time / self.count if self.count else 0.0
+
+    def _add(self, call: SnapCtlCall) -> None:
+        self.count += 1
+        if call.returncode != 0:
+            self.errors += 1
+        self.total_time += call.duration
+        self.buckets[bisect_left(self.bounds, call.duration)] += 1
+
+
+class SnapCtlMetrics(SnapCtlInstrument):
+    """Collect call counts and latency histograms by :data:`snapctl`
+    subcommand.
+
+    :param bounds: upper bounds of histogram buckets, in seconds.
+
+    """
+
+    #: Default upper bounds of histogram buckets, in seconds
+    DEFAULT_BOUNDS: Tuple[float, ...] = (
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    )
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BOUNDS):
+        self.bounds = tuple(sorted(bounds))
+        #: :class:`CommandMetrics` by subcommand name
+        self.commands: Dict[str, CommandMetrics] = {}
+        self._lock = Lock()
+
+    def after(self, call: SnapCtlCall) -> None:
+        with self._lock:
+            metrics = self.commands.get(call.command)
+            if metrics is None:
+                metrics = self.commands[call.command] = CommandMetrics(
+                    self.bounds
+                )
+            metrics._add(call)
+
+    def reset(self) -> None:
+        """Clear collected metrics."""
+        with self._lock:
+            self.commands.clear()
@@ -0,0 +1,291 @@
+import asyncio
+from collections import deque
+from contextlib import (
+    asynccontextmanager,
+    contextmanager,
+)
+import fcntl
+import os
+from pathlib import Path
+from threading import (
+    Event,
+    Lock,
+)
+import time
+from time import monotonic
+from typing import (
+    AsyncIterator,
+    Callable,
+    cast,
+    Deque,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ._transport import SnapCtlTimeout
+
+# initial and maximum interval for polling lock files, in seconds
+_POLL_INTERVAL = 0.005
+_MAX_POLL_INTERVAL = 0.1
+
+
+class _FileSlots:
+    """A semaphore across processes, using a set of lock files."""
+
+    def __init__(self, lock_dir: Path, count: int):
+        self._paths = [
+            lock_dir / f"snapctl-{slot}.lock" for slot in range(count)
+        ]
+
+    def try_acquire(self) -> Optional[int]:
+        """Lock a free slot, returning its file descriptor, if any."""
+        for path in self._paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    def release(self, fd: int) -> None:
+        """Release a slot."""
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class _ConcurrencyLimitBase:
+    #: Number of calls that were run
+    calls: int = 0
+    #: Number of calls that had to wait for a free slot
+    queued: int = 0
+    #: Total time calls waited for a free slot, in seconds
+    wait_time: float = 0.0
+    #: Longest time a call waited for a free slot, in seconds
+    max_wait_time: float = 0.0
+
+    def __init__(self, max_calls: int = 4, lock_dir: Optional[Path] = None):
+        if max_calls < 1:
+            raise ValueError("Concurrency limit must be at least 1")
+        self.max_calls = max_calls
+        self.lock_dir = lock_dir
+        self._slots: Optional[_FileSlots] = None
+        if lock_dir is not None:
+            self._slots = _FileSlots(lock_dir, max_calls)
+        self._active = 0
+
+    def _remaining(
+        self, start: float, timeout: Optional[float]
+    ) -> Optional[float]:
+        if timeout is None:
+            return None
+        remaining = start + timeout - monotonic()
+        if remaining <= 0:
+            raise SnapCtlTimeout(timeout)
+        return remaining
+
+    def _record_wait(self, start: float, queued: bool) -> None:
+        wait = monotonic() - start
+        self.calls += 1
+        if queued:
+            self.queued += 1
+        self.wait_time += wait
+        self.max_wait_time = max(self.max_wait_time, wait)
+
+
+class ConcurrencyLimit(_ConcurrencyLimitBase):
+    """Limit the number of concurrent :data:`snapctl` calls.
+
+    Calls over the limit wait for a free slot, and are run in the order they
+    were made.
+
+    If ``lock_dir`` is passed, the limit is shared among processes using it,
+    through a set of lock files in the directory (such as
+    :attr:`SnapPaths.common`). Across processes, free slots are polled.
+
+    :param max_calls: the maximum number of concurrent calls.
+    :param lock_dir: an optional directory for lock files shared among
+      processes.
+
+    """
+
+    def __init__(self, max_calls: int = 4, lock_dir: Optional[Path] = None):
+        super().__init__(max_calls=max_calls, lock_dir=lock_dir)
+        self._waiters: Deque[Event] = deque()
+        self._lock = Lock()
+
+    def call(
+        self,
+        args: Sequence[str],
+        run: Callable[..., str],
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Run a command once a slot is free.
+
+        :param args: command args.
+        :param run: the function to run the command. If a timeout is set, it's
+          passed the remaining time as ``timeout``.
+        :param timeout: timeout for waiting and running the command, in
+          seconds.
+        :raises SnapCtlTimeout: if no slot is free in time.
+
+        """
+        with self.slot(timeout=timeout) as remaining:
+            if remaining is None:
+                return run(args)
+            return run(args, timeout=remaining)
+
+    @contextmanager
+    def slot(
+        self, timeout: Optional[float] = None
+    ) -> Iterator[Optional[float]]:
+        """Context manager holding a slot for a call.
+
+        :param timeout: timeout for waiting and running the command, in
+          seconds.
+        :return: the time left before the timeout, if one is set.
+        :raises SnapCtlTimeout: if no slot is free in time.
+
+        """
+        start = monotonic()
+        queued = self._acquire(start, timeout)
+        try:
+            fd, file_queued = self._acquire_file_slot(start, timeout)
+        except BaseException:
+            self._release()
+            raise
+        with self._lock:
+            self._record_wait(start, queued or file_queued)
+        try:
+            yield self._remaining(start, timeout)
+        finally:
+            if fd is not None:
+                cast(_FileSlots, self._slots).release(fd)
+            self._release()
+
+    def _acquire(self, start: float, timeout: Optional[float]) -> bool:
+        remaining = self._remaining(start, timeout)
+        with self._lock:
+            if self._active < self.max_calls and not self._waiters:
+                self._active += 1
+                return False
+            waiter = Event()
+            self._waiters.append(waiter)
+        if waiter.wait(remaining):
+            return True
+        with self._lock:
+            if waiter.is_set():
+                # the slot was handed over while timing out
+                return True
+            self._waiters.remove(waiter)
+        raise SnapCtlTimeout(cast(float, timeout))
+
+    def _release(self) -> None:
+        with self._lock:
+            if self._waiters:
+                # hand the slot over to the first waiter
+                self._waiters.popleft().set()
+            else:
+                self._active -= 1
+
+    def _acquire_file_slot(
+        self, start: float, timeout: Optional[float]
+    ) -> Tuple[Optional[int], bool]:
+        if self._slots is None:
+            return None, False
+        interval = _POLL_INTERVAL
+        queued = False
+        while True:
+            fd = self._slots.try_acquire()
+            if fd is not None:
+                return fd, queued
+            queued = True
+            remaining = self._remaining(start, timeout)
+            time.sleep(min(interval, remaining or interval))
+            interval = min(interval * 2, _MAX_POLL_INTERVAL)
+
+
+class AsyncConcurrencyLimit(_ConcurrencyLimitBase):
+    """Asynchronous version of :class:`ConcurrencyLimit`.
+
+    Tasks over the limit wait for a free slot, in the order they made calls.
+
+    """
+
+    def __init__(self, max_calls: int = 4, lock_dir: Optional[Path] = None):
+        super().__init__(max_calls=max_calls, lock_dir=lock_dir)
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+
+    @asynccontextmanager
+    async def slot(
+        self, timeout: Optional[float] = None
+    ) -> AsyncIterator[Optional[float]]:
+        """Asynchronous context manager holding a slot for a call.
+
+        :param timeout: timeout for waiting and running the command, in
+          seconds.
+        :return: the time left before the timeout, if one is set.
+        :raises SnapCtlTimeout: if no slot is free in time.
+
+        """
+        start = monotonic()
+        queued = await self._acquire(start, timeout)
+        try:
+            fd, file_queued = await self._acquire_file_slot(start, timeout)
+        except BaseException:
+            self._release()
+            raise
+        self._record_wait(start, queued or file_queued)
+        try:
+            yield self._remaining(start, timeout)
+        finally:
+            if fd is not None:
+                cast(_FileSlots, self._slots).release(fd)
+            self._release()
+
+    async def _acquire(self, start: float, timeout: Optional[float]) -> bool:
+        remaining = self._remaining(start, timeout)
+        if self._active < self.max_calls and not self._waiters:
+            self._active += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            done, _ = await asyncio.wait([waiter], timeout=remaining)
+        except asyncio.CancelledError:
+            if waiter.done():
+                # the slot was handed over, pass it on
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        if not done:
+            self._waiters.remove(waiter)
+            raise SnapCtlTimeout(cast(float, timeout))
+        return True
+
+    def _release(self) -> None:
+        if self._waiters:
+            # hand the slot over to the first waiter
+            self._waiters.popleft().set_result(None)
+        else:
+            self._active -= 1
+
+    async def _acquire_file_slot(
+        self, start: float, timeout: Optional[float]
+    ) -> Tuple[Optional[int], bool]:
+        if self._slots is None:
+            return None, False
+        interval = _POLL_INTERVAL
+        queued = False
+        while True:
+            fd = self._slots.try_acquire()
+            if fd is not None:
+                return fd, queued
+            queued = True
+            remaining = self._remaining(start, timeout)
+            await asyncio.sleep(min(interval, remaining or interval))
+            interval = min(interval * 2, _MAX_POLL_INTERVAL)
@@ -1,67 +1,359 @@
+import asyncio
+import random
+from time import (
+    monotonic,
+    sleep,
+)
 from typing import (
     Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
     Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
     Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
 )
 
 from ._ctl import (
+    AsyncSnapCtl,
     ServiceInfo,
     SnapCtl,
 )
+from ._watch import ConfigDiff
 
 
-class SnapService:
-    """A service defined in the Snap."""
+class _Backoff:
+    """Exponential backoff with jitter, within a deadline."""
 
-    def __init__(self, info: ServiceInfo, snapctl: Optional[SnapCtl] = None):
-        self._info = info
-        self._snapctl = snapctl or SnapCtl()
+    def __init__(
+        self, timeout: float, interval: float = 0.1, max_interval: float = 2.0
+    ):
+        self._deadline = monotonic() + timeout
+        self._interval = interval
+        self._max_interval = max_interval
+
+    def delay(self) -> Optional[float]:
+        """Return the delay before the next attempt, None if past deadline."""
+        remaining = self._deadline - monotonic()
+        if remaining <= 0:
+            return None
+        delay = random.uniform(self._interval / 2, self._interval)
+        self._interval = min(self._interval * 2, self._max_interval)
+        return min(delay, remaining)
+
+
+def _wait_for(check: Callable[[], bool], timeout: float) -> bool:
+    backoff = _Backoff(timeout)
+    while not check():
+        delay = backoff.delay()
+        if delay is None:
+            return False
+        sleep(delay)
+    return True
+
+
+async def _async_wait_for(
+    check: Callable[[], Awaitable[bool]], timeout: float
+) -> bool:
+    backoff = _Backoff(timeout)
+    while not await check():
+        delay = backoff.delay()
+        if delay is None:
+            return False
+        await asyncio.sleep(delay)
+    return True
+
+
+def _in_state(
+    infos: Iterable[ServiceInfo], active: bool, enabled: Optional[bool]
+) -> bool:
+    return all(
+        info.active == active and enabled in (None, info.enabled)
+        for info in infos
+    )
+
+
+class _SnapServiceBase:
+    """Common attributes for a service defined in the Snap."""
+
+    _info: ServiceInfo
+    _snapctl: Any
 
     def __getattr__(self, attr: str) -> Any:
         # forward attributes defined in ServiceInfo
         return getattr(self._info, attr)
 
     def __eq__(self, other: Any) -> bool:
-        if not isinstance(other, SnapService):
+        if not isinstance(other, self.__class__):
             return NotImplemented
         return self._info == other._info and self._snapctl is other._snapctl
 
-    def start(self, enable: bool = False) -> None:
+
+class SnapService(_SnapServiceBase):
+    """A service defined in the Snap."""
+
+    def __init__(self, info: ServiceInfo, snapctl: Optional[SnapCtl] = None):
+        self._info = info
+        self._snapctl = snapctl or SnapCtl()
+
+    def start(self, enable: bool = False, refresh: bool = True) -> None:
         """Start the service.
 
         :param enable: whether to also enable the service at startup.
+        :param refresh: whether to update the status of the service after the
+          action.
 
         """
         self._snapctl.start(self.name, enable=enable)
-        self.refresh_status()
+        if refresh:
+            self.refresh_status()
 
-    def stop(self, disable: bool = False) -> None:
+    def stop(self, disable: bool = False, refresh: bool = True) -> None:
         """Stop the service.
 
         :param disable: whether to also disable the service at startup.
+        :param refresh: whether to update the status of the service after the
+          action.
 
         """
         self._snapctl.stop(self.name, disable=disable)
-        self.refresh_status()
+        if refresh:
+            self.refresh_status()
 
-    def restart(self, reload: bool = False) -> None:
+    def restart(self, reload: bool = False, refresh: bool = True) -> None:
         """Restart the service.
 
         :param reload: whether to reload the service if supported.
+        :param refresh: whether to update the status of the service after the
+          action.
 
         """
         self._snapctl.restart(self.name, reload=reload)
-        self.refresh_status()
+        if refresh:
+            self.refresh_status()
 
     def refresh_status(self) -> None:
-        """Update the status of the ervice service."""
+        """Update the status of the service."""
         [self._info] = self._snapctl.services(self.name)
 
+    def wait_until(
+        self,
+        active: bool = True,
+        enabled: Optional[bool] = None,
+        timeout: float = 30.0,
+    ) -> bool:
+        """Wait until the service reaches the specified status.
+
+        The status is checked with exponential backoff and jitter, until it
+        matches or the timeout expires.
+
+        :param active: whether the service should be active.
+        :param enabled: whether the service should be enabled. If None, the
+          startup status is not checked.
+        :param timeout: how long to wait for, in seconds.
+        :return: whether the service reached the status.
+
+        """
+
+        def check() -> bool:
+            self.refresh_status()
+            return _in_state([self._info], active, enabled)
+
+        return _wait_for(check, timeout)
+
+
+class ServiceCall(NamedTuple):
+    """A :data:`snapctl` call changing the state of services."""
+
+    #: The action (``start``, ``stop`` or ``restart``)
+    action: str
+    #: Names of the services
+    services: List[str]
+    #: Options for the action (e.g. ``enable``)
+    options: List[str]
+
+
+class ServiceChange(NamedTuple):
+    """A change in the status of a service."""
+
+    #: The service, with its current status
+    service: "Union[SnapService, AsyncSnapService]"
+    #: The previous status of the service, None if it wasn't known
+    previous: Optional[ServiceInfo]
+    #: Names of changed fields (``enabled``, ``active`` and ``notes``)
+    changed: Tuple[str, ...]
+
+
+_SERVICE_FIELDS = ("enabled", "active", "notes")
+
+_Service = TypeVar("_Service", "SnapService", "AsyncSnapService")
+
+
+# Order of calls when reconciling services: services are disabled before
+# being started, and enabled before being stopped, since snapctl can only
+# change startup state along with the current one.
+_RECONCILE_CALLS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("stop", ("disable",)),
+    ("start", ("enable",)),
+    ("start", ()),
+    ("stop", ()),
+    ("restart", ()),
+)
+
+_SERVICE_STATES = {
+    "active": ("active", True),
+    "inactive": ("active", False),
+    "enabled": ("enabled", True),
+    "disabled": ("enabled", False),
+    "restarted": ("restart", True),
+}
+
+
+def _parse_service_state(state: str) -> Dict[str, bool]:
+    parsed: Dict[str, bool] = {}
+    for token in state.split("+"):
+        if token not in _SERVICE_STATES:
+            raise ValueError(f"Invalid service state: {state}")
+        field, value = _SERVICE_STATES[token]
+        if parsed.get(field, value) != value:
+            raise ValueError(f"Invalid service state: {state}")
+        parsed[field] = value
+    return parsed
+
+
+def _dependency_layers(graph: Dict[str, Sequence[str]]) -> List[List[str]]:
+    dependencies = {name: set(deps) for name, deps in graph.items()}
+    for deps in list(dependencies.values()):
+        for name in deps:
+            dependencies.setdefault(name, set())
+    layers = []
+    while dependencies:
+        layer = sorted(name for name, deps in dependencies.items() if not deps)
+        if not layer:
+            names = ", ".join(sorted(dependencies))
+            raise ValueError(f"Cyclic services dependencies: {names}")
+        layers.append(layer)
+        for name in layer:
+            del dependencies[name]
+        for deps in dependencies.values():
+            deps.difference_update(layer)
+    return layers
 
-class SnapServices:
-    """Manage services in the snap."""
 
-    def __init__(self, snapctl: Optional[SnapCtl] = None):
+class _SnapServicesBase:
+    """Common logic for managing services in the snap."""
+
+    def __init__(
+        self, config_dependencies: Optional[Dict[str, Sequence[str]]] = None
+    ):
+        #: Names of services depending on each configuration key prefix
+        self.config_dependencies = dict(config_dependencies or {})
+
+    def affected_services(self, diff: ConfigDiff) -> List[str]:
+        """Return names of services affected by configuration changes.
+
+        Services are looked up in :attr:`config_dependencies`.
+
+        :param diff: the :class:`ConfigDiff` with configuration changes.
+
+        """
+        names = {
+            name
+            for prefix, services in self.config_dependencies.items()
+            if diff.affects(prefix)
+            for name in services
+        }
+        return sorted(names)
+
+    def _update_services(
+        self, services: Sequence[_SnapServiceBase], infos: List[ServiceInfo]
+    ) -> None:
+        infos_by_name = {info.name: info for info in infos}
+        for service in services:
+            service._info = infos_by_name[service.name]
+
+    def _service_changes(
+        self,
+        services: Dict[str, _Service],
+        infos: List[ServiceInfo],
+        make_service: Callable[[ServiceInfo], _Service],
+    ) -> List[ServiceChange]:
+        changes = []
+        for info in infos:
+            service = services.get(info.name)
+            if service is None:
+                service = services[info.name] = make_service(info)
+                changes.append(ServiceChange(service, None, _SERVICE_FIELDS))
+                continue
+            previous = service._info
+            if info is previous:
+                # parsed info is reused for unchanged services
+                continue
+            changed = tuple(
+                field
+                for field in _SERVICE_FIELDS
+                if getattr(info, field) != getattr(previous, field)
+            )
+            if changed:
+                service._info = info
+                changes.append(ServiceChange(service, previous, changed))
+        return changes
+
+    def _reconcile_calls(
+        self, infos: Sequence[ServiceInfo], desired: Dict[str, str]
+    ) -> List[ServiceCall]:
+        current = {info.name: info for info in infos}
+        groups: Dict[Tuple[str, Tuple[str, ...]], List[str]] = {
+            call: [] for call in _RECONCILE_CALLS
+        }
+        for name, state in desired.items():
+            target = _parse_service_state(state)
+            try:
+                info = current[name]
+            except KeyError:
+                raise ValueError(f"Unknown service: {name}")
+            active, enabled = info.active, info.enabled
+            if target.get("enabled") is False and enabled:
+                groups["stop", ("disable",)].append(name)
+                active = enabled = False
+            elif target.get("enabled") is True and not enabled:
+                groups["start", ("enable",)].append(name)
+                active = enabled = True
+            if target.get("restart"):
+                groups["restart", ()].append(name)
+            elif target.get("active") is True and not active:
+                groups["start", ()].append(name)
+            elif target.get("active") is False and active:
+                groups["stop", ()].append(name)
+        return [
+            ServiceCall(action, names, list(options))
+            for (action, options), names in groups.items()
+            if names
+        ]
+
+
+class SnapServices(_SnapServicesBase):
+    """Manage services in the snap.
+
+    :param snapctl: the :class:`SnapCtl` to use.
+    :param config_dependencies: a dict with configuration key prefixes (in
+      dotted notation) and the names of services that depend on them.
+
+    """
+
+    def __init__(
+        self,
+        snapctl: Optional[SnapCtl] = None,
+        config_dependencies: Optional[Dict[str, Sequence[str]]] = None,
+    ):
+        super().__init__(config_dependencies=config_dependencies)
         self._snapctl = snapctl or SnapCtl()
 
     def list(self) -> Dict[str, SnapService]:
@@ -71,26 +363,425 @@ class SnapServices:
             for info in self._snapctl.services()
         }
 
-    def start(self, enable: bool = False) -> None:
-        """Start all services.
+    def start(self, *services: str, enable: bool = False) -> None:
+        """Start services, with a single call.
+
+        :param services: names of services to start. If not specified, all
+          services are started.
+        :param enable: whether to also enable services at startup.
+
+        """
+        self._snapctl.start(*services, enable=enable)
+
+    def stop(self, *services: str, disable: bool = False) -> None:
+        """Stop services, with a single call.
+
+        :param services: names of services to stop. If not specified, all
+          services are stopped.
+        :param disable: whether to also disable services at startup.
+
+        """
+        self._snapctl.stop(*services, disable=disable)
+
+    def restart(self, *services: str, reload: bool = False) -> None:
+        """Restart services, with a single call.
+
+        :param services: names of services to restart. If not specified, all
+          services are restarted.
+        :param reload: whether to reload services if supported.
+
+        """
+        self._snapctl.restart(*services, reload=reload)
+
+    def refresh_all(self, services: Iterable[SnapService]) -> None:
+        """Update the status of multiple services, with a single call.
+
+        This can be used after actions called with ``refresh=False``.
+
+        :param services: the :class:`SnapService` objects to update.
+
+        """
+        services = list(services)
+        if services:
+            infos = self._snapctl.services(
+                *(service.name for service in services)
+            )
+            self._update_services(services, infos)
+
+    def wait_all(
+        self,
+        *services: str,
+        active: bool = True,
+        enabled: Optional[bool] = None,
+        timeout: float = 30.0,
+    ) -> bool:
+        """Wait until services reach the specified status.
+
+        The status of all services is checked with a single call, with
+        exponential backoff and jitter, until they all match or the timeout
+        expires.
+
+        :param services: names of services to wait for. If not specified, all
+          services are waited for.
+        :param active: whether services should be active.
+        :param enabled: whether services should be enabled. If None, the
+          startup status is not checked.
+        :param timeout: how long to wait for, in seconds.
+        :return: whether all services reached the status.
+
+        """
+        return _wait_for(
+            lambda: _in_state(
+                self._snapctl.services(*services), active, enabled
+            ),
+            timeout,
+        )
+
+    def start_ordered(
+        self,
+        graph: Dict[str, Sequence[str]],
+        enable: bool = False,
+        timeout: float = 30.0,
+    ) -> List[List[str]]:
+        """Start services in dependency order.
+
+        Services are started in layers: each layer includes services whose
+        dependencies are all in previous layers, and is started with a single
+        call. Each layer must be active before the next one is started.
+
+        :param graph: a dict mapping service names to names of services they
+          depend on.
+        :param enable: whether to also enable services at startup.
+        :param timeout: how long to wait for each layer to become active, in
+          seconds.
+        :raises ValueError: if dependencies are cyclic.
+        :raises TimeoutError: if a layer doesn't become active in time.
+        :return: the started layers of service names.
+
+        """
+        layers = _dependency_layers(graph)
+        for index, layer in enumerate(layers):
+            if index:
+                previous = layers[index - 1]
+                if not self.wait_all(*previous, timeout=timeout):
+                    raise TimeoutError(
+                        f"Services not active: {', '.join(previous)}"
+                    )
+            self._snapctl.start(*layer, enable=enable)
+        return layers
+
+    def watch(self, interval: float = 1.0) -> Iterator[ServiceChange]:
+        """Watch services for changes in their status.
+
+        The status of all services is checked with a single call at each
+        interval, and a :class:`ServiceChange` is yielded for each service
+        whose status changed. All services are reported at the first check.
+
+        :class:`SnapService` objects are created once and updated in place, so
+        the same object is returned for all changes to a service.
+
+        :param interval: the polling interval, in seconds.
+
+        """
+        services: Dict[str, SnapService] = {}
+        while True:
+            yield from self._service_changes(
+                services,
+                self._snapctl.services(),
+                lambda info: SnapService(info, snapctl=self._snapctl),
+            )
+            sleep(interval)
+
+    def restart_affected(
+        self, diff: ConfigDiff, reload: bool = False
+    ) -> List[str]:
+        """Restart services affected by configuration changes.
+
+        All affected services are restarted with a single call, and other
+        services are left running.
+
+        :param diff: the :class:`ConfigDiff` with configuration changes.
+        :param reload: whether to reload services if supported.
+        :return: names of restarted services.
+
+        """
+        names = self.affected_services(diff)
+        if names:
+            self._snapctl.restart(*names, reload=reload)
+        return names
+
+    def reconcile(self, desired: Dict[str, str]) -> List[ServiceCall]:
+        """Bring services to the desired state, with minimal calls.
+
+        The current state of services is read once, and services that need
+        the same change are grouped in a single call. Services already in the
+        desired state are left untouched.
+
+        States are combinations of ``active``, ``inactive`` or ``restarted``
+        and ``enabled`` or ``disabled``, joined by ``+`` (e.g.
+        ``active+enabled``). Since :data:`snapctl` can only enable or disable
+        services when starting or stopping them, services being enabled are
+        also started, and services being disabled are also stopped (and
+        started again if they should be active).
+
+        :param desired: a dict with the desired state by service name.
+        :raises ValueError: if a state is invalid or a service is unknown.
+        :return: a list of :class:`ServiceCall` with calls that were made.
+
+        """
+        calls = self._reconcile_calls(self._snapctl.services(), desired)
+        for call in calls:
+            method = getattr(self._snapctl, call.action)
+            method(*call.services, **dict.fromkeys(call.options, True))
+        return calls
+
+
+class AsyncSnapService(_SnapServiceBase):
+    """Asynchronous version of :class:`SnapService`."""
+
+    def __init__(
+        self, info: ServiceInfo, snapctl: Optional[AsyncSnapCtl] = None
+    ):
+        self._info = info
+        self._snapctl = snapctl or AsyncSnapCtl()
+
+    async def start(self, enable: bool = False, refresh: bool = True) -> None:
+        """Start the service.
+
+        :param enable: whether to also enable the service at startup.
+        :param refresh: whether to update the status of the service after the
+          action.
+
+        """
+        await self._snapctl.start(self.name, enable=enable)
+        if refresh:
+            await self.refresh_status()
+
+    async def stop(self, disable: bool = False, refresh: bool = True) -> None:
+        """Stop the service.
+
+        :param disable: whether to also disable the service at startup.
+        :param refresh: whether to update the status of the service after the
+          action.
+
+        """
+        await self._snapctl.stop(self.name, disable=disable)
+        if refresh:
+            await self.refresh_status()
+
+    async def restart(
+        self, reload: bool = False, refresh: bool = True
+    ) -> None:
+        """Restart the service.
+
+        :param reload: whether to reload the service if supported.
+        :param refresh: whether to update the status of the service after the
+          action.
+
+        """
+        await self._snapctl.restart(self.name, reload=reload)
+        if refresh:
+            await self.refresh_status()
+
+    async def refresh_status(self) -> None:
+        """Update the status of the service."""
+        [self._info] = await self._snapctl.services(self.name)
+
+    async def wait_until(
+        self,
+        active: bool = True,
+        enabled: Optional[bool] = None,
+        timeout: float = 30.0,
+    ) -> bool:
+        """Wait until the service reaches the specified status.
+
+        See :meth:`SnapService.wait_until`.
+
+        :param active: whether the service should be active.
+        :param enabled: whether the service should be enabled. If None, the
+          startup status is not checked.
+        :param timeout: how long to wait for, in seconds.
+        :return: whether the service reached the status.
+
+        """
+
+        async def check() -> bool:
+            await self.refresh_status()
+            return _in_state([self._info], active, enabled)
+
+        return await _async_wait_for(check, timeout)
+
+
+class AsyncSnapServices(_SnapServicesBase):
+    """Asynchronous version of :class:`SnapServices`."""
+
+    def __init__(
+        self,
+        snapctl: Optional[AsyncSnapCtl] = None,
+        config_dependencies: Optional[Dict[str, Sequence[str]]] = None,
+    ):
+        super().__init__(config_dependencies=config_dependencies)
+        self._snapctl = snapctl or AsyncSnapCtl()
+
+    async def list(self) -> Dict[str, AsyncSnapService]:
+        """Return services by name."""
+        return {
+            info.name: AsyncSnapService(info, snapctl=self._snapctl)
+            for info in await self._snapctl.services()
+        }
+
+    async def start(self, *services: str, enable: bool = False) -> None:
+        """Start services, with a single call.
 
+        :param services: names of services to start. If not specified, all
+          services are started.
         :param enable: whether to also enable services at startup.
 
         """
-        self._snapctl.start(enable=enable)
+        await self._snapctl.start(*services, enable=enable)
 
-    def stop(self, disable: bool = False) -> None:
-        """Stop all services.
+    async def stop(self, *services: str, disable: bool = False) -> None:
+        """Stop services, with a single call.
 
+        :param services: names of services to stop. If not specified, all
+          services are stopped.
         :param disable: whether to also disable services at startup.
 
         """
-        self._snapctl.stop(disable=disable)
+        await self._snapctl.stop(*services, disable=disable)
 
-    def restart(self, reload: bool = False) -> None:
-        """Restart all services.
+    async def restart(self, *services: str, reload: bool = False) -> None:
+        """Restart services, with a single call.
 
+        :param services: names of services to restart. If not specified, all
+          services are restarted.
         :param reload: whether to reload services if supported.
 
         """
-        self._snapctl.restart(reload=reload)
+        await self._snapctl.restart(*services, reload=reload)
+
+    async def refresh_all(self, services: Iterable[AsyncSnapService]) -> None:
+        """Update the status of multiple services, with a single call.
+
+        :param services: the :class:`AsyncSnapService` objects to update.
+
+        """
+        services = list(services)
+        if services:
+            infos = await self._snapctl.services(
+                *(service.name for service in services)
+            )
+            self._update_services(services, infos)
+
+    async def wait_all(
+        self,
+        *services: str,
+        active: bool = True,
+        enabled: Optional[bool] = None,
+        timeout: float = 30.0,
+    ) -> bool:
+        """Wait until services reach the specified status.
+
+        See :meth:`SnapServices.wait_all`.
+
+        :param services: names of services to wait for. If not specified, all
+          services are waited for.
+        :param active: whether services should be active.
+        :param enabled: whether services should be enabled. If None, the
+          startup status is not checked.
+        :param timeout: how long to wait for, in seconds.
+        :return: whether all services reached the status.
+
+        """
+
+        async def check() -> bool:
+            infos = await self._snapctl.services(*services)
+            return _in_state(infos, active, enabled)
+
+        return await _async_wait_for(check, timeout)
+
+    async def start_ordered(
+        self,
+        graph: Dict[str, Sequence[str]],
+        enable: bool = False,
+        timeout: float = 30.0,
+    ) -> List[List[str]]:
+        """Start services in dependency order.
+
+        See :meth:`SnapServices.start_ordered`.
+
+        :param graph: a dict mapping service names to names of services they
+          depend on.
+        :param enable: whether to also enable services at startup.
+        :param timeout: how long to wait for each layer to become active, in
+          seconds.
+        :raises ValueError: if dependencies are cyclic.
+        :raises TimeoutError: if a layer doesn't become active in time.
+        :return: the started layers of service names.
+
+        """
+        layers = _dependency_layers(graph)
+        for index, layer in enumerate(layers):
+            if index:
+                previous = layers[index - 1]
+                if not await self.wait_all(*previous, timeout=timeout):
+                    raise TimeoutError(
+                        f"Services not active: {', '.join(previous)}"
+                    )
+            await self._snapctl.start(*layer, enable=enable)
+        return layers
+
+    async def watch(
+        self, interval: float = 1.0
+    ) -> AsyncIterator[ServiceChange]:
+        """Watch services for changes in their status.
+
+        See :meth:`SnapServices.watch`.
+
+        :param interval: the polling interval, in seconds.
+
+        """
+        services: Dict[str, AsyncSnapService] = {}
+        while True:
+            changes = self._service_changes(
+                services,
+                await self._snapctl.services(),
+                lambda info: AsyncSnapService(info, snapctl=self._snapctl),
+            )
+            for change in changes:
+                yield change
+            await asyncio.sleep(interval)
+
+    async def restart_affected(
+        self, diff: ConfigDiff, reload: bool = False
+    ) -> List[str]:
+        """Restart services affected by configuration changes.
+
+        See :meth:`SnapServices.restart_affected`.
+
+        :param diff: the :class:`ConfigDiff` with configuration changes.
+        :param reload: whether to reload services if supported.
+        :return: names of restarted services.
+
+        """
+        names = self.affected_services(diff)
+        if names:
+            await self._snapctl.restart(*names, reload=reload)
+        return names
+
+    async def reconcile(self, desired: Dict[str, str]) -> List[ServiceCall]:
+        """Bring services to the desired state, with minimal calls.
+
+        See :meth:`SnapServices.reconcile`.
+
+        :param desired: a dict with the desired state by service name.
+        :raises ValueError: if a state is invalid or a service is unknown.
+        :return: a list of :class:`ServiceCall` with calls that were made.
+
+        """
+        infos = await self._snapctl.services()
+        calls = self._reconcile_calls(infos, desired)
+        for call in calls:
+            method = getattr(self._snapctl, call.action)
+            await method(*call.services, **dict.fromkeys(call.options, True))
+        return calls
@@ -0,0 +1,259 @@
+import fcntl
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import (
+    Any,
+    Callable,
+    cast,
+    Dict,
+    Optional,
+    Tuple,
+)
+
+
+class SharedConfigCache:
+    """A configuration cache shared across processes.
+
+    The configuration is stored in a memory-mapped file. Reads only check a
+    generation counter in the file, and parse content again only when it
+    changes. Updates are protected by a sequence lock, so that readers never
+    see partially written content.
+
+    This allows multiple worker processes to share the configuration fetched
+    by any of them, instead of each calling :data:`snapctl`.
+
+    Content is tagged with the snap revision, and content published by a
+    different revision is ignored. Since the cache is not updated when the
+    configuration is changed outside of the snap (e.g. via ``snap set``), the
+    ``configure`` hook should publish the new configuration, e.g. by calling
+    :meth:`SnapConfig.refresh`.
+
+    :param path: the path of the file backing the cache.
+    :param revision: the snap revision.
+
+    """
+
+    # magic, format version, generation, content length
+    _HEADER = struct.Struct("=4sIQQ")
+    _GENERATION = struct.Struct("=Q")
+    _GENERATION_OFFSET = 8
+    _MAGIC = b"SHCC"
+    _VERSION = 1
+    # number of lockless attempts before reading under a shared lock
+    _READ_ATTEMPTS = 10
+
+    def __init__(self, path: Path, revision: str = ""):
+        self.path = path
+        self.revision = revision
+        self._fd: Optional[int] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._pid = 0
+        self._generation = 0
+        self._config: Optional[Dict[str, Any]] = None
+
+    def close(self) -> None:
+        """Unmap and close the backing file."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def generation(self) -> int:
+        """Return the current generation of the content.
+
+        This changes every time content is published or invalidated.
+
+        """
+        mapped = self._map()
+        generation: int = self._GENERATION.unpack_from(
+            mapped, self._GENERATION_OFFSET
+        )[0]
+        return generation
+
+    def read(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Return the generation and content of the cache.
+
+        The same object is returned as long as content doesn't change, so it
+        must not be modified.
+
+        :return: a tuple with generation and configuration, or None if the
+          cache is empty.
+
+        """
+        for _ in range(self._READ_ATTEMPTS):
+            generation = self.generation()
+            if generation % 2:
+                # an update is in progress
+                continue
+            if generation == self._generation:
+                return self._cached()
+            data = self._read_data()
+            if data is not None and generation == self.generation():
+                return self._update(generation, data)
+        with self._lock(fcntl.LOCK_SH):
+            return self._read_locked()
+
+    def publish(self, config: Dict[str, Any]) -> int:
+        """Publish new content to the cache.
+
+        :param config: the configuration to store.
+        :return: the new generation.
+
+        """
+        with self._lock(fcntl.LOCK_EX):
+            return self._write(self._encode(config))
+
+    def invalidate(self) -> None:
+        """Empty the cache, so that content is fetched again."""
+        with self._lock(fcntl.LOCK_EX):
+            self._write(b"")
+
+    def get_or_publish(
+        self, fetch: Callable[[], Dict[str, Any]]
+    ) -> Tuple[int, Dict[str, Any]]:
+        """Return content of the cache, fetching and publishing it if empty.
+
+        When the cache is empty, only one process calls ``fetch``, while
+        others wait for the content to be published.
+
+        :param fetch: a function returning the configuration.
+        :return: a tuple with generation and configuration.
+
+        """
+        result = self.read()
+        if result is not None:
+            return result
+        with self._lock(fcntl.LOCK_EX):
+            result = self._read_locked()
+            if result is not None:
+                return result
+            config = fetch()
+            generation = self._write(self._encode(config))
+            self._generation, self._config = generation, config
+            return generation, config
+
+    def _map(self) -> mmap.mmap:
+        if self._mmap is not None:
+            if self._pid == os.getpid():
+                return self._mmap
+            # flock() locks are shared by processes inheriting the file
+            # descriptor, so each process must open the file on its own
+            self.close()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < self._HEADER.size:
+                    os.write(
+                        fd,
+                        self._HEADER.pack(self._MAGIC, self._VERSION, 0, 0),
+                    )
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            mapped = mmap.mmap(fd, 0)
+        except BaseException:
+            os.close(fd)
+            raise
+        magic, version, _, _ = self._HEADER.unpack_from(mapped)
+        if (magic, version) != (self._MAGIC, self._VERSION):
+            mapped.close()
+            os.close(fd)
+            raise ValueError(f"Invalid shared config cache file: {self.path}")
+        self._fd, self._mmap, self._pid = fd, mapped, os.getpid()
+        return mapped
+
+    def _remap(self) -> mmap.mmap:
+        mapped = self._map()
+        fd = cast(int, self._fd)
+        if len(mapped) != os.fstat(fd).st_size:
+            mapped.close()
+            mapped = self._mmap = mmap.mmap(fd, 0)
+        return mapped
+
+    def _read_data(self) -> Optional[bytes]:
+        """Return content data, or None if the file needs remapping."""
+        mapped = self._map()
+        length: int = self._HEADER.unpack_from(mapped)[3]
+        end = self._HEADER.size + length
+        if end > len(mapped):
+            self._remap()
+            return None
+        return mapped[self._HEADER.size : end]
+
+    def _read_locked(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        generation = self.generation()
+        if generation == self._generation:
+            return self._cached()
+        data = self._read_data()
+        if data is None:
+            data = self._read_data()
+        return self._update(generation, data or b"")
+
+    def _write(self, data: bytes) -> int:
+        mapped = self._map()
+        fd = cast(int, self._fd)
+        end = self._HEADER.size + len(data)
+        # the file is only grown, since other processes might map it fully
+        if end > os.fstat(fd).st_size:
+            os.ftruncate(fd, end)
+        if end > len(mapped):
+            mapped = self._remap()
+        generation = self.generation()
+        if generation % 2:
+            # a previous writer died while updating
+            generation += 1
+        # an odd generation marks the update in progress
+        self._GENERATION.pack_into(
+            mapped, self._GENERATION_OFFSET, generation + 1
+        )
+        mapped[self._HEADER.size : end] = data
+        self._HEADER.pack_into(
+            mapped, 0, self._MAGIC, self._VERSION, generation + 1, len(data)
+        )
+        self._GENERATION.pack_into(
+            mapped, self._GENERATION_OFFSET, generation + 2
+        )
+        return generation + 2
+
+    def _encode(self, config: Dict[str, Any]) -> bytes:
+        content = {"revision": self.revision, "config": config}
+        return json.dumps(content).encode("utf-8")
+
+    def _update(
+        self, generation: int, data: bytes
+    ) -> Optional[Tuple[int, Dict[str, Any]]]:
+        self._generation = generation
+        self._config = None
+        if data:
+            content = json.loads(data)
+            if content.get("revision") == self.revision:
+                self._config = content["config"]
+        return self._cached()
+
+    def _cached(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        if self._config is None:
+            return None
+        return self._generation, self._config
+
+    def _lock(self, operation: int) -> "_FileLock":
+        self._map()
+        return _FileLock(cast(int, self._fd), operation)
+
+
+class _FileLock:
+    """Context manager holding a lock on a file descriptor."""
+
+    def __init__(self, fd: int, operation: int):
+        self._fd = fd
+        self._operation = operation
+
+    def __enter__(self) -> None:
+        fcntl.flock(self._fd, self._operation)
+
+    def __exit__(self, *args: Any) -> None:
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
@@ -5,13 +5,27 @@ from typing import (
     Optional,
 )
 
-from ._conf import SnapConfig
-from ._ctl import SnapCtl
+from ._conf import (
+    AsyncSnapConfig,
+    ConfigSnapshotFile,
+    SnapConfig,
+)
+from ._ctl import (
+    AsyncSnapCtl,
+    SnapCtl,
+)
 from ._env import SnapEnviron
-from ._health import SnapHealth
+from ._health import (
+    AsyncSnapHealth,
+    SnapHealth,
+)
 from ._meta import SnapMetadataFiles
 from ._path import SnapPaths
-from ._service import SnapServices
+from ._service import (
+    AsyncSnapServices,
+    SnapServices,
+)
+from ._shared import SharedConfigCache
 
 
 class EnvironProperty:
@@ -20,23 +34,17 @@ class EnvironProperty:
     def __init__(self, name: str):
         self.name = name
 
-    def __get__(self, instance: "Snap", owner: Any) -> str:
+    def __get__(self, instance: "_SnapBase", owner: Any) -> str:
         return cast(str, getattr(instance.environ, self.name))
 
 
-class Snap:
-    """Top-level wrapper for a Snap."""
+class _SnapBase:
+    """Common attributes for snap wrappers."""
 
-    #: Access to snap configuration
-    config: SnapConfig
     #: Access to snap environment variables
     environ: SnapEnviron
-    #: Access to snap health status
-    health: SnapHealth
     #: Access to snap-specific paths
     paths: SnapPaths
-    #: Access to snap services
-    services: SnapServices
     #: Access to snap metadata files
     metadata_files: SnapMetadataFiles
 
@@ -53,10 +61,6 @@ class Snap:
     def __init__(self, environ: Optional[Mapping[str, str]] = None):
         self.environ = SnapEnviron(environ=environ)
         self.paths = SnapPaths(env=self.environ)
-        snapctl = SnapCtl(env=self.environ)
-        self.config = SnapConfig(snapctl=snapctl)
-        self.health = SnapHealth(snapctl=snapctl)
-        self.services = SnapServices(snapctl=snapctl)
         self.metadata_files = SnapMetadataFiles(environ=self.environ)
 
     def __str__(self) -> str:
@@ -64,3 +68,79 @@ class Snap:
             f"{self.__class__.__name__}"
             f"({self.name} {self.version} {self.revision})"
         )
+
+
+class Snap(_SnapBase):
+    """Top-level wrapper for a Snap.
+
+    :param environ: optional mapping with environment variables.
+    :param prefetch_config: whether to fetch the whole snap configuration at
+      once and serve reads from it. See :meth:`SnapConfig.snapshot`.
+    :param shared_config: whether to share the snap configuration across
+      processes, through a :class:`SharedConfigCache` in :data:`SNAP_COMMON`.
+
+    Configuration snapshots saved with :meth:`SnapConfig.save_snapshot` are
+    stored in the :data:`SNAP_DATA` directory.
+
+    """
+
+    #: Name of the configuration snapshot file in :data:`SNAP_DATA`
+    CONFIG_SNAPSHOT_FILE = "snaphelpers-config.json"
+    #: Name of the shared configuration cache file in :data:`SNAP_COMMON`
+    SHARED_CONFIG_FILE = "snaphelpers-config.cache"
+
+    #: Access to snap configuration
+    config: SnapConfig
+    #: Access to snap health status
+    health: SnapHealth
+    #: Access to snap services
+    services: SnapServices
+
+    def __init__(
+        self,
+        environ: Optional[Mapping[str, str]] = None,
+        prefetch_config: bool = False,
+        shared_config: bool = False,
+    ):
+        super().__init__(environ=environ)
+        snapctl = SnapCtl(env=self.environ)
+        shared_cache = None
+        if shared_config:
+            shared_cache = SharedConfigCache(
+                self.paths.common / self.SHARED_CONFIG_FILE,
+                revision=self.revision,
+            )
+        self.config = SnapConfig(
+            snapctl=snapctl,
+            prefetch=prefetch_config,
+            snapshot_file=ConfigSnapshotFile(
+                self.paths.data / self.CONFIG_SNAPSHOT_FILE,
+                revision=self.revision,
+            ),
+            shared_cache=shared_cache,
+        )
+        self.health = SnapHealth(snapctl=snapctl)
+        self.services = SnapServices(snapctl=snapctl)
+
+
+class AsyncSnap(_SnapBase):
+    """Top-level wrapper for a Snap, for use with :mod:`asyncio`.
+
+    Configuration, health and services are accessed via coroutines which don't
+    block the event loop.
+
+    """
+
+    #: Access to snap configuration
+    config: AsyncSnapConfig
+    #: Access to snap health status
+    health: AsyncSnapHealth
+    #: Access to snap services
+    services: AsyncSnapServices
+
+    def __init__(self, environ: Optional[Mapping[str, str]] = None):
+        super().__init__(environ=environ)
+        snapctl = AsyncSnapCtl(env=self.environ)
+        self.config = AsyncSnapConfig(snapctl=snapctl)
+        self.health = AsyncSnapHealth(snapctl=snapctl)
+        self.services = AsyncSnapServices(snapctl=snapctl)
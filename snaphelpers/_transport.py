@@ -0,0 +1,428 @@
+from abc import (
+    ABC,
+    abstractmethod,
+)
+import codecs
+from http.client import HTTPConnection
+import json
+import os
+import selectors
+import signal
+import socket
+from subprocess import (
+    PIPE,
+    Popen,
+    TimeoutExpired,
+)
+from threading import Lock
+from time import monotonic
+from typing import (
+    Any,
+    cast,
+    Dict,
+    IO,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from ._env import SnapEnviron
+
+
+class SnapCtlError(Exception):
+    """A snapctl command failed.
+
+    :param returncode: the command return code. For backwards compatibility,
+      a :class:`subprocess.Popen` for the failed process is also accepted, in
+      which case the error is read from its stderr.
+    :param error: the error message.
+
+    """
+
+    #: The process return code
+    returncode: int
+    #: The error message
+    error: str
+
+    def __init__(self, returncode: Union[int, Popen[bytes]], error: str = ""):
+        if isinstance(returncode, Popen):
+            process = returncode
+            returncode = process.returncode
+            error = cast(IO[bytes], process.stderr).read().decode("utf-8")
+        self.returncode = returncode
+        self.error = error
+        super().__init__(
+            f"Call to snapctl failed with error {self.returncode}: "
+            + self.error
+        )
+
+
+class SnapCtlTimeout(SnapCtlError):
+    """A snapctl command didn't complete in time.
+
+    :param timeout: the timeout for the command, in seconds.
+
+    """
+
+    #: The timeout for the command, in seconds
+    timeout: float
+
+    def __init__(self, timeout: float):
+        super().__init__(-signal.SIGKILL)
+        self.timeout = timeout
+        self.args = (f"Call to snapctl timed out after {timeout:g} seconds",)
+
+
+class SnapCtlTransport(ABC):
+    """Base class for transports executing :data:`snapctl` commands."""
+
+    @abstractmethod
+    def run(self, args: Sequence[str], timeout: Optional[float] = None) -> str:
+        """Execute a command and return its output.
+
+        Transports not supporting timeouts can omit the ``timeout`` argument,
+        since it's only passed when a timeout is set.
+
+        :param args: command args.
+        :param timeout: optional timeout for the command, in seconds.
+        :raises SnapCtlError: if the command fails.
+        :raises SnapCtlTimeout: if the command doesn't complete in time.
+
+        """
+
+    def run_stream(
+        self, args: Sequence[str], timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """Execute a command and yield chunks of its output.
+
+        By default, the whole output is returned as a single chunk.
+
+        :param args: command args.
+        :param timeout: optional timeout for the command, in seconds.
+        :raises SnapCtlError: if the command fails.
+        :raises SnapCtlTimeout: if the command doesn't complete in time.
+
+        """
+        if timeout is None:
+            yield self.run(args)
+        else:
+            yield self.run(args, timeout=timeout)
+
+    def close(self) -> None:
+        """Release resources held by the transport."""
+
+
+class ExecTransport(SnapCtlTransport):
+    """Execute commands by running the :data:`snapctl` executable.
+
+    Each argument must be shorter than the system limit for a single
+    command-line argument (128 KiB on Linux), or :class:`ValueError` is
+    raised.
+
+    Output and errors are read as they're written, so commands with output
+    larger than the pipe buffer don't block.
+
+    Commands with a timeout are run in a new process group, which is killed
+    if the timeout expires.
+
+    :param executable: path to the :data:`snapctl` executable.
+    :param max_output: optional maximum size of the output and of errors, in
+      bytes. If exceeded, the process is killed and :class:`ValueError` is
+      raised.
+
+    """
+
+    _READ_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        executable: str = "/usr/bin/snapctl",
+        max_output: Optional[int] = None,
+    ):
+        self.executable = executable
+        self.max_output = max_output
+
+    def run(self, args: Sequence[str], timeout: Optional[float] = None) -> str:
+        return "".join(self.run_stream(args, timeout=timeout))
+
+    def run_stream(
+        self, args: Sequence[str], timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """Execute a command and yield chunks of its output.
+
+        Output is decoded incrementally, without holding all of it in memory.
+        If the command fails, :class:`SnapCtlError` is raised after the
+        output has been yielded.
+
+        :param args: command args.
+        :param timeout: optional timeout for the command, in seconds.
+        :raises SnapCtlError: if the command fails.
+        :raises SnapCtlTimeout: if the command doesn't complete in time.
+
+        """
+        check_args_size(args)
+        deadline = None if timeout is None else monotonic() + timeout
+        process = Popen(
+            [self.executable, *args],
+            stdout=PIPE,
+            stderr=PIPE,
+            start_new_session=timeout is not None,
+        )
+        stdout = cast(IO[bytes], process.stdout)
+        stderr = cast(IO[bytes], process.stderr)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        error = bytearray()
+        size = 0
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(stdout, selectors.EVENT_READ)
+                selector.register(stderr, selectors.EVENT_READ)
+                while selector.get_map():
+                    events = selector.select(_remaining(deadline))
+                    if not events:
+                        raise SnapCtlTimeout(cast(float, timeout))
+                    for key, _ in events:
+                        data = os.read(key.fd, self._READ_SIZE)
+                        if not data:
+                            selector.unregister(key.fileobj)
+                        elif key.fileobj is stderr:
+                            error += data
+                            self._check_output_size(len(error))
+                        else:
+                            size += len(data)
+                            self._check_output_size(size)
+                            chunk = decoder.decode(data)
+                            if chunk:
+                                yield chunk
+            try:
+                returncode = process.wait(_remaining(deadline))
+            except TimeoutExpired:
+                raise SnapCtlTimeout(cast(float, timeout))
+        finally:
+            if process.poll() is None:
+                if timeout is None:
+                    process.kill()
+                else:
+                    os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+            stdout.close()
+            stderr.close()
+        if returncode:
+            raise SnapCtlError(returncode, error.decode("utf-8"))
+        # fail on truncated characters at the end of output
+        decoder.decode(b"", final=True)
+
+    def _check_output_size(self, size: int) -> None:
+        if self.max_output is not None and size > self.max_output:
+            raise ValueError(
+                f"Output of snapctl exceeds {self.max_output} bytes"
+            )
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(deadline - monotonic(), 0.0)
+
+
+# Maximum size of a single command-line argument (MAX_ARG_STRLEN on Linux),
+# including the terminating null byte
+_MAX_ARG_SIZE = 32 * os.sysconf("SC_PAGESIZE")
+
+
+def check_args_size(args: Sequence[str]) -> None:
+    """Check that each argument fits in the command line of a process.
+
+    :raises ValueError: if an argument is too long.
+
+    """
+    for arg in args:
+        size = len(arg.encode("utf-8")) + 1
+        if size > _MAX_ARG_SIZE:
+            raise ValueError(
+                f"Argument too long for snapctl ({size} bytes, "
+                f"max {_MAX_ARG_SIZE}): {arg[:20]}..."
+            )
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    """An HTTP connection over a UNIX socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class SocketTransport(SnapCtlTransport):
+    """Execute commands by talking directly to the snapd REST API.
+
+    This sends the same requests as the :data:`snapctl` executable to the
+    ``/v2/snapctl`` endpoint, without the cost of spawning a process for each
+    command.
+
+    Connections to snapd are kept alive and reused across calls, up to
+    ``pool_size`` idle connections.
+
+    When a timeout is set for a command, it applies to each operation on the
+    socket, such as sending the request and waiting for the response.
+
+    :param socket_path: path to the snapd socket for snaps.
+    :param env: the :class:`SnapEnviron` to read the snap context from.
+    :param pool_size: maximum number of idle connections to keep open.
+    :param fallback: an optional transport to use when the socket is not
+      available.
+
+    """
+
+    def __init__(
+        self,
+        socket_path: str = "/run/snapd-snap.socket",
+        env: Optional[SnapEnviron] = None,
+        pool_size: int = 4,
+        fallback: Optional[SnapCtlTransport] = None,
+    ):
+        if env is None:
+            env = SnapEnviron()
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.fallback = fallback
+        self._context = env.get("COOKIE") or env.get("CONTEXT", "")
+        self._pool: List[_UnixHTTPConnection] = []
+        self._lock = Lock()
+
+    def run(self, args: Sequence[str], timeout: Optional[float] = None) -> str:
+        body = json.dumps(
+            {"context-id": self._context, "args": list(args)}
+        ).encode("utf-8")
+        try:
+            return self._run(args, body, timeout)
+        except socket.timeout:
+            if timeout is None:
+                raise
+            raise SnapCtlTimeout(timeout)
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for conn in pool:
+            conn.close()
+        if self.fallback is not None:
+            self.fallback.close()
+
+    def _run(
+        self, args: Sequence[str], body: bytes, timeout: Optional[float]
+    ) -> str:
+        conn = self._idle_connection()
+        if conn is not None:
+            sent = False
+            try:
+                cast(socket.socket, conn.sock).settimeout(timeout)
+                self._send(conn, body)
+                sent = True
+                return self._receive(conn)
+            except (BrokenPipeError, ConnectionResetError):
+                # snapd might have closed the idle connection. Retry on a new
+                # one, unless the request might have been processed and it's
+                # not safe to send it again.
+                if sent and not is_read_only(args):
+                    raise
+        try:
+            conn = self._new_connection(timeout)
+        except OSError:
+            if self.fallback is None:
+                raise
+            if timeout is None:
+                return self.fallback.run(args)
+            return self.fallback.run(args, timeout=timeout)
+        self._send(conn, body)
+        return self._receive(conn)
+
+    def _idle_connection(self) -> Optional[_UnixHTTPConnection]:
+        with self._lock:
+            if self._pool:
+                return self._pool.pop()
+        return None
+
+    def _new_connection(
+        self, timeout: Optional[float] = None
+    ) -> _UnixHTTPConnection:
+        conn = _UnixHTTPConnection(self.socket_path, timeout=timeout)
+        conn.connect()
+        return conn
+
+    def _release_connection(self, conn: _UnixHTTPConnection) -> None:
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def _send(self, conn: _UnixHTTPConnection, body: bytes) -> None:
+        try:
+            conn.request(
+                "POST",
+                "/v2/snapctl",
+                body=body,
+                headers={"Content-Type": "application/json"},
+            )
+        except BaseException:
+            conn.close()
+            raise
+
+    def _receive(self, conn: _UnixHTTPConnection) -> str:
+        try:
+            response = conn.getresponse()
+            data = response.read()
+        except BaseException:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._release_connection(conn)
+        return self._parse_response(json.loads(data))
+
+    def _parse_response(self, response: Dict[str, Any]) -> str:
+        result = response.get("result") or {}
+        if response.get("type") != "error":
+            return cast(str, result.get("stdout", ""))
+        if result.get("kind") == "unsuccessful":
+            value = result.get("value") or {}
+            raise SnapCtlError(
+                value.get("exit-code", 1), value.get("stderr", "")
+            )
+        # same format as errors reported by the snapctl executable
+        raise SnapCtlError(1, f"error: {result.get('message', '')}\n")
+
+
+# Commands which don't change state, and can be safely sent again, cached or
+# shared among concurrent callers
+_READ_ONLY_COMMANDS = frozenset(
+    ("get", "is-connected", "services", "system-mode")
+)
+
+
+def is_read_only(args: Sequence[str]) -> bool:
+    """Return whether a :data:`snapctl` command doesn't change state.
+
+    :param args: command args.
+
+    """
+    if not args:
+        return False
+    if args[0] == "refresh":
+        # refresh actions are not read-only
+        return tuple(args) == ("refresh", "--pending")
+    return args[0] in _READ_ONLY_COMMANDS
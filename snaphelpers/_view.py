@@ -0,0 +1,91 @@
+from copy import deepcopy
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+)
+
+
+def frozen_view(value: Any) -> Any:
+    """Return a read-only view for a value, if it's a dict or a list.
+
+    Other values are returned as they are.
+
+    """
+    if isinstance(value, dict):
+        return FrozenMapping(value)
+    if isinstance(value, list):
+        return FrozenSequence(value)
+    return value
+
+
+class FrozenMapping(Mapping[str, Any]):
+    """A read-only view on a :class:`dict`, without copying it.
+
+    Nested dicts and lists are also returned as read-only views.
+
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._data!r})"
+
+    def __getitem__(self, key: str) -> Any:
+        return frozen_view(self._data[key])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def copy(self) -> Dict[str, Any]:
+        """Return a mutable deep copy of the content as a :class:`dict`."""
+        return deepcopy(self._data)
+
+
+class FrozenSequence(Sequence[Any]):
+    """A read-only view on a :class:`list`, without copying it.
+
+    Nested dicts and lists are also returned as read-only views.
+
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: List[Any]):
+        self._data = data
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._data!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, FrozenSequence):
+            other = other._data
+        if not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            item == other_item for item, other_item in zip(self, other)
+        )
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return FrozenSequence(self._data[index])
+        return frozen_view(self._data[index])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def copy(self) -> List[Any]:
+        """Return a mutable deep copy of the content as a :class:`list`."""
+        return deepcopy(self._data)
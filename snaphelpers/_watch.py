@@ -0,0 +1,314 @@
+import asyncio
+import inspect
+import sys
+from threading import (
+    Event,
+    Thread,
+)
+from types import TracebackType
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Generic,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from ._transport import SnapCtlError
+from ._view import FrozenMapping
+
+
+class ConfigDiff(NamedTuple):
+    """Differences between two versions of the configuration.
+
+    Keys are in dotted notation. For added and removed subtrees, only the top
+    key is reported. Changed keys are those with a different value that is
+    not a nested configuration on both sides.
+
+    """
+
+    #: Keys that were added
+    added: List[str]
+    #: Keys that were removed
+    removed: List[str]
+    #: Keys whose value changed
+    changed: List[str]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    @property
+    def keys(self) -> List[str]:
+        """All keys that were added, removed or changed, sorted."""
+        return sorted(self.added + self.removed + self.changed)
+
+    def affects(self, prefix: str) -> bool:
+        """Whether the configuration for a key was affected by changes.
+
+        This is the case if the key itself, one of its subkeys or one of its
+        parents was added, removed or changed.
+
+        :param prefix: the key, possibly with dotted notation.
+
+        """
+        for key in self.keys:
+            if _is_subkey(key, prefix) or _is_subkey(prefix, key):
+                return True
+        return False
+
+
+def diff_config(old: Mapping[str, Any], new: Mapping[str, Any]) -> ConfigDiff:
+    """Return differences between two versions of the configuration.
+
+    :param old: the previous configuration.
+    :param new: the current configuration.
+
+    """
+    diff = ConfigDiff([], [], [])
+    _diff(old, new, "", diff)
+    diff.added.sort()
+    diff.removed.sort()
+    diff.changed.sort()
+    return diff
+
+
+def _diff(
+    old: Mapping[str, Any],
+    new: Mapping[str, Any],
+    prefix: str,
+    diff: ConfigDiff,
+) -> None:
+    for key, old_value in old.items():
+        full_key = prefix + key
+        if key not in new:
+            diff.removed.append(full_key)
+            continue
+        new_value = new[key]
+        if isinstance(old_value, Mapping) and isinstance(new_value, Mapping):
+            _diff(old_value, new_value, full_key + ".", diff)
+        elif type(old_value) is not type(new_value) or old_value != new_value:
+            diff.changed.append(full_key)
+    diff.added.extend(prefix + key for key in new if key not in old)
+
+
+def _is_subkey(key: str, prefix: str) -> bool:
+    return key == prefix or key.startswith(prefix + ".")
+
+
+class _ConfigOptions(Protocol):
+    def as_mapping(self) -> FrozenMapping:
+        """Return a read-only view of the configuration."""
+
+
+_Options = TypeVar("_Options", bound=_ConfigOptions)
+
+
+class _SnapConfigWatcherBase(Generic[_Options]):
+    def __init__(
+        self,
+        interval: float,
+        max_interval: float,
+        on_error: Optional[Callable[[Exception], None]],
+    ):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.on_error = on_error
+        #: The latest fetched options
+        self.options: Optional[_Options] = None
+        self._next_interval = interval
+
+    def _update(self, options: _Options) -> ConfigDiff:
+        previous, self.options = self.options, options
+        if previous is None:
+            return ConfigDiff([], [], [])
+        return diff_config(previous.as_mapping(), options.as_mapping())
+
+    def _backoff(self, diff: Optional[ConfigDiff]) -> None:
+        if diff:
+            self._next_interval = self.interval
+        else:
+            self._next_interval = min(
+                self._next_interval * 2, self.max_interval
+            )
+
+
+class SnapConfigWatcher(_SnapConfigWatcherBase[_Options]):
+    """Watch configuration for changes, calling a callback with differences.
+
+    Configuration is fetched periodically in a thread, and the callback is
+    called with a :class:`ConfigDiff` and the new options when it changes.
+
+    When configuration doesn't change, the polling interval is doubled at
+    each check, up to ``max_interval``. Failures calling :data:`snapctl` are
+    ignored until the next check. Other errors, raised by ``fetch`` or
+    ``callback``, are passed to ``on_error`` (or reported through
+    :func:`sys.excepthook` if not set), and watching continues. A change
+    whose callback failed is not reported again.
+
+    :param fetch: a function returning configuration options.
+    :param callback: the function to call with changes.
+    :param interval: the initial polling interval, in seconds.
+    :param max_interval: the maximum polling interval, in seconds.
+    :param on_error: an optional function called with errors raised while
+      watching.
+
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], _Options],
+        callback: Callable[[ConfigDiff, _Options], None],
+        interval: float = 1.0,
+        max_interval: float = 30.0,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ):
+        super().__init__(interval, max_interval, on_error)
+        self._fetch = fetch
+        self._callback = callback
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+    def __enter__(self) -> "SnapConfigWatcher[_Options]":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Fetch the current configuration and start watching for changes."""
+        self.poll()
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching for changes."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll(self) -> ConfigDiff:
+        """Fetch configuration, calling the callback if it changed.
+
+        :return: the :class:`ConfigDiff` with changes.
+
+        """
+        options = self._fetch()
+        diff = self._update(options)
+        if diff:
+            self._callback(diff, options)
+        return diff
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._next_interval):
+            diff = None
+            try:
+                diff = self.poll()
+            except SnapCtlError:
+                pass
+            except Exception as error:
+                if self.on_error is None:
+                    sys.excepthook(type(error), error, error.__traceback__)
+                else:
+                    self.on_error(error)
+            self._backoff(diff)
+
+
+class AsyncSnapConfigWatcher(_SnapConfigWatcherBase[_Options]):
+    """Asynchronous version of :class:`SnapConfigWatcher`.
+
+    Configuration is fetched periodically in a task. The callback can also be
+    a coroutine function. If ``on_error`` is not set, errors are reported
+    through the event loop exception handler.
+
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[_Options]],
+        callback: Callable[
+            [ConfigDiff, _Options], Union[None, Awaitable[None]]
+        ],
+        interval: float = 1.0,
+        max_interval: float = 30.0,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ):
+        super().__init__(interval, max_interval, on_error)
+        self._fetch = fetch
+        self._callback = callback
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def __aenter__(self) -> "AsyncSnapConfigWatcher[_Options]":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        """Fetch the current configuration and start watching for changes."""
+        await self.poll()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Stop watching for changes."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def poll(self) -> ConfigDiff:
+        """Fetch configuration, calling the callback if it changed.
+
+        :return: the :class:`ConfigDiff` with changes.
+
+        """
+        options = await self._fetch()
+        diff = self._update(options)
+        if diff:
+            result = self._callback(diff, options)
+            if inspect.isawaitable(result):
+                await result
+        return diff
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._next_interval)
+            diff = None
+            try:
+                diff = await self.poll()
+            except SnapCtlError:
+                pass
+            except Exception as error:
+                if self.on_error is None:
+                    asyncio.get_running_loop().call_exception_handler(
+                        {
+                            "message": "Error watching configuration",
+                            "exception": error,
+                            "task": self._task,
+                        }
+                    )
+                else:
+                    self.on_error(error)
+            self._backoff(diff)
@@ -0,0 +1,189 @@
+from threading import (
+    Event,
+    Thread,
+)
+
+import pytest
+
+from snaphelpers._breaker import (
+    CircuitBreaker,
+    CircuitState,
+    is_transport_failure,
+    SnapCtlCircuitOpen,
+)
+from snaphelpers._transport import (
+    SnapCtlError,
+    SnapCtlTimeout,
+)
+
+
+@pytest.fixture
+def clock(mocker):
+    clock = mocker.patch("snaphelpers._breaker.monotonic")
+    clock.return_value = 100.0
+    yield clock
+
+
+@pytest.fixture
+def changes():
+    yield []
+
+
+@pytest.fixture
+def breaker(clock, changes):
+    yield CircuitBreaker(
+        failure_threshold=2,
+        cooldown=10,
+        on_state_change=lambda old, new: changes.append((old, new)),
+    )
+
+
+def fail(args):
+    raise ConnectionRefusedError()
+
+
+def succeed(args):
+    return "output"
+
+
+class TestIsTransportFailure:
+    @pytest.mark.parametrize(
+        "error,failure",
+        [
+            (ConnectionRefusedError(), True),
+            (FileNotFoundError(), True),
+            (SnapCtlTimeout(1), True),
+            (SnapCtlCircuitOpen(1), True),
+            (
+                SnapCtlError(
+                    1, "error: cannot communicate with server: timeout"
+                ),
+                True,
+            ),
+            (SnapCtlError(1, "error: unknown service"), False),
+            (ValueError(), False),
+        ],
+    )
+    def test_is_transport_failure(self, error, failure):
+        assert is_transport_failure(error) == failure
+
+
+class TestSnapCtlCircuitOpen:
+    def test_message(self):
+        error = SnapCtlCircuitOpen(2.5)
+        assert error.retry_after == 2.5
+        assert str(error) == (
+            "Calls to snapctl suspended after repeated failures, retrying "
+            "in 2.5 seconds"
+        )
+
+
+class TestCircuitBreaker:
+    def test_closed(self, breaker, changes):
+        assert breaker.call(["get", "foo"], succeed) == "output"
+        assert breaker.state == CircuitState.CLOSED
+        assert changes == []
+
+    def test_open_after_failures(self, breaker, changes):
+        for _ in range(2):
+            with pytest.raises(ConnectionRefusedError):
+                breaker.call(["get", "foo"], fail)
+        assert breaker.state == CircuitState.OPEN
+        assert changes == [(CircuitState.CLOSED, CircuitState.OPEN)]
+
+    def test_failures_reset_on_success(self, breaker):
+        with pytest.raises(ConnectionRefusedError):
+            breaker.call(["get", "foo"], fail)
+        breaker.call(["get", "foo"], succeed)
+        with pytest.raises(ConnectionRefusedError):
+            breaker.call(["get", "foo"], fail)
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_command_errors_not_counted(self, breaker):
+        def run(args):
+            raise SnapCtlError(1, "error: unknown service")
+
+        for _ in range(3):
+            with pytest.raises(SnapCtlError):
+                breaker.call(["start", "foo"], run)
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_other_errors_ignored(self, breaker):
+        def run(args):
+            raise ValueError()
+
+        with pytest.raises(ConnectionRefusedError):
+            breaker.call(["get", "foo"], fail)
+        with pytest.raises(ValueError):
+            breaker.call(["get", "foo"], run)
+        with pytest.raises(ConnectionRefusedError):
+            breaker.call(["get", "foo"], fail)
+        assert breaker.state == CircuitState.OPEN
+
+    def test_fail_fast_when_open(self, clock, breaker, mocker):
+        for _ in range(2):
+            with pytest.raises(ConnectionRefusedError):
+                breaker.call(["get", "foo"], fail)
+        clock.return_value += 4
+        run = mocker.Mock()
+        with pytest.raises(SnapCtlCircuitOpen) as e:
+            breaker.call(["get", "foo"], run)
+        assert e.value.retry_after == 6
+        run.assert_not_called()
+
+    def test_probe_success(self, clock, breaker, changes):
+        for _ in range(2):
+            with pytest.raises(ConnectionRefusedError):
+                breaker.call(["get", "foo"], fail)
+        clock.return_value += 10
+        assert breaker.call(["get", "foo"], succeed) == "output"
+        assert breaker.state == CircuitState.CLOSED
+        assert changes == [
+            (CircuitState.CLOSED, CircuitState.OPEN),
+            (CircuitState.OPEN, CircuitState.HALF_OPEN),
+            (CircuitState.HALF_OPEN, CircuitState.CLOSED),
+        ]
+
+    def test_probe_failure(self, clock, breaker, changes):
+        for _ in range(2):
+            with pytest.raises(ConnectionRefusedError):
+                breaker.call(["get", "foo"], fail)
+        clock.return_value += 10
+        with pytest.raises(ConnectionRefusedError):
+            breaker.call(["get", "foo"], fail)
+        assert breaker.state == CircuitState.OPEN
+        # a new cooldown period starts
+        clock.return_value += 5
+        with pytest.raises(SnapCtlCircuitOpen) as e:
+            breaker.call(["get", "foo"], succeed)
+        assert e.value.retry_after == 5
+        assert changes[-1] == (CircuitState.HALF_OPEN, CircuitState.OPEN)
+
+    def test_single_probe(self, clock, breaker):
+        for _ in range(2):
+            with pytest.raises(ConnectionRefusedError):
+                breaker.call(["get", "foo"], fail)
+        clock.return_value += 10
+        probing = Event()
+        done = Event()
+
+        def probe(args):
+            probing.set()
+            done.wait(timeout=5)
+            return "output"
+
+        thread = Thread(target=breaker.call, args=(["get", "foo"], probe))
+        thread.start()
+        assert probing.wait(timeout=5)
+        with pytest.raises(SnapCtlCircuitOpen) as e:
+            breaker.call(["get", "foo"], succeed)
+        assert e.value.retry_after == 0
+        done.set()
+        thread.join()
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_no_callback(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1)
+        with pytest.raises(ConnectionRefusedError):
+            breaker.call(["get", "foo"], fail)
+        assert breaker.state == CircuitState.OPEN
@@ -0,0 +1,259 @@
+import pytest
+
+from snaphelpers._cache import SnapCtlCache
+from snaphelpers._ctl import SnapCtl
+from snaphelpers._transport import (
+    SnapCtlError,
+    SnapCtlTimeout,
+    SnapCtlTransport,
+)
+
+
+class CountingTransport(SnapCtlTransport):
+    """A transport recording calls and returning a fixed output."""
+
+    def __init__(self, output="output", error=None):
+        self.output = output
+        self.error = error
+        self.calls = []
+
+    def run(self, args):
+        self.calls.append(list(args))
+        if self.error:
+            raise self.error
+        return self.output
+
+
+@pytest.fixture
+def clock(mocker):
+    clock = mocker.patch("snaphelpers._cache.monotonic")
+    clock.return_value = 100.0
+    yield clock
+
+
+@pytest.fixture
+def transport():
+    yield CountingTransport()
+
+
+@pytest.fixture
+def cache(clock):
+    yield SnapCtlCache()
+
+
+class TestSnapCtlCache:
+    def test_cached(self, cache, transport):
+        assert cache.call(["get", "-d", "foo"], transport.run) == "output"
+        assert cache.call(["get", "-d", "foo"], transport.run) == "output"
+        assert transport.calls == [["get", "-d", "foo"]]
+        assert cache.hits == 1
+        assert cache.misses == 1
+        assert len(cache) == 1
+
+    def test_different_args(self, cache, transport):
+        cache.call(["get", "-d", "foo"], transport.run)
+        cache.call(["get", "-d", "bar"], transport.run)
+        assert transport.calls == [["get", "-d", "foo"], ["get", "-d", "bar"]]
+
+    def test_expired(self, clock, cache, transport):
+        cache.call(["services", "mysnap"], transport.run)
+        clock.return_value += 0.5
+        cache.call(["services", "mysnap"], transport.run)
+        clock.return_value += 0.5
+        cache.call(["services", "mysnap"], transport.run)
+        assert len(transport.calls) == 2
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+    def test_custom_ttls(self, clock, transport):
+        cache = SnapCtlCache(ttls={"services": 10, "get": 0})
+        assert cache.ttls["is-connected"] == 5.0
+        cache.call(["services", "mysnap"], transport.run)
+        clock.return_value += 5
+        cache.call(["services", "mysnap"], transport.run)
+        cache.call(["get", "-d", "foo"], transport.run)
+        cache.call(["get", "-d", "foo"], transport.run)
+        assert transport.calls == [
+            ["services", "mysnap"],
+            ["get", "-d", "foo"],
+            ["get", "-d", "foo"],
+        ]
+
+    @pytest.mark.parametrize(
+        "args",
+        [
+            [],
+            ["set", "foo=1"],
+            ["set-health", "okay"],
+            ["refresh", "--pending", "--proceed"],
+        ],
+    )
+    def test_not_cached(self, cache, transport, args):
+        cache.call(args, transport.run)
+        cache.call(args, transport.run)
+        assert len(transport.calls) == 2
+        assert len(cache) == 0
+
+    def test_refresh_pending_cached(self, cache, transport):
+        cache.call(["refresh", "--pending"], transport.run)
+        cache.call(["refresh", "--pending"], transport.run)
+        assert len(transport.calls) == 1
+
+    def test_error_cached(self, cache):
+        transport = CountingTransport(error=SnapCtlError(1, "not connected"))
+        for _ in range(2):
+            with pytest.raises(SnapCtlError):
+                cache.call(["is-connected", "myplug"], transport.run)
+        assert len(transport.calls) == 1
+
+    def test_timeout_not_cached(self, cache):
+        transport = CountingTransport(error=SnapCtlTimeout(1))
+        for _ in range(2):
+            with pytest.raises(SnapCtlTimeout):
+                cache.call(["get", "foo"], transport.run)
+        assert len(transport.calls) == 2
+        assert len(cache) == 0
+
+    def test_last_known(self, clock, cache, transport):
+        assert cache.last_known(["get", "foo"]) is None
+        cache.call(["get", "foo"], transport.run)
+        clock.return_value += 60
+        assert cache.last_known(["get", "foo"]) == "output"
+
+    def test_last_known_error(self, cache):
+        transport = CountingTransport(error=SnapCtlError(1, "not connected"))
+        with pytest.raises(SnapCtlError):
+            cache.call(["is-connected", "myplug"], transport.run)
+        assert cache.last_known(["is-connected", "myplug"]) is None
+
+    def test_eviction(self, clock, transport):
+        cache = SnapCtlCache(max_size=2)
+        cache.call(["get", "-d", "foo"], transport.run)
+        cache.call(["get", "-d", "bar"], transport.run)
+        # foo is now most recently used
+        cache.call(["get", "-d", "foo"], transport.run)
+        cache.call(["get", "-d", "baz"], transport.run)
+        assert len(cache) == 2
+        assert cache.evictions == 1
+        cache.call(["get", "-d", "foo"], transport.run)
+        cache.call(["get", "-d", "bar"], transport.run)
+        assert transport.calls == [
+            ["get", "-d", "foo"],
+            ["get", "-d", "bar"],
+            ["get", "-d", "baz"],
+            ["get", "-d", "bar"],
+        ]
+
+    @pytest.mark.parametrize(
+        "args,invalidated",
+        [
+            (["set", "foo=1"], "get"),
+            (["unset", "foo"], "get"),
+            (["start", "mysnap"], "services"),
+            (["stop", "mysnap"], "services"),
+            (["restart", "mysnap"], "services"),
+            (["refresh", "--pending", "--hold"], "refresh"),
+        ],
+    )
+    def test_invalidate_on_change(self, cache, transport, args, invalidated):
+        commands = {
+            "get": ["get", "-d", "foo"],
+            "services": ["services", "mysnap"],
+            "refresh": ["refresh", "--pending"],
+        }
+        for command in commands.values():
+            cache.call(command, transport.run)
+        cache.call(args, transport.run)
+        assert len(cache) == 2
+        for command in commands.values():
+            cache.call(command, transport.run)
+        assert transport.calls[-1] == commands[invalidated]
+
+    @pytest.mark.parametrize(
+        "error", [SnapCtlError(1, "error: failed\n"), SnapCtlTimeout(1)]
+    )
+    def test_invalidate_on_failed_change(self, cache, transport, error):
+        cache.call(["get", "-d", "foo"], transport.run)
+        with pytest.raises(type(error)):
+            cache.call(["set", "foo=1"], CountingTransport(error=error).run)
+        assert len(cache) == 0
+
+    @pytest.mark.parametrize("commands", [("get",), ()])
+    def test_invalidated_while_running(self, cache, commands):
+        def run(args):
+            # a change is made while the command is running
+            cache.invalidate(*commands)
+            return "old"
+
+        assert cache.call(["get", "-d", "foo"], run) == "old"
+        assert len(cache) == 0
+        assert cache.call(["get", "-d", "foo"], lambda args: "new") == "new"
+        assert cache.call(["get", "-d", "foo"], lambda args: "newer") == "new"
+
+    def test_invalidated_other_while_running(self, cache):
+        def run(args):
+            cache.invalidate("services")
+            return "output"
+
+        cache.call(["get", "-d", "foo"], run)
+        assert len(cache) == 1
+
+    def test_invalidate_all(self, cache, transport):
+        cache.call(["get", "-d", "foo"], transport.run)
+        cache.call(["services", "mysnap"], transport.run)
+        cache.invalidate()
+        assert len(cache) == 0
+
+
+@pytest.mark.usefixtures("snap_apply_env", "clock")
+class TestSnapCtlWithCache:
+    def test_config_get(self):
+        transport = CountingTransport(output='{"foo": {"bar": 1}}')
+        snapctl = SnapCtl(transport=transport, cache=SnapCtlCache())
+        config = snapctl.config_get("foo")
+        # returned values can be changed without affecting the cache
+        config["foo"]["bar"] = 2
+        assert snapctl.config_get("foo") == {"foo": {"bar": 1}}
+        snapctl.config_set({"foo.bar": 3})
+        snapctl.config_get("foo")
+        assert transport.calls == [
+            ["get", "-d", "foo"],
+            ["set", "foo.bar=3"],
+            ["get", "-d", "foo"],
+        ]
+        assert snapctl.cache.hits == 1
+
+    def test_is_connected(self):
+        transport = CountingTransport(error=SnapCtlError(1, ""))
+        snapctl = SnapCtl(transport=transport, cache=SnapCtlCache())
+        assert not snapctl.is_connected("myplug")
+        assert not snapctl.is_connected("myplug")
+        assert transport.calls == [["is-connected", "myplug"]]
+
+    def test_run_stream(self):
+        transport = CountingTransport()
+        snapctl = SnapCtl(transport=transport, cache=SnapCtlCache())
+        snapctl.run("get", "-d", "foo")
+        assert list(snapctl.run_stream("get", "-d", "foo")) == ["output"]
+        snapctl.run("get", "-d", "foo")
+        # streamed output is not cached
+        assert len(transport.calls) == 2
+
+    def test_run_stream_invalidate(self):
+        transport = CountingTransport()
+        snapctl = SnapCtl(transport=transport, cache=SnapCtlCache())
+        snapctl.run("get", "-d", "foo")
+        list(snapctl.run_stream("set", "foo=1"))
+        snapctl.run("get", "-d", "foo")
+        assert len(transport.calls) == 3
+
+    def test_run_stream_invalidate_on_error(self, mocker):
+        transport = CountingTransport()
+        mocker.patch.object(
+            transport, "run_stream", side_effect=SnapCtlTimeout(1)
+        )
+        snapctl = SnapCtl(transport=transport, cache=SnapCtlCache())
+        snapctl.run("get", "-d", "foo")
+        with pytest.raises(SnapCtlTimeout):
+            list(snapctl.run_stream("set", "foo=1"))
+        assert len(snapctl.cache) == 0
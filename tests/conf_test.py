@@ -1,11 +1,24 @@
+import asyncio
+import json
+from unittest.mock import call
+
 import pytest
 
 from snaphelpers._conf import (
+    AsyncSnapConfig,
+    AsyncSnapConfigOptions,
+    ConfigSnapshotFile,
+    ConfigSnapshotListener,
     InvalidKey,
     SnapConfig,
+    SnapConfigAccessor,
     SnapConfigOptions,
+    SnapConfigTransaction,
     UnknownConfigKey,
 )
+from snaphelpers._shared import SharedConfigCache
+from snaphelpers._view import FrozenMapping
+from snaphelpers._watch import ConfigDiff
 
 
 class TestSnapConfigOptions:
@@ -26,6 +39,22 @@ class TestSnapConfigOptions:
         options = SnapConfigOptions(["foo", "baz"], snapctl=fake_snapctl)
         options.as_dict() == {}
 
+    def test_as_mapping(self, fake_snapctl):
+        options = SnapConfigOptions(["foo", "baz"], snapctl=fake_snapctl)
+        options.fetch()
+        mapping = options.as_mapping()
+        assert isinstance(mapping, FrozenMapping)
+        assert mapping == {
+            "foo": 123,
+            "baz": {"aaa": "nested", "bbb": {"ccc": "more nested"}},
+        }
+        assert mapping["baz"]["bbb"] == {"ccc": "more nested"}
+        assert mapping["baz"]._data is options._config["baz"]
+
+    def test_as_mapping_not_fetched(self, fake_snapctl):
+        options = SnapConfigOptions(["foo", "baz"], snapctl=fake_snapctl)
+        assert options.as_mapping() == {}
+
     @pytest.mark.parametrize(
         "key,value",
         [
@@ -94,6 +123,171 @@ class TestSnapConfigOptions:
         options.fetch()
         assert options.get("something.else", "this") == "this"
 
+    def test_getitem_list_item_not_key(self, fake_snapctl):
+        options = SnapConfigOptions(["blah"], snapctl=fake_snapctl)
+        options.fetch()
+        assert "blah.0" not in options
+
+    def test_accessor(self, fake_snapctl):
+        options = SnapConfigOptions(["foo", "baz"], snapctl=fake_snapctl)
+        options.fetch()
+        accessor = options.accessor("baz.bbb.ccc")
+        assert isinstance(accessor, SnapConfigAccessor)
+        assert accessor.key == "baz.bbb.ccc"
+        assert accessor() == "more nested"
+        assert accessor.get() == "more nested"
+
+    def test_accessor_follows_fetch(self, fake_snapctl):
+        options = SnapConfigOptions(["foo", "baz"], snapctl=fake_snapctl)
+        accessor = options.accessor("baz.bbb.ccc")
+        assert accessor.get("default") == "default"
+        options.fetch()
+        assert accessor() == "more nested"
+        fake_snapctl.config_unset("baz.bbb")
+        options.fetch()
+        with pytest.raises(UnknownConfigKey) as e:
+            accessor()
+        assert e.value.key == "baz.bbb.ccc"
+
+
+@pytest.fixture
+def snapshot_file(tmp_path):
+    yield ConfigSnapshotFile(tmp_path / "config.json", revision="123")
+
+
+class TestConfigSnapshotFile:
+    @pytest.mark.parametrize("use_mmap", [True, False])
+    def test_write_read(self, snapshot_file, snap_config, use_mmap):
+        snapshot_file.write(snap_config)
+        assert snapshot_file.read(use_mmap=use_mmap) == snap_config
+
+    def test_write_atomic(self, tmp_path, snapshot_file, snap_config):
+        snapshot_file.write({"foo": 1})
+        snapshot_file.write(snap_config)
+        assert [path.name for path in tmp_path.iterdir()] == ["config.json"]
+
+    def test_write_failure(self, mocker, tmp_path, snapshot_file):
+        snapshot_file.write({"foo": 1})
+        mocker.patch("os.fsync", side_effect=OSError("disk full"))
+        with pytest.raises(OSError):
+            snapshot_file.write({"foo": 2})
+        assert [path.name for path in tmp_path.iterdir()] == ["config.json"]
+        assert snapshot_file.read() == {"foo": 1}
+
+    def test_remove(self, snapshot_file, snap_config):
+        snapshot_file.write(snap_config)
+        snapshot_file.remove()
+        assert not snapshot_file.path.exists()
+        # no error if the file is missing
+        snapshot_file.remove()
+
+    def test_mark_stale(self, snapshot_file, snap_config):
+        snapshot_file.write(snap_config)
+        snapshot_file.mark_stale()
+        assert snapshot_file.read() is None
+        assert snapshot_file.read(include_stale=True) == snap_config
+        # marking again leaves the file unchanged
+        mtime = snapshot_file.path.stat().st_mtime_ns
+        snapshot_file.mark_stale()
+        assert snapshot_file.path.stat().st_mtime_ns == mtime
+
+    def test_mark_stale_missing(self, snapshot_file):
+        snapshot_file.mark_stale()
+        assert not snapshot_file.path.exists()
+
+    def test_read_missing(self, snapshot_file):
+        assert snapshot_file.read() is None
+
+    @pytest.mark.parametrize("use_mmap", [True, False])
+    def test_read_empty(self, snapshot_file, use_mmap):
+        snapshot_file.path.write_text("")
+        assert snapshot_file.read(use_mmap=use_mmap) is None
+
+    def test_read_other_revision(self, tmp_path, snapshot_file, snap_config):
+        snapshot_file.write(snap_config)
+        other = ConfigSnapshotFile(snapshot_file.path, revision="124")
+        assert other.read() is None
+
+    @pytest.mark.parametrize(
+        "change",
+        [
+            {"version": 0},
+            {"hash": "invalid"},
+            {"config": {"foo": "changed"}},
+            {"config": []},
+        ],
+    )
+    def test_read_invalid(self, snapshot_file, snap_config, change):
+        snapshot_file.write(snap_config)
+        content = json.loads(snapshot_file.path.read_text())
+        content.update(change)
+        snapshot_file.path.write_text(json.dumps(content))
+        assert snapshot_file.read() is None
+
+    def test_read_not_object(self, snapshot_file):
+        snapshot_file.path.write_text("[]")
+        assert snapshot_file.read() is None
+
+
+@pytest.fixture(params=[True, False], ids=["inotify", "polling"])
+def listener(request, mocker, snapctl, snapshot_file):
+    if not request.param:
+        mocker.patch("snaphelpers._conf.Inotify", side_effect=OSError)
+    listener = ConfigSnapshotListener(
+        snapshot_file, snapctl=snapctl, poll_interval=0.01
+    )
+    yield listener
+    listener.close()
+
+
+class TestConfigSnapshotListener:
+    def test_wait(self, snapctl, snapshot_file, snap_config, listener):
+        snapshot_file.write(snap_config)
+        options = listener.wait(timeout=5)
+        assert options.as_dict() == snap_config
+        assert options._snapctl is snapctl
+
+    def test_wait_timeout(self, listener):
+        assert listener.wait(timeout=0.05) is None
+
+    def test_wait_unchanged(self, snapshot_file, snap_config, listener):
+        snapshot_file.write(snap_config)
+        assert listener.wait(timeout=5) is not None
+        # same content published again
+        snapshot_file.write(snap_config)
+        assert listener.wait(timeout=0.05) is None
+
+    def test_wait_ignore_removed(self, snapshot_file, snap_config, listener):
+        snapshot_file.write(snap_config)
+        assert listener.wait(timeout=5) is not None
+        snapshot_file.remove()
+        assert listener.wait(timeout=0.05) is None
+
+    def test_wait_ignore_stale(self, snapshot_file, snap_config, listener):
+        snapshot_file.write(snap_config)
+        assert listener.wait(timeout=5) is not None
+        snapshot_file.mark_stale()
+        assert listener.wait(timeout=0.05) is None
+
+    def test_initial_snapshot_ignored(
+        self, snapctl, snapshot_file, snap_config
+    ):
+        snapshot_file.write(snap_config)
+        with ConfigSnapshotListener(
+            snapshot_file, snapctl=snapctl
+        ) as listener:
+            assert listener.wait(timeout=0.05) is None
+            snapshot_file.write({"foo": "bar"})
+            assert listener.wait(timeout=5).as_dict() == {"foo": "bar"}
+
+    def test_iter(self, snapshot_file, listener):
+        snapshot_file.write({"foo": "bar"})
+        assert next(iter(listener)).as_dict() == {"foo": "bar"}
+
+    def test_wait_no_timeout(self, snapshot_file, listener):
+        snapshot_file.write({"foo": "bar"})
+        assert listener.wait().as_dict() == {"foo": "bar"}
+
 
 class TestSnapConfig:
     @pytest.mark.parametrize(
@@ -153,3 +347,469 @@ class TestSnapConfig:
         assert "three" not in fake_snapctl._configs["two"].keys()
         assert "two" in fake_snapctl._configs.keys()
         config.unset(["nonexistant"])
+
+    def test_apply(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        mock_set = mocker.spy(fake_snapctl, "config_set")
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        changed = config.apply(
+            {
+                "foo": 123,
+                "baz.aaa": "nested",
+                "baz.bbb": {"ccc": "changed"},
+                "blah": [1, 2, 3],
+                "new.key": "value",
+            }
+        )
+        assert changed == {"baz.bbb": {"ccc": "changed"}, "new.key": "value"}
+        mock_get.assert_called_once_with("foo", "baz", "blah", "new")
+        mock_set.assert_called_once_with(changed)
+        assert config.get("baz.bbb.ccc") == "changed"
+
+    def test_apply_json_comparison(self, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        config.set({"flag": 1})
+        assert config.apply({"flag": True}) == {"flag": True}
+        # key order in objects doesn't matter
+        assert (
+            config.apply(
+                {
+                    "flag": True,
+                    "baz": {"bbb": {"ccc": "more nested"}, "aaa": "nested"},
+                }
+            )
+            == {}
+        )
+
+    def test_apply_no_changes(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        mock_set = mocker.spy(fake_snapctl, "config_set")
+        assert config.apply({"foo": 123, "baz.bbb.ccc": "more nested"}) == {}
+        mock_set.assert_not_called()
+
+    def test_apply_empty(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        assert config.apply({}) == {}
+        mock_get.assert_not_called()
+
+    def test_apply_snapshot(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        snapshot = config.get_options("foo", "bar")
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        assert config.apply({"foo": 123, "bar": "new"}, snapshot=snapshot) == {
+            "bar": "new"
+        }
+        mock_get.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "key,contained",
+        [("foo", True), ("baz.bbb.ccc", True), ("baz.nope", False)],
+    )
+    @pytest.mark.parametrize("prefetch", [True, False])
+    def test_in(self, fake_snapctl, key, contained, prefetch):
+        config = SnapConfig(snapctl=fake_snapctl, prefetch=prefetch)
+        assert (key in config) == contained
+
+    @pytest.mark.parametrize("shared", [False, True])
+    def test_in_snapshot_not_copied(
+        self, mocker, tmp_path, fake_snapctl, shared
+    ):
+        shared_cache = None
+        if shared:
+            shared_cache = SharedConfigCache(tmp_path / "config.cache")
+        config = SnapConfig(
+            snapctl=fake_snapctl, prefetch=True, shared_cache=shared_cache
+        )
+        mock_deepcopy = mocker.patch("snaphelpers._conf.deepcopy")
+        assert "baz.bbb" in config
+        assert "baz.nope" not in config
+        mock_deepcopy.assert_not_called()
+
+    def test_snapshot(self, mocker, snap_config, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        snapshot = config.snapshot()
+        assert snapshot.as_dict() == snap_config
+        assert config.get("baz.bbb.ccc") == "more nested"
+        assert config.get("foo") == 123
+        assert "blah" in config
+        assert "nope" not in config
+        options = config.get_options("foo", "baz", "nope")
+        assert options.as_dict() == {
+            "foo": 123,
+            "baz": {"aaa": "nested", "bbb": {"ccc": "more nested"}},
+        }
+        assert options["baz.aaa"] == "nested"
+        assert config.apply({"foo": 123}) == {}
+        mock_get.assert_called_once_with()
+
+    @pytest.mark.parametrize("shared", [False, True])
+    def test_snapshot_values_copied(self, tmp_path, fake_snapctl, shared):
+        shared_cache = None
+        if shared:
+            shared_cache = SharedConfigCache(tmp_path / "config.cache")
+        config = SnapConfig(
+            snapctl=fake_snapctl, prefetch=True, shared_cache=shared_cache
+        )
+        config.get("baz")["aaa"] = "changed"
+        config.get_options("baz")["baz"]["bbb"]["ccc"] = "changed"
+        assert config.get("baz") == {
+            "aaa": "nested",
+            "bbb": {"ccc": "more nested"},
+        }
+
+    def test_prefetch(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl, prefetch=True)
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        assert config.get("foo") == 123
+        assert config.get("bar") == "BAR"
+        mock_get.assert_called_once_with()
+
+    def test_snapshot_refresh(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        config.snapshot()
+        fake_snapctl.config_set({"foo": 456})
+        assert config.get("foo") == 123
+        config.refresh()
+        assert config.get("foo") == 456
+
+    def test_refresh_no_snapshot(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        config.refresh()
+        mock_get.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "change",
+        [
+            lambda config: config.set({"foo": 456}),
+            lambda config: config.unset(["foo"]),
+            lambda config: config.apply({"foo": 456}),
+        ],
+    )
+    def test_snapshot_discarded_on_change(self, mocker, fake_snapctl, change):
+        config = SnapConfig(snapctl=fake_snapctl)
+        config.snapshot()
+        change(config)
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        assert config.get("bar") == "BAR"
+        assert config.snapshot().as_dict() == fake_snapctl._configs
+        assert mock_get.mock_calls == [mocker.call(), mocker.call()]
+
+    def test_snapshot_discarded_on_transaction(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        config.snapshot()
+        with config.transaction():
+            pass
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        config.get("foo")
+        mock_get.assert_not_called()
+        with config.transaction() as tx:
+            tx.set({"foo": 456})
+        assert config.get("foo") == 456
+        mock_get.assert_called_once_with()
+
+    def test_save_load_snapshot(
+        self, mocker, snap_config, fake_snapctl, snapshot_file
+    ):
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        assert config.save_snapshot().added == sorted(snap_config)
+        assert snapshot_file.read() == snap_config
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        assert config.load_snapshot()
+        assert config.get("baz.bbb.ccc") == "more nested"
+        mock_get.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "change",
+        [
+            lambda config: config.set({"foo": 456}),
+            lambda config: config.unset(["foo"]),
+            lambda config: config.apply({"foo": 456}),
+        ],
+    )
+    def test_snapshot_file_stale_on_change(
+        self, fake_snapctl, snapshot_file, change
+    ):
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        config.save_snapshot()
+        saved = snapshot_file.read()
+        change(config)
+        assert snapshot_file.read() is None
+        assert snapshot_file.read(include_stale=True) == saved
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        assert not config.load_snapshot()
+        assert config.snapshot().as_dict() == fake_snapctl._configs
+
+    def test_save_snapshot_diff(self, fake_snapctl, snapshot_file):
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        config.save_snapshot()
+        fake_snapctl._configs["baz"]["aaa"] = "changed"
+        fake_snapctl._configs["new"] = 1
+        assert config.save_snapshot() == ConfigDiff(["new"], [], ["baz.aaa"])
+
+    def test_save_snapshot_diff_after_change(
+        self, fake_snapctl, snapshot_file
+    ):
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        config.save_snapshot()
+        config.set({"baz.aaa": "changed"})
+        assert config.save_snapshot() == ConfigDiff([], [], ["baz.aaa"])
+
+    def test_load_snapshot_fallback(self, mocker, fake_snapctl, snapshot_file):
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        assert not config.load_snapshot()
+        assert config.get("foo") == 123
+        mock_get.assert_called_once_with()
+
+    def test_listen(self, fake_snapctl, snapshot_file):
+        config = SnapConfig(snapctl=fake_snapctl, snapshot_file=snapshot_file)
+        with config.listen(poll_interval=0.1) as listener:
+            assert listener.snapshot_file is snapshot_file
+            assert listener.poll_interval == 0.1
+            fake_snapctl.config_set({"foo": 456})
+            config.save_snapshot()
+            assert listener.wait(timeout=5)["foo"] == 456
+
+    @pytest.mark.parametrize(
+        "method", ["save_snapshot", "load_snapshot", "listen"]
+    )
+    def test_snapshot_no_file(self, fake_snapctl, method):
+        config = SnapConfig(snapctl=fake_snapctl)
+        with pytest.raises(ValueError) as e:
+            getattr(config, method)()
+        assert str(e.value) == "No configuration snapshot file set"
+
+    def test_shared_cache(self, mocker, tmp_path, snap_config, fake_snapctl):
+        shared_cache = SharedConfigCache(tmp_path / "config.cache")
+        config = SnapConfig(snapctl=fake_snapctl, shared_cache=shared_cache)
+        other_config = SnapConfig(
+            snapctl=fake_snapctl,
+            shared_cache=SharedConfigCache(tmp_path / "config.cache"),
+        )
+        mock_get = mocker.spy(fake_snapctl, "config_get")
+        assert config.get("baz.bbb.ccc") == "more nested"
+        assert other_config.get("foo") == 123
+        assert other_config.get_options("bar").as_dict() == {"bar": "BAR"}
+        mock_get.assert_called_once_with()
+        assert shared_cache.read() == (2, snap_config)
+
+    def test_shared_cache_reuse_options(self, tmp_path, fake_snapctl):
+        shared_cache = SharedConfigCache(tmp_path / "config.cache")
+        config = SnapConfig(snapctl=fake_snapctl, shared_cache=shared_cache)
+        snapshot = config._current_snapshot()
+        assert config._current_snapshot() is snapshot
+        shared_cache.publish({"foo": 456})
+        assert config._current_snapshot() is not snapshot
+        assert config.get("foo") == 456
+
+    def test_shared_cache_refresh(self, tmp_path, fake_snapctl):
+        config = SnapConfig(
+            snapctl=fake_snapctl,
+            shared_cache=SharedConfigCache(tmp_path / "config.cache"),
+        )
+        other_config = SnapConfig(
+            snapctl=fake_snapctl,
+            shared_cache=SharedConfigCache(tmp_path / "config.cache"),
+        )
+        assert other_config.get("foo") == 123
+        fake_snapctl._configs["foo"] = 456
+        config.refresh()
+        assert other_config.get("foo") == 456
+        assert config.snapshot().get("foo") == 456
+
+    def test_save_snapshot_shared_cache(
+        self, tmp_path, snap_config, fake_snapctl, snapshot_file
+    ):
+        shared_cache = SharedConfigCache(tmp_path / "config.cache")
+        config = SnapConfig(
+            snapctl=fake_snapctl,
+            snapshot_file=snapshot_file,
+            shared_cache=shared_cache,
+        )
+        config.save_snapshot()
+        assert snapshot_file.read() == snap_config
+        assert shared_cache.read() == (2, snap_config)
+
+    def test_shared_cache_invalidated_on_change(self, tmp_path, fake_snapctl):
+        config = SnapConfig(
+            snapctl=fake_snapctl,
+            shared_cache=SharedConfigCache(tmp_path / "config.cache"),
+        )
+        other_config = SnapConfig(
+            snapctl=fake_snapctl,
+            shared_cache=SharedConfigCache(tmp_path / "config.cache"),
+        )
+        assert other_config.get("foo") == 123
+        config.set({"foo": 456})
+        assert other_config.get("foo") == 456
+
+    def test_transaction(self, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        with config.transaction() as tx:
+            tx.set({"one": 1, "two": {"three": 3}})
+            tx.unset(["foo", "baz.aaa"])
+        assert tx.written == 4
+        assert fake_snapctl._configs["one"] == 1
+        assert fake_snapctl._configs["two"] == {"three": 3}
+        assert "foo" not in fake_snapctl._configs
+        assert fake_snapctl._configs["baz"] == {"bbb": {"ccc": "more nested"}}
+
+
+class TestSnapConfigTransaction:
+    def test_single_call(self, snapctl):
+        with SnapConfigTransaction(snapctl=snapctl) as tx:
+            tx.set({"foo": 1, "bar.baz": "x"})
+            tx.unset(["blah"])
+        assert snapctl.run.mock_calls == [
+            call("set", "foo=1", 'bar.baz="x"', "blah!")
+        ]
+        assert tx.written == 3
+
+    def test_no_changes(self, snapctl):
+        with SnapConfigTransaction(snapctl=snapctl) as tx:
+            pass
+        assert snapctl.run.mock_calls == []
+        assert tx.written == 0
+
+    def test_not_applied_on_error(self, snapctl):
+        with pytest.raises(RuntimeError):
+            with SnapConfigTransaction(snapctl=snapctl) as tx:
+                tx.set({"foo": 1})
+                raise RuntimeError()
+        assert snapctl.run.mock_calls == []
+
+    def test_value_copied(self, snapctl):
+        value = {"bar": 1}
+        with SnapConfigTransaction(snapctl=snapctl) as tx:
+            tx.set({"foo": value})
+            value["bar"] = 2
+        assert snapctl.run.mock_calls == [call("set", 'foo={"bar": 1}')]
+
+    def test_commit(self, snapctl):
+        tx = SnapConfigTransaction(snapctl=snapctl)
+        tx.set({"foo": 1})
+        assert tx.commit() == 1
+        tx.unset(["bar", "baz"])
+        assert tx.commit() == 2
+        assert tx.written == 3
+        assert snapctl.run.mock_calls == [
+            call("set", "foo=1"),
+            call("set", "bar!", "baz!"),
+        ]
+
+    @pytest.mark.parametrize(
+        "changes,configs,unset",
+        [
+            # last write wins
+            ([("set", "foo", 1), ("set", "foo", 2)], {"foo": 2}, []),
+            ([("set", "foo", 1), ("unset", "foo")], {}, ["foo"]),
+            ([("unset", "foo"), ("set", "foo", 1)], {"foo": 1}, []),
+            # writes to parent keys override subkeys
+            (
+                [
+                    ("set", "foo.bar", 1),
+                    ("set", "foo.baz", 2),
+                    ("set", "foo", 3),
+                ],
+                {"foo": 3},
+                [],
+            ),
+            ([("set", "foo.bar.baz", 1), ("unset", "foo")], {}, ["foo"]),
+            # writes to subkeys are merged in parent keys
+            (
+                [("set", "foo", {"bar": 1}), ("set", "foo.baz.blah", 2)],
+                {"foo": {"bar": 1, "baz": {"blah": 2}}},
+                [],
+            ),
+            (
+                [("set", "foo", {"bar": 1, "baz": 2}), ("unset", "foo.bar")],
+                {"foo": {"baz": 2}},
+                [],
+            ),
+            (
+                [("unset", "foo"), ("set", "foo.bar", 1)],
+                {"foo": {"bar": 1}},
+                [],
+            ),
+            ([("unset", "foo"), ("unset", "foo.bar")], {}, ["foo"]),
+            (
+                [("set", "foo", "x"), ("set", "foo.bar", 1)],
+                {"foo": {"bar": 1}},
+                [],
+            ),
+            (
+                [("set", "foo", {"bar": "x"}), ("set", "foo.bar.baz", 1)],
+                {"foo": {"bar": {"baz": 1}}},
+                [],
+            ),
+            (
+                [("set", "foo", {"bar": "x"}), ("unset", "foo.bar.baz")],
+                {"foo": {"bar": "x"}},
+                [],
+            ),
+        ],
+    )
+    def test_fold_changes(self, mocker, changes, configs, unset):
+        snapctl = mocker.Mock()
+        with SnapConfigTransaction(snapctl=snapctl) as tx:
+            for action, key, *value in changes:
+                if action == "set":
+                    tx.set({key: value[0]})
+                else:
+                    tx.unset([key])
+        snapctl.config_update.assert_called_once_with(configs, unset=unset)
+
+
+class TestAsyncSnapConfigOptions:
+    def test_fetch(self, fake_async_snapctl):
+        options = AsyncSnapConfigOptions(
+            ["foo", "baz"], snapctl=fake_async_snapctl
+        )
+        asyncio.run(options.fetch())
+        assert options["foo"] == 123
+        assert options["baz.bbb.ccc"] == "more nested"
+        assert options.as_dict() == {
+            "foo": 123,
+            "baz": {"aaa": "nested", "bbb": {"ccc": "more nested"}},
+        }
+
+
+class TestAsyncSnapConfig:
+    @pytest.mark.parametrize(
+        "key,value",
+        [
+            ("foo", 123),
+            ("baz.aaa", "nested"),
+            ("baz.bbb.ccc", "more nested"),
+        ],
+    )
+    def test_get(self, key, value, fake_async_snapctl):
+        config = AsyncSnapConfig(snapctl=fake_async_snapctl)
+        assert asyncio.run(config.get(key)) == value
+
+    def test_get_options_only_top_level(self, fake_async_snapctl):
+        config = AsyncSnapConfig(snapctl=fake_async_snapctl)
+        with pytest.raises(InvalidKey) as e:
+            asyncio.run(config.get_options("foo", "baz.bar"))
+        assert e.value.key == "baz.bar"
+
+    def test_apply(self, fake_snapctl, fake_async_snapctl):
+        config = AsyncSnapConfig(snapctl=fake_async_snapctl)
+        assert asyncio.run(config.apply({})) == {}
+        changed = asyncio.run(config.apply({"foo": 123, "baz.aaa": "new"}))
+        assert changed == {"baz.aaa": "new"}
+        assert fake_snapctl._configs["baz"]["aaa"] == "new"
+        snapshot = asyncio.run(config.get_options("foo"))
+        assert asyncio.run(config.apply({"foo": 123}, snapshot=snapshot)) == {}
+
+    def test_set_unset(self, fake_snapctl, fake_async_snapctl):
+        config = AsyncSnapConfig(snapctl=fake_async_snapctl)
+        asyncio.run(config.set({"one": 1, "two": {"three": 3}}))
+        assert fake_snapctl._configs["two"] == {"three": 3}
+        asyncio.run(config.unset(["one", "two.three"]))
+        assert "one" not in fake_snapctl._configs
+        assert fake_snapctl._configs["two"] == {}
@@ -1,14 +1,19 @@
 from copy import deepcopy
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from typing import NamedTuple
 
 import pytest
 
 from snaphelpers import (
+    AsyncSnapCtl,
     SnapCtl,
     SnapEnviron,
 )
 from snaphelpers._importlib import EntryPoints
 
+from .snapd import FakeSnapd
+
 
 @pytest.fixture
 def snap_env():
@@ -59,6 +64,14 @@ def snapctl(mocker, snap_apply_env):
     yield snapctl
 
 
+@pytest.fixture
+def async_snapctl(mocker, snap_apply_env):
+    """An AsyncSnapCtl instance with a mocked run method."""
+    snapctl = AsyncSnapCtl(executable="/not/here")
+    snapctl.run = mocker.AsyncMock(return_value="")
+    yield snapctl
+
+
 class FakeSnapCtl:
     """A fake SnapCtl implementation."""
 
@@ -67,6 +80,8 @@ class FakeSnapCtl:
         self._services = services or []
 
     def config_get(self, *keys):
+        if not keys:
+            return deepcopy(self._configs)
         options = {}
         for key in keys:
             if key in self._configs:
@@ -98,16 +113,56 @@ class FakeSnapCtl:
             else:
                 del old_conf[key_parts[index]]
 
+    def config_update(self, configs, unset=()):
+        self.config_set(configs)
+        self.config_unset(*unset)
+
     def services(self):
         return deepcopy(self._services)
 
 
+class FakeAsyncSnapCtl:
+    """A fake AsyncSnapCtl implementation, wrapping a FakeSnapCtl."""
+
+    def __init__(self, fake_snapctl):
+        self._fake = fake_snapctl
+
+    async def config_get(self, *keys):
+        return self._fake.config_get(*keys)
+
+    async def config_set(self, configs):
+        self._fake.config_set(configs)
+
+    async def config_unset(self, *keys):
+        self._fake.config_unset(*keys)
+
+    async def services(self):
+        return self._fake.services()
+
+
 @pytest.fixture
 def fake_snapctl(snap_config):
     """A fake SnapCtl handling the config."""
     yield FakeSnapCtl(configs=snap_config)
 
 
+@pytest.fixture
+def fake_async_snapctl(fake_snapctl):
+    """A fake AsyncSnapCtl sharing state with fake_snapctl."""
+    yield FakeAsyncSnapCtl(fake_snapctl)
+
+
+@pytest.fixture
+def fake_snapd():
+    """A stand-in snapd server listening on a UNIX socket."""
+    # use a short path, since UNIX socket paths have a limited length
+    with TemporaryDirectory() as tempdir:
+        snapd = FakeSnapd(Path(tempdir) / "snapd-snap.socket")
+        snapd.start()
+        yield snapd
+        snapd.stop()
+
+
 @pytest.fixture
 def make_entry_points():
     """Return an iterable with EntryPoint objects."""
@@ -1,15 +1,59 @@
+import asyncio
 import json
 from textwrap import dedent
+from threading import Thread
+import time
 from unittest.mock import call
 
 import pytest
 
+from snaphelpers._breaker import (
+    CircuitBreaker,
+    CircuitState,
+    SnapCtlCircuitOpen,
+)
+from snaphelpers._cache import SnapCtlCache
 from snaphelpers._ctl import (
+    AsyncSnapCtl,
     ServiceInfo,
     SnapCtl,
     SnapCtlError,
     SnapHealthStatus,
 )
+from snaphelpers._flight import (
+    AsyncSingleFlight,
+    SingleFlight,
+)
+from snaphelpers._instrument import (
+    SnapCtlCall,
+    SnapCtlInstrument,
+    SnapCtlMetrics,
+)
+from snaphelpers._limit import (
+    AsyncConcurrencyLimit,
+    ConcurrencyLimit,
+)
+from snaphelpers._transport import (
+    SnapCtlTimeout,
+    SnapCtlTransport,
+)
+
+from .transport_test import _wait_for_exit
+
+
+@pytest.fixture
+def mock_transport(mocker):
+    transport = mocker.Mock(spec=SnapCtlTransport)
+    transport.run.return_value = "output"
+    transport.run_stream.return_value = iter(["output"])
+    yield transport
+
+
+@pytest.fixture
+def clock(mocker):
+    clock = mocker.patch("snaphelpers._ctl.monotonic")
+    clock.return_value = 100.0
+    yield clock
 
 
 @pytest.mark.usefixtures("snap_apply_env")
@@ -47,6 +91,281 @@ class TestSnapCtl:
             snapctl.run()
         assert str(e.value) == "Call to snapctl failed with error 1: fail!\n"
 
+    def test_run_stream(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo "$@"
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        snapctl = SnapCtl(executable=str(executable))
+        assert "".join(snapctl.run_stream("get", "-d")) == "get -d\n"
+
+    def test_run_no_timeout(self, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport)
+        assert snapctl.run("get", "foo") == "output"
+        mock_transport.run.assert_called_once_with(("get", "foo"))
+
+    def test_run_timeout(self, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport, timeout=5)
+        snapctl.run("get", "foo")
+        snapctl.run("get", "foo", timeout=2)
+        assert mock_transport.run.mock_calls == [
+            call(("get", "foo"), timeout=5),
+            call(("get", "foo"), timeout=2),
+        ]
+
+    def test_run_stream_timeout(self, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport, timeout=5)
+        assert list(snapctl.run_stream("get", "-d")) == ["output"]
+        mock_transport.run_stream.assert_called_once_with(
+            ("get", "-d"), timeout=5
+        )
+
+    def test_deadline(self, clock, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport, timeout=5)
+        with snapctl.deadline(3):
+            clock.return_value = 101.0
+            snapctl.run("get", "foo")
+            # nested deadlines can't extend the outer one
+            with snapctl.deadline(10):
+                snapctl.run("get", "foo")
+            with snapctl.deadline(1):
+                snapctl.run("get", "foo", timeout=30)
+        snapctl.run("get", "foo")
+        assert mock_transport.run.mock_calls == [
+            call(("get", "foo"), timeout=2.0),
+            call(("get", "foo"), timeout=2.0),
+            call(("get", "foo"), timeout=1.0),
+            call(("get", "foo"), timeout=5),
+        ]
+
+    def test_deadline_shorter_timeout(self, clock, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport)
+        with snapctl.deadline(3):
+            snapctl.run("get", "foo", timeout=1)
+        mock_transport.run.assert_called_once_with(("get", "foo"), timeout=1)
+
+    def test_deadline_expired(self, clock, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport)
+        with snapctl.deadline(3):
+            clock.return_value = 103.0
+            with pytest.raises(SnapCtlTimeout):
+                snapctl.run("get", "foo")
+        mock_transport.run.assert_not_called()
+
+    def test_deadline_other_instance(self, clock, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport)
+        with snapctl.deadline(3):
+            SnapCtl(transport=mock_transport).run("get", "foo")
+        mock_transport.run.assert_called_once_with(("get", "foo"), timeout=3)
+
+    def test_deadline_reset_on_error(self, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport)
+        with pytest.raises(RuntimeError):
+            with snapctl.deadline(3):
+                raise RuntimeError()
+        snapctl.run("get", "foo")
+        mock_transport.run.assert_called_once_with(("get", "foo"))
+
+    def test_run_breaker(self, mock_transport):
+        mock_transport.run.side_effect = ConnectionRefusedError()
+        snapctl = SnapCtl(
+            transport=mock_transport,
+            breaker=CircuitBreaker(failure_threshold=1),
+        )
+        with pytest.raises(ConnectionRefusedError):
+            snapctl.run("get", "foo")
+        with pytest.raises(SnapCtlCircuitOpen):
+            snapctl.run("get", "foo")
+        mock_transport.run.assert_called_once()
+
+    def test_run_breaker_last_known(self, mocker, mock_transport):
+        mocker.patch("snaphelpers._cache.monotonic", return_value=100.0)
+        cache = SnapCtlCache()
+        snapctl = SnapCtl(
+            transport=mock_transport,
+            cache=cache,
+            breaker=CircuitBreaker(failure_threshold=1),
+        )
+        assert snapctl.run("get", "foo") == "output"
+        mock_transport.run.side_effect = ConnectionRefusedError()
+        mocker.patch("snaphelpers._cache.monotonic", return_value=200.0)
+        with pytest.raises(ConnectionRefusedError):
+            snapctl.run("get", "foo")
+        # the last known output is returned while the circuit is open
+        assert snapctl.run("get", "foo") == "output"
+        with pytest.raises(SnapCtlCircuitOpen):
+            snapctl.run("get", "bar")
+
+    def test_run_single_flight(self, mocker, mock_transport):
+        single_flight = SingleFlight()
+        call = mocker.spy(single_flight, "call")
+        snapctl = SnapCtl(
+            transport=mock_transport, timeout=5, single_flight=single_flight
+        )
+        assert snapctl.run("get", "foo") == "output"
+        assert call.mock_calls[0].args == (("get", "foo"),)
+        assert call.mock_calls[0].kwargs["timeout"] == 5
+        mock_transport.run.assert_called_once_with(("get", "foo"), timeout=5)
+        assert single_flight.calls == 1
+
+    def test_run_limit(self, mock_transport):
+        limit = ConcurrencyLimit()
+        snapctl = SnapCtl(transport=mock_transport, limit=limit)
+        assert snapctl.run("get", "foo") == "output"
+        mock_transport.run.assert_called_once_with(("get", "foo"))
+        assert limit.calls == 1
+
+    def test_run_limit_timeout(self, mock_transport):
+        snapctl = SnapCtl(
+            transport=mock_transport, timeout=5, limit=ConcurrencyLimit()
+        )
+        snapctl.run("get", "foo")
+        # time waiting for a slot is deducted from the timeout
+        timeout = mock_transport.run.mock_calls[0].kwargs["timeout"]
+        assert 0 < timeout <= 5
+
+    def test_run_limit_wait_timeout_breaker(self, mock_transport):
+        limit = ConcurrencyLimit(max_calls=1)
+        breaker = CircuitBreaker(failure_threshold=1)
+        snapctl = SnapCtl(
+            transport=mock_transport, limit=limit, breaker=breaker
+        )
+        with limit.slot():
+            with pytest.raises(SnapCtlTimeout):
+                snapctl.run("get", "foo", timeout=0.01)
+            with pytest.raises(SnapCtlTimeout):
+                list(snapctl.run_stream("get", "-d", timeout=0.01))
+        # timing out waiting for a slot doesn't open the circuit
+        assert breaker.state == CircuitState.CLOSED
+        mock_transport.run.assert_not_called()
+        mock_transport.run_stream.assert_not_called()
+
+    def test_run_stream_limit(self, mock_transport):
+        limit = ConcurrencyLimit(max_calls=1)
+        snapctl = SnapCtl(transport=mock_transport, timeout=5, limit=limit)
+        stream = snapctl.run_stream("get", "-d")
+        assert next(stream) == "output"
+        # the slot is held while streaming
+        assert limit._active == 1
+        assert list(stream) == []
+        assert limit._active == 0
+        timeout = mock_transport.run_stream.mock_calls[0].kwargs["timeout"]
+        assert 0 < timeout <= 5
+
+    def test_run_instruments(self, mocker, mock_transport):
+        instrument = mocker.Mock(spec=SnapCtlInstrument)
+        snapctl = SnapCtl(transport=mock_transport, instruments=[instrument])
+        snapctl.run("get", "foo")
+        instrument.before.assert_called_once_with(("get", "foo"))
+        [call] = [
+            mock_call.args[0] for mock_call in instrument.after.mock_calls
+        ]
+        assert call.args == ("get", "foo")
+        assert call.duration >= 0
+        assert call.returncode == 0
+        assert call.output_size == len("output")
+
+    @pytest.mark.parametrize(
+        "error,returncode",
+        [
+            (SnapCtlError(2, "fail"), 2),
+            (SnapCtlTimeout(1), -9),
+            (ConnectionRefusedError(), None),
+        ],
+    )
+    def test_run_instruments_error(self, mock_transport, error, returncode):
+        mock_transport.run.side_effect = error
+        metrics = SnapCtlMetrics()
+        snapctl = SnapCtl(transport=mock_transport, instruments=[metrics])
+        with pytest.raises(type(error)):
+            snapctl.run("get", "foo")
+        assert metrics.commands["get"].errors == 1
+        with snapctl.capture_calls() as calls:
+            with pytest.raises(type(error)):
+                snapctl.run("get", "foo")
+        assert calls[0].returncode == returncode
+        assert calls[0].output_size == 0
+
+    def test_run_instruments_with_limit(self, mock_transport):
+        metrics = SnapCtlMetrics()
+        snapctl = SnapCtl(
+            transport=mock_transport,
+            timeout=5,
+            limit=ConcurrencyLimit(),
+            instruments=[metrics],
+        )
+        snapctl.run("get", "foo")
+        assert metrics.commands["get"].count == 1
+        assert 0 < mock_transport.run.mock_calls[0].kwargs["timeout"] <= 5
+
+    def test_capture_calls(self, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport)
+        snapctl.run("set", "foo=1")
+        with snapctl.capture_calls() as outer:
+            snapctl.run("get", "foo")
+            with snapctl.capture_calls() as inner:
+                # calls from other instances are also captured
+                SnapCtl(transport=mock_transport).run("services")
+        snapctl.run("get", "bar")
+        assert [call.args for call in outer] == [("get", "foo"), ("services",)]
+        assert [call.args for call in inner] == [("services",)]
+
+    def test_capture_calls_other_thread(self, mock_transport):
+        snapctl = SnapCtl(transport=mock_transport)
+        with snapctl.capture_calls() as calls:
+            thread = Thread(target=snapctl.run, args=("get", "foo"))
+            thread.start()
+            thread.join()
+        assert calls == []
+
+    def test_capture_calls_cached(self, mocker, mock_transport):
+        mocker.patch("snaphelpers._cache.monotonic", return_value=100.0)
+        snapctl = SnapCtl(transport=mock_transport, cache=SnapCtlCache())
+        with snapctl.capture_calls() as calls:
+            snapctl.run("get", "foo")
+            snapctl.run("get", "foo")
+        assert len(calls) == 1
+
+    def test_run_stream_instruments(self, mock_transport):
+        mock_transport.run_stream.return_value = iter(["foo", "bar"])
+        snapctl = SnapCtl(transport=mock_transport)
+        with snapctl.capture_calls() as calls:
+            assert list(snapctl.run_stream("get", "-d")) == ["foo", "bar"]
+        [call] = calls
+        assert call.args == ("get", "-d")
+        assert call.returncode == 0
+        assert call.output_size == 6
+
+    def test_run_stream_instruments_error(self, mock_transport):
+        def stream(args, timeout=None):
+            yield "foo"
+            raise SnapCtlError(1, "fail")
+
+        mock_transport.run_stream.side_effect = stream
+        snapctl = SnapCtl(transport=mock_transport)
+        with snapctl.capture_calls() as calls:
+            with pytest.raises(SnapCtlError):
+                list(snapctl.run_stream("get", "-d"))
+        assert calls[0].returncode == 1
+        assert calls[0].output_size == 3
+
+    def test_run_stream_breaker(self, mock_transport):
+        breaker = CircuitBreaker(failure_threshold=1)
+        snapctl = SnapCtl(transport=mock_transport, breaker=breaker)
+        assert list(snapctl.run_stream("get", "-d")) == ["output"]
+        assert breaker.state == CircuitState.CLOSED
+        mock_transport.run_stream.side_effect = ConnectionRefusedError()
+        with pytest.raises(ConnectionRefusedError):
+            list(snapctl.run_stream("get", "-d"))
+        assert breaker.state == CircuitState.OPEN
+
     def test_config_get(self, snapctl):
         output = {"foo": 123, "bar": "BAR"}
         snapctl.run.return_value = json.dumps(output)
@@ -63,6 +382,24 @@ class TestSnapCtl:
         snapctl.config_unset("foo.bar", "baz")
         assert snapctl.run.mock_calls == [call("set", "foo.bar!", "baz!")]
 
+    def test_config_update(self, snapctl):
+        snapctl.config_update({"foo.bar": 123}, unset=["baz"])
+        assert snapctl.run.mock_calls == [call("set", "foo.bar=123", "baz!")]
+
+    def test_config_update_split(self, snapctl):
+        snapctl._MAX_ARGS_SIZE = 30
+        snapctl.config_update(
+            {"foo": "a" * 5, "bar": "b" * 5, "baz": "c" * 5}, unset=["blah"]
+        )
+        assert snapctl.run.mock_calls == [
+            call("set", 'foo="aaaaa"', 'bar="bbbbb"'),
+            call("set", 'baz="ccccc"', "blah!"),
+        ]
+
+    def test_config_update_empty(self, snapctl):
+        snapctl.config_update({})
+        assert snapctl.run.mock_calls == []
+
     def test_connection_set(self, snapctl):
         snapctl.connection_set("myplug", {"foo.bar": 123, "baz": [1, 2, 3]})
         assert snapctl.run.mock_calls == [
@@ -91,6 +428,31 @@ class TestSnapCtl:
         snapctl = SnapCtl(executable=str(executable))
         assert snapctl.is_connected("myslot") == connected
 
+    @pytest.mark.parametrize(
+        "error",
+        [
+            SnapCtlTimeout(1),
+            SnapCtlCircuitOpen(10),
+            SnapCtlError(1, "error: cannot communicate with server: EOF"),
+        ],
+    )
+    def test_is_connected_unreachable(self, mock_transport, error):
+        mock_transport.run.side_effect = error
+        snapctl = SnapCtl(transport=mock_transport)
+        with pytest.raises(type(error)):
+            snapctl.is_connected("myslot")
+
+    def test_is_connected_circuit_open(self, mock_transport):
+        mock_transport.run.side_effect = ConnectionRefusedError()
+        snapctl = SnapCtl(
+            transport=mock_transport,
+            breaker=CircuitBreaker(failure_threshold=1),
+        )
+        with pytest.raises(ConnectionRefusedError):
+            snapctl.is_connected("myslot")
+        with pytest.raises(SnapCtlCircuitOpen):
+            snapctl.is_connected("myslot")
+
     @pytest.mark.parametrize(
         "remote,call_args",
         [
@@ -183,15 +545,71 @@ class TestSnapCtl:
                 name="service1",
                 enabled=False,
                 active=False,
-                notes=["foo", "bar"],
+                notes=("foo", "bar"),
             ),
-            ServiceInfo(name="service2", enabled=True, active=True, notes=[]),
+            ServiceInfo(name="service2", enabled=True, active=True, notes=()),
             ServiceInfo(
-                name="service3", enabled=True, active=False, notes=["baz"]
+                name="service3", enabled=True, active=False, notes=("baz",)
             ),
         ]
         assert snapctl.run.mock_calls == [call("services", "mysnap_inst")]
 
+    def test_services_empty_output(self, snapctl):
+        assert snapctl.services() == []
+
+    def test_services_unexpected_header(self, snapctl):
+        snapctl.run.return_value = dedent(
+            """\
+            service          startup   current   notes
+            mysnap.service1  disabled  inactive  foo,bar
+            mysnap.service2  enabled   active    -
+            """
+        )
+        assert snapctl.services() == [
+            ServiceInfo(
+                name="service1",
+                enabled=False,
+                active=False,
+                notes=("foo", "bar"),
+            ),
+            ServiceInfo(name="service2", enabled=True, active=True, notes=()),
+        ]
+
+    def test_services_skip_invalid_lines(self, snapctl):
+        snapctl.run.return_value = dedent(
+            """\
+            Service          Startup   Current   Notes
+            mysnap.service1  enabled   active    -
+
+            mysnap.service2  enabled
+            service3         enabled   active    -
+            """
+        )
+        assert snapctl.services() == [
+            ServiceInfo(name="service1", enabled=True, active=True, notes=())
+        ]
+
+    def test_services_reuse_unchanged(self, snapctl):
+        output = dedent(
+            """\
+            Service          Startup   Current   Notes
+            mysnap.service1  disabled  inactive  foo,bar
+            mysnap.service2  enabled   active    foo,bar
+            """
+        )
+        snapctl.run.side_effect = [
+            output,
+            output.replace("disabled  inactive", "enabled   active  "),
+        ]
+        info1, info2 = snapctl.services()
+        # notes are shared across services
+        assert info1.notes is info2.notes
+        new_info1, new_info2 = snapctl.services()
+        assert new_info1 == ServiceInfo(
+            name="service1", enabled=True, active=True, notes=("foo", "bar")
+        )
+        assert new_info2 is info2
+
     def test_services_with_services(self, snapctl):
         snapctl.run.return_value = dedent(
             """\
@@ -205,10 +623,10 @@ class TestSnapCtl:
                 name="service1",
                 enabled=False,
                 active=False,
-                notes=["foo", "bar"],
+                notes=("foo", "bar"),
             ),
             ServiceInfo(
-                name="service3", enabled=True, active=False, notes=["baz"]
+                name="service3", enabled=True, active=False, notes=("baz",)
             ),
         ]
         assert snapctl.run.mock_calls == [
@@ -272,3 +690,379 @@ class TestSnapCtl:
         snapctl.run.assert_called_once_with(
             "refresh", "--pending", "--proceed"
         )
+
+
+@pytest.mark.usefixtures("snap_apply_env")
+class TestAsyncSnapCtl:
+    def test_run(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo foo "$@"
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        snapctl = AsyncSnapCtl(executable=str(executable))
+        assert asyncio.run(snapctl.run("bar")) == "foo bar\n"
+
+    def test_run_fail(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo 'fail!' >&2
+                exit 1
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        snapctl = AsyncSnapCtl(executable=str(executable))
+        with pytest.raises(SnapCtlError) as e:
+            asyncio.run(snapctl.run())
+        assert str(e.value) == "Call to snapctl failed with error 1: fail!\n"
+
+    def test_run_timeout(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                sleep 10 &
+                wait
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        snapctl = AsyncSnapCtl(executable=str(executable), timeout=0.2)
+        start = time.monotonic()
+        with pytest.raises(SnapCtlTimeout) as e:
+            asyncio.run(snapctl.run())
+        assert e.value.timeout == 0.2
+        assert time.monotonic() - start < 5
+
+    def test_run_cancelled(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                sleep 10 &
+                echo $$ $! > "$(dirname "$0")/pids"
+                wait
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        pids_file = tmpdir / "pids"
+        snapctl = AsyncSnapCtl(executable=str(executable))
+
+        async def run():
+            task = asyncio.ensure_future(snapctl.run("get"))
+            while not pids_file.exists() or not pids_file.read_text("utf-8"):
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        pid, child_pid = map(int, pids_file.read_text("utf-8").split())
+        # the whole process group is killed
+        assert _wait_for_exit(pid)
+        assert _wait_for_exit(child_pid)
+
+    def test_run_deadline(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo foo
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        snapctl = AsyncSnapCtl(executable=str(executable))
+
+        async def run():
+            with snapctl.deadline(10):
+                return await snapctl.run()
+
+        assert asyncio.run(run()) == "foo\n"
+
+    def test_run_breaker(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        breaker = CircuitBreaker(failure_threshold=1)
+        snapctl = AsyncSnapCtl(executable=str(executable), breaker=breaker)
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(snapctl.run())
+        assert breaker.state == CircuitState.OPEN
+        with pytest.raises(SnapCtlCircuitOpen):
+            asyncio.run(snapctl.run())
+
+    def test_run_breaker_success(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo foo
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        breaker = CircuitBreaker()
+        snapctl = AsyncSnapCtl(executable=str(executable), breaker=breaker)
+        assert asyncio.run(snapctl.run()) == "foo\n"
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_run_single_flight(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo "$@" >> "$(dirname "$0")/calls"
+                sleep 0.1
+                echo foo
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        single_flight = AsyncSingleFlight()
+        snapctl = AsyncSnapCtl(
+            executable=str(executable), single_flight=single_flight
+        )
+
+        async def run():
+            return await asyncio.gather(
+                *(snapctl.run("get", "foo") for _ in range(3))
+            )
+
+        assert asyncio.run(run()) == ["foo\n"] * 3
+        assert (tmpdir / "calls").read_text("utf-8") == "get foo\n"
+        assert single_flight.shared == 2
+
+    def test_run_limit(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo "$@"
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        limit = AsyncConcurrencyLimit(max_calls=1)
+        snapctl = AsyncSnapCtl(executable=str(executable), limit=limit)
+
+        async def run():
+            return await asyncio.gather(
+                snapctl.run("get", "foo"), snapctl.run("get", "bar")
+            )
+
+        assert asyncio.run(run()) == ["get foo\n", "get bar\n"]
+        assert limit.calls == 2
+        assert limit.queued == 1
+
+    def test_run_limit_wait_timeout_breaker(self, tmpdir):
+        limit = AsyncConcurrencyLimit(max_calls=1)
+        breaker = CircuitBreaker(failure_threshold=1)
+        snapctl = AsyncSnapCtl(
+            executable=str(tmpdir / "snapctl"), limit=limit, breaker=breaker
+        )
+
+        async def run():
+            async with limit.slot():
+                await snapctl.run("get", "foo", timeout=0.01)
+
+        with pytest.raises(SnapCtlTimeout):
+            asyncio.run(run())
+        # timing out waiting for a slot doesn't open the circuit
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_run_instruments(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                [ "$1" = fail ] && exit 3
+                echo "$@"
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        metrics = SnapCtlMetrics()
+        snapctl = AsyncSnapCtl(
+            executable=str(executable),
+            limit=AsyncConcurrencyLimit(),
+            instruments=[metrics],
+        )
+
+        async def run():
+            with snapctl.capture_calls() as calls:
+                await snapctl.run("get", "foo")
+                with pytest.raises(SnapCtlError):
+                    await snapctl.run("fail")
+            return calls
+
+        calls = asyncio.run(run())
+        assert calls[0] == SnapCtlCall(
+            ("get", "foo"), calls[0].duration, 0, len("get foo\n")
+        )
+        assert calls[1].returncode == 3
+        assert metrics.commands["get"].count == 1
+        assert metrics.commands["fail"].errors == 1
+
+    def test_run_arg_too_long(self, mocker):
+        create_subprocess_exec = mocker.patch("asyncio.create_subprocess_exec")
+        snapctl = AsyncSnapCtl()
+        with pytest.raises(ValueError):
+            asyncio.run(snapctl.run("set", "foo=" + "x" * 200000))
+        create_subprocess_exec.assert_not_called()
+
+    def test_config_get(self, async_snapctl):
+        output = {"foo": 123, "bar": "BAR"}
+        async_snapctl.run.return_value = json.dumps(output)
+        assert asyncio.run(async_snapctl.config_get("foo", "bar")) == output
+        assert async_snapctl.run.mock_calls == [
+            call("get", "-d", "foo", "bar")
+        ]
+
+    @pytest.mark.parametrize(
+        "method,args,call_args",
+        [
+            (
+                "config_set",
+                [{"foo.bar": 123}],
+                ["set", "foo.bar=123"],
+            ),
+            ("config_unset", ["foo.bar", "baz"], ["set", "foo.bar!", "baz!"]),
+            (
+                "config_update",
+                [{"foo": 1}, ["bar"]],
+                ["set", "foo=1", "bar!"],
+            ),
+            (
+                "connection_set",
+                ["myplug", {"foo": 1}],
+                ["set", ":myplug", "foo=1"],
+            ),
+            (
+                "connection_unset",
+                ["myslot", "foo"],
+                ["set", ":myslot", "foo!"],
+            ),
+            ("start", ["foo"], ["start", "mysnap_inst.foo"]),
+            ("stop", [], ["stop", "mysnap_inst"]),
+            ("restart", ["foo"], ["restart", "mysnap_inst.foo"]),
+            (
+                "set_health",
+                [SnapHealthStatus.WAITING, "some message", "a-b"],
+                ["set-health", "waiting", "some message", "--code", "a-b"],
+            ),
+        ],
+    )
+    def test_actions(self, async_snapctl, method, args, call_args):
+        asyncio.run(getattr(async_snapctl, method)(*args))
+        assert async_snapctl.run.mock_calls == [call(*call_args)]
+
+    @pytest.mark.parametrize("connected", [True, False])
+    def test_is_connected(self, async_snapctl, connected):
+        if not connected:
+            async_snapctl.run.side_effect = SnapCtlError(1, "")
+        assert asyncio.run(async_snapctl.is_connected("myslot")) == connected
+        assert async_snapctl.run.mock_calls == [call("is-connected", "myslot")]
+
+    @pytest.mark.parametrize(
+        "error", [SnapCtlTimeout(1), SnapCtlCircuitOpen(1)]
+    )
+    def test_is_connected_unreachable(self, async_snapctl, error):
+        async_snapctl.run.side_effect = error
+        with pytest.raises(type(error)):
+            asyncio.run(async_snapctl.is_connected("myslot"))
+
+    def test_is_connected_timeout(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                sleep 10 &
+                wait
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        snapctl = AsyncSnapCtl(executable=str(executable), timeout=0.2)
+        with pytest.raises(SnapCtlTimeout):
+            asyncio.run(snapctl.is_connected("myslot"))
+
+    @pytest.mark.parametrize(
+        "method,remote,call_args",
+        [
+            ("plug_get", False, ["get", "-d", ":myconn", "foo"]),
+            ("plug_get", True, ["get", "-d", "--slot", ":myconn", "foo"]),
+            ("slot_get", False, ["get", "-d", ":myconn", "foo"]),
+            ("slot_get", True, ["get", "-d", "--plug", ":myconn", "foo"]),
+        ],
+    )
+    def test_connection_get(self, async_snapctl, method, remote, call_args):
+        async_snapctl.run.return_value = '{"foo": 123}'
+        result = asyncio.run(
+            getattr(async_snapctl, method)("myconn", "foo", remote=remote)
+        )
+        assert result == {"foo": 123}
+        assert async_snapctl.run.mock_calls == [call(*call_args)]
+
+    def test_services(self, async_snapctl):
+        async_snapctl.run.return_value = dedent(
+            """\
+            Service          Startup   Current   Notes
+            mysnap.service1  disabled  inactive  foo,bar
+            mysnap.service2  enabled   active    -
+            """
+        )
+        assert asyncio.run(async_snapctl.services()) == [
+            ServiceInfo(
+                name="service1",
+                enabled=False,
+                active=False,
+                notes=("foo", "bar"),
+            ),
+            ServiceInfo(name="service2", enabled=True, active=True, notes=()),
+        ]
+        assert async_snapctl.run.mock_calls == [
+            call("services", "mysnap_inst")
+        ]
+
+    def test_system_mode(self, async_snapctl):
+        async_snapctl.run.return_value = "system-mode: run\n"
+        assert asyncio.run(async_snapctl.system_mode()) == {
+            "system-mode": "run"
+        }
+        async_snapctl.run.assert_called_once_with("system-mode")
+
+    def test_refresh(self, async_snapctl):
+        async_snapctl.run.return_value = "pending: none\n"
+        assert asyncio.run(async_snapctl.refresh(action="hold")) == {
+            "pending": "none"
+        }
+        async_snapctl.run.assert_called_once_with(
+            "refresh", "--pending", "--hold"
+        )
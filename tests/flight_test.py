@@ -0,0 +1,271 @@
+import asyncio
+import gc
+from threading import (
+    Event,
+    Thread,
+)
+import time
+
+import pytest
+
+from snaphelpers._flight import (
+    AsyncSingleFlight,
+    SingleFlight,
+)
+from snaphelpers._transport import (
+    SnapCtlError,
+    SnapCtlTimeout,
+)
+
+
+class BlockingRun:
+    """A run function blocking until released."""
+
+    def __init__(self, output="output", error=None):
+        self.output = output
+        self.error = error
+        self.calls = []
+        self.started = Event()
+        self.released = Event()
+
+    def __call__(self, args):
+        self.calls.append(list(args))
+        self.started.set()
+        assert self.released.wait(timeout=5)
+        if self.error:
+            raise self.error
+        return self.output
+
+
+def wait_shared(single_flight, count):
+    """Wait until a number of calls are waiting for an in-flight one."""
+    for _ in range(500):
+        if single_flight.shared >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError("calls not waiting")
+
+
+def run_threads(single_flight, run, args, count):
+    """Call the same command from multiple threads."""
+    results = []
+
+    def call():
+        try:
+            results.append(single_flight.call(args, run))
+        except Exception as error:
+            results.append(error)
+
+    threads = [Thread(target=call) for _ in range(count)]
+    threads[0].start()
+    assert run.started.wait(timeout=5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_shared(single_flight, count - 1)
+    run.released.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight:
+    def test_shared(self):
+        single_flight = SingleFlight()
+        run = BlockingRun()
+        results = run_threads(single_flight, run, ["get", "-d", "foo"], 4)
+        assert results == ["output"] * 4
+        assert run.calls == [["get", "-d", "foo"]]
+        assert single_flight.calls == 1
+        assert single_flight.shared == 3
+
+    def test_error_shared(self):
+        single_flight = SingleFlight()
+        error = SnapCtlError(1, "fail")
+        run = BlockingRun(error=error)
+        results = run_threads(single_flight, run, ["services"], 3)
+        assert results == [error] * 3
+        assert len(run.calls) == 1
+
+    def test_sequential_calls(self):
+        single_flight = SingleFlight()
+        assert single_flight.call(["get", "foo"], lambda args: "a") == "a"
+        assert single_flight.call(["get", "foo"], lambda args: "b") == "b"
+        assert single_flight.calls == 2
+        assert single_flight.shared == 0
+
+    def test_not_read_only(self):
+        single_flight = SingleFlight()
+        assert single_flight.call(["set", "foo=1"], lambda args: "") == ""
+        assert single_flight.calls == 0
+
+    def test_wait_timeout(self):
+        single_flight = SingleFlight()
+        run = BlockingRun()
+        thread = Thread(target=single_flight.call, args=(["get", "foo"], run))
+        thread.start()
+        assert run.started.wait(timeout=5)
+        with pytest.raises(SnapCtlTimeout) as e:
+            single_flight.call(["get", "foo"], run, timeout=0.01)
+        assert e.value.timeout == 0.01
+        run.released.set()
+        thread.join()
+        assert len(run.calls) == 1
+
+    def test_not_shared_after_change(self):
+        single_flight = SingleFlight()
+        run = BlockingRun(output="old")
+        thread = Thread(target=single_flight.call, args=(["get", "foo"], run))
+        thread.start()
+        assert run.started.wait(timeout=5)
+        single_flight.call(["set", "foo=1"], lambda args: "")
+        # a new call is made, since the running one might be stale
+        new_run = BlockingRun(output="new")
+        new_run.released.set()
+        assert single_flight.call(["get", "foo"], new_run) == "new"
+        run.released.set()
+        thread.join()
+        assert single_flight.calls == 2
+
+
+class TestAsyncSingleFlight:
+    def test_shared(self):
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def run(args):
+            calls.append(list(args))
+            await asyncio.sleep(0.01)
+            return "output"
+
+        async def call():
+            return await asyncio.gather(
+                *(single_flight.call(["services"], run) for _ in range(4))
+            )
+
+        assert asyncio.run(call()) == ["output"] * 4
+        assert calls == [["services"]]
+        assert single_flight.calls == 1
+        assert single_flight.shared == 3
+
+    def test_error_shared(self):
+        single_flight = AsyncSingleFlight()
+        error = SnapCtlError(1, "fail")
+
+        async def run(args):
+            await asyncio.sleep(0.01)
+            raise error
+
+        async def call():
+            return await asyncio.gather(
+                *(single_flight.call(["services"], run) for _ in range(2)),
+                return_exceptions=True,
+            )
+
+        assert asyncio.run(call()) == [error, error]
+        assert single_flight.calls == 1
+
+    def test_error_no_waiters(self, mocker):
+        single_flight = AsyncSingleFlight()
+
+        async def run(args):
+            raise SnapCtlError(1, "fail")
+
+        async def call():
+            asyncio.get_running_loop().set_exception_handler(handler)
+            with pytest.raises(SnapCtlError):
+                await single_flight.call(["services"], run)
+            gc.collect()
+
+        handler = mocker.Mock()
+        asyncio.run(call())
+        handler.assert_not_called()
+
+    def test_not_read_only(self):
+        single_flight = AsyncSingleFlight()
+
+        async def run(args):
+            return ""
+
+        assert asyncio.run(single_flight.call(["set", "foo=1"], run)) == ""
+        assert single_flight.calls == 0
+
+    def test_wait_timeout(self):
+        single_flight = AsyncSingleFlight()
+
+        async def run(args):
+            await asyncio.sleep(0.1)
+            return "output"
+
+        async def call():
+            task = asyncio.ensure_future(single_flight.call(["get"], run))
+            await asyncio.sleep(0)
+            with pytest.raises(SnapCtlTimeout):
+                await single_flight.call(["get"], run, timeout=0.01)
+            return await task
+
+        assert asyncio.run(call()) == "output"
+
+    def test_waiter_cancelled(self):
+        single_flight = AsyncSingleFlight()
+
+        async def run(args):
+            await asyncio.sleep(0.05)
+            return "output"
+
+        async def call():
+            task = asyncio.ensure_future(single_flight.call(["get"], run))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(single_flight.call(["get"], run))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            # the in-flight call is not affected
+            return await task
+
+        assert asyncio.run(call()) == "output"
+
+    def test_running_cancelled(self):
+        single_flight = AsyncSingleFlight()
+        outputs = iter(["first", "second"])
+
+        async def run(args):
+            await asyncio.sleep(0.05)
+            return next(outputs)
+
+        async def call():
+            task = asyncio.ensure_future(single_flight.call(["get"], run))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(single_flight.call(["get"], run))
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # the waiting task runs the command again
+            return await waiter
+
+        assert asyncio.run(call()) == "first"
+        assert single_flight.calls == 2
+
+    def test_not_shared_after_change(self):
+        single_flight = AsyncSingleFlight()
+
+        async def run(args):
+            await asyncio.sleep(0.05)
+            return "old"
+
+        async def new_run(args):
+            return "new"
+
+        async def change(args):
+            return ""
+
+        async def call():
+            task = asyncio.ensure_future(single_flight.call(["get"], run))
+            await asyncio.sleep(0)
+            await single_flight.call(["set", "foo=1"], change)
+            output = await single_flight.call(["get"], new_run)
+            return output, await task
+
+        assert asyncio.run(call()) == ("new", "old")
+        assert single_flight.calls == 2
@@ -1,8 +1,12 @@
+import asyncio
 from unittest.mock import call
 
 import pytest
 
-from snaphelpers._health import SnapHealth
+from snaphelpers._health import (
+    AsyncSnapHealth,
+    SnapHealth,
+)
 
 
 @pytest.fixture
@@ -10,6 +14,11 @@ def snaphealth(snapctl):
     yield SnapHealth(snapctl=snapctl)
 
 
+@pytest.fixture
+def async_snaphealth(async_snapctl):
+    yield AsyncSnapHealth(snapctl=async_snapctl)
+
+
 class TestSnapHealth:
     def test_okay(self, snapctl, snaphealth):
         snaphealth.okay()
@@ -44,3 +53,24 @@ class TestSnapHealth:
         with pytest.raises(ValueError) as err:
             method("some message", code="foo bar")
         assert str(err.value) == "Invalid health status code format"
+
+
+class TestAsyncSnapHealth:
+    def test_okay(self, async_snapctl, async_snaphealth):
+        asyncio.run(async_snaphealth.okay())
+        assert async_snapctl.run.mock_calls == [call("set-health", "okay")]
+
+    @pytest.mark.parametrize("status", ["waiting", "blocked", "error"])
+    def test_other_statuses_code(
+        self, async_snapctl, async_snaphealth, status
+    ):
+        method = getattr(async_snaphealth, status)
+        asyncio.run(method("some message", code="a-b-c"))
+        assert async_snapctl.run.mock_calls == [
+            call("set-health", status, "some message", "--code", "a-b-c")
+        ]
+
+    def test_invalid_code(self, async_snaphealth):
+        with pytest.raises(ValueError) as err:
+            asyncio.run(async_snaphealth.error("message", code="foo bar"))
+        assert str(err.value) == "Invalid health status code format"
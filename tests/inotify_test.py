@@ -0,0 +1,54 @@
+import pytest
+
+from snaphelpers._inotify import (
+    _libc,
+    Inotify,
+)
+
+
+@pytest.fixture
+def inotify(tmp_path):
+    inotify = Inotify(str(tmp_path))
+    yield inotify
+    inotify.close()
+
+
+class TestInotify:
+    def test_read(self, tmp_path, inotify):
+        (tmp_path / "foo").write_text("foo")
+        (tmp_path / "bar.tmp").write_text("bar")
+        (tmp_path / "bar.tmp").rename(tmp_path / "bar")
+        assert inotify.read(timeout=5) == ["foo", "bar.tmp", "bar"]
+
+    def test_read_timeout(self, inotify):
+        assert inotify.read(timeout=0.01) == []
+
+    def test_read_no_data(self, mocker, tmp_path, inotify):
+        (tmp_path / "foo").write_text("foo")
+        mocker.patch("os.read", side_effect=BlockingIOError)
+        assert inotify.read(timeout=5) == []
+
+    def test_close(self, inotify):
+        inotify.close()
+        inotify.close()
+        with pytest.raises(ValueError) as e:
+            inotify.fileno()
+        assert str(e.value) == "Inotify instance is closed"
+
+    def test_missing_dir(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            Inotify(str(tmp_path / "not-here"))
+
+    def test_init_fail(self, mocker, tmp_path):
+        libc = mocker.patch("snaphelpers._inotify._libc").return_value
+        libc.inotify_init1.return_value = -1
+        mocker.patch("ctypes.get_errno", return_value=24)
+        with pytest.raises(OSError) as e:
+            Inotify(str(tmp_path))
+        assert e.value.errno == 24
+
+    def test_not_available(self, mocker):
+        mocker.patch("ctypes.CDLL", return_value=object())
+        with pytest.raises(OSError) as e:
+            _libc()
+        assert str(e.value) == "inotify is not available"
@@ -0,0 +1,87 @@
+from threading import Thread
+
+import pytest
+
+from snaphelpers._instrument import (
+    CommandMetrics,
+    SnapCtlCall,
+    SnapCtlInstrument,
+    SnapCtlMetrics,
+)
+
+
+class TestSnapCtlCall:
+    def test_command(self):
+        call = SnapCtlCall(("get", "-d", "foo"), 0.1, 0, 10)
+        assert call.command == "get"
+
+    def test_command_no_args(self):
+        assert SnapCtlCall((), 0.1, 0, 0).command == ""
+
+
+class TestSnapCtlInstrument:
+    def test_noop(self):
+        instrument = SnapCtlInstrument()
+        instrument.before(["get", "foo"])
+        instrument.after(SnapCtlCall(("get", "foo"), 0.1, 0, 10))
+
+
+class TestCommandMetrics:
+    def test_add(self):
+        metrics = CommandMetrics([0.1, 1.0])
+        for duration in (0.05, 0.1, 0.5, 2.0):
+            metrics._add(SnapCtlCall(("get",), duration, 0, 10))
+        metrics._add(SnapCtlCall(("get",), 0.35, 1, 0))
+        assert metrics.count == 5
+        assert metrics.errors == 1
+        assert metrics.total_time == pytest.approx(3.0)
+        assert metrics.mean_time == pytest.approx(0.6)
+        assert metrics.buckets == [2, 2, 1]
+
+    def test_mean_time_no_calls(self):
+        assert CommandMetrics([1.0]).mean_time == 0.0
+
+    def test_repr(self):
+        metrics = CommandMetrics([1.0])
+        metrics._add(SnapCtlCall(("get",), 0.5, 0, 10))
+        assert repr(metrics) == (
+            "CommandMetrics(count=1, errors=0, total_time=0.500000)"
+        )
+
+
+class TestSnapCtlMetrics:
+    def test_by_command(self):
+        metrics = SnapCtlMetrics()
+        metrics.after(SnapCtlCall(("get", "foo"), 0.001, 0, 10))
+        metrics.after(SnapCtlCall(("get", "bar"), 0.2, 0, 10))
+        metrics.after(SnapCtlCall(("services",), 20.0, None, 0))
+        assert metrics.commands["get"].count == 2
+        assert metrics.commands["get"].buckets[0] == 1
+        assert metrics.commands["services"].errors == 1
+        assert metrics.commands["services"].buckets[-1] == 1
+
+    def test_bounds(self):
+        metrics = SnapCtlMetrics(bounds=[1.0, 0.1])
+        metrics.after(SnapCtlCall(("get",), 0.5, 0, 10))
+        assert metrics.bounds == (0.1, 1.0)
+        assert metrics.commands["get"].buckets == [0, 1, 0]
+
+    def test_threads(self):
+        metrics = SnapCtlMetrics()
+
+        def record():
+            for _ in range(1000):
+                metrics.after(SnapCtlCall(("get",), 0.01, 0, 10))
+
+        threads = [Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert metrics.commands["get"].count == 4000
+
+    def test_reset(self):
+        metrics = SnapCtlMetrics()
+        metrics.after(SnapCtlCall(("get",), 0.01, 0, 10))
+        metrics.reset()
+        assert metrics.commands == {}
@@ -0,0 +1,263 @@
+import asyncio
+from threading import (
+    Event,
+    Thread,
+)
+import time
+
+import pytest
+
+from snaphelpers._limit import (
+    AsyncConcurrencyLimit,
+    ConcurrencyLimit,
+)
+from snaphelpers._transport import SnapCtlTimeout
+
+
+def wait_until(condition):
+    """Wait until a condition is true."""
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+class TestConcurrencyLimit:
+    def test_invalid_max_calls(self):
+        with pytest.raises(ValueError) as e:
+            ConcurrencyLimit(max_calls=0)
+        assert str(e.value) == "Concurrency limit must be at least 1"
+
+    def test_call(self, mocker):
+        limit = ConcurrencyLimit()
+        run = mocker.Mock(return_value="output")
+        assert limit.call(["get", "foo"], run) == "output"
+        run.assert_called_once_with(["get", "foo"])
+        assert limit.calls == 1
+        assert limit.queued == 0
+
+    def test_call_timeout(self, mocker):
+        limit = ConcurrencyLimit()
+        run = mocker.Mock(return_value="output")
+        limit.call(["get", "foo"], run, timeout=5)
+        timeout = run.mock_calls[0].kwargs["timeout"]
+        assert 0 < timeout <= 5
+
+    def test_within_limit(self):
+        limit = ConcurrencyLimit(max_calls=2)
+        with limit.slot(), limit.slot():
+            assert limit.queued == 0
+
+    def test_fair_queue(self):
+        limit = ConcurrencyLimit(max_calls=1)
+        order = []
+
+        def call(index):
+            with limit.slot():
+                order.append(index)
+
+        threads = [Thread(target=call, args=(index,)) for index in range(3)]
+        with limit.slot():
+            for count, thread in enumerate(threads, 1):
+                thread.start()
+                wait_until(lambda: len(limit._waiters) == count)
+        for thread in threads:
+            thread.join()
+        assert order == [0, 1, 2]
+        assert limit.calls == 4
+        assert limit.queued == 3
+        assert limit.wait_time >= limit.max_wait_time > 0
+        assert limit._active == 0
+
+    def test_wait_timeout(self):
+        limit = ConcurrencyLimit(max_calls=1)
+        with limit.slot():
+            with pytest.raises(SnapCtlTimeout) as e:
+                with limit.slot(timeout=0.01):
+                    pass
+        assert e.value.timeout == 0.01
+        assert not limit._waiters
+        assert limit._active == 0
+
+    def test_handed_over_while_timing_out(self, mocker):
+        limit = ConcurrencyLimit(max_calls=1)
+
+        class HandoverEvent(Event):
+            def wait(self, timeout=None):
+                # the slot is released just as waiting times out
+                limit._release()
+                return False
+
+        mocker.patch("snaphelpers._limit.Event", HandoverEvent)
+        limit._active = 1
+        with limit.slot(timeout=5) as remaining:
+            assert remaining > 0
+        assert limit._active == 0
+
+    def test_release_on_error(self):
+        limit = ConcurrencyLimit(max_calls=1)
+        with pytest.raises(RuntimeError):
+            with limit.slot():
+                raise RuntimeError()
+        assert limit._active == 0
+
+
+class TestConcurrencyLimitAcrossProcesses:
+    def test_lock_files(self, tmp_path):
+        limit = ConcurrencyLimit(max_calls=2, lock_dir=tmp_path)
+        with limit.slot():
+            pass
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            "snapctl-0.lock"
+        ]
+
+    def test_shared_limit(self, tmp_path):
+        # separate instances act like separate processes
+        limit = ConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+        other_limit = ConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+        acquired = Event()
+
+        def call():
+            with other_limit.slot(timeout=5):
+                acquired.set()
+
+        with limit.slot():
+            thread = Thread(target=call)
+            thread.start()
+            assert not acquired.wait(timeout=0.05)
+        thread.join()
+        assert acquired.is_set()
+        assert other_limit.queued == 1
+
+    def test_shared_limit_timeout(self, tmp_path):
+        limit = ConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+        other_limit = ConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+        with limit.slot():
+            with pytest.raises(SnapCtlTimeout):
+                with other_limit.slot(timeout=0.05):
+                    pass
+        assert other_limit._active == 0
+        with other_limit.slot():
+            pass
+
+
+class TestAsyncConcurrencyLimit:
+    def test_fair_queue(self):
+        limit = AsyncConcurrencyLimit(max_calls=1)
+        order = []
+
+        async def call(index):
+            async with limit.slot():
+                order.append(index)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*(call(index) for index in range(3)))
+
+        asyncio.run(run())
+        assert order == [0, 1, 2]
+        assert limit.calls == 3
+        assert limit.queued == 2
+        assert limit.max_wait_time > 0
+        assert limit._active == 0
+
+    def test_remaining(self):
+        limit = AsyncConcurrencyLimit()
+
+        async def run():
+            async with limit.slot() as no_timeout:
+                async with limit.slot(timeout=5) as remaining:
+                    return no_timeout, remaining
+
+        no_timeout, remaining = asyncio.run(run())
+        assert no_timeout is None
+        assert 0 < remaining <= 5
+
+    def test_wait_timeout(self):
+        limit = AsyncConcurrencyLimit(max_calls=1)
+
+        async def run():
+            async with limit.slot():
+                with pytest.raises(SnapCtlTimeout):
+                    async with limit.slot(timeout=0.01):
+                        pass
+
+        asyncio.run(run())
+        assert not limit._waiters
+        assert limit._active == 0
+
+    def test_cancelled_while_waiting(self):
+        limit = AsyncConcurrencyLimit(max_calls=1)
+
+        async def call():
+            async with limit.slot():
+                pass
+
+        async def run():
+            async with limit.slot():
+                task = asyncio.ensure_future(call())
+                await asyncio.sleep(0)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                assert not limit._waiters
+
+        asyncio.run(run())
+        assert limit._active == 0
+
+    def test_cancelled_after_handover(self):
+        limit = AsyncConcurrencyLimit(max_calls=1)
+        order = []
+
+        async def call(index):
+            async with limit.slot():
+                order.append(index)
+
+        async def run():
+            holder = limit.slot()
+            await holder.__aenter__()
+            first = asyncio.ensure_future(call(1))
+            second = asyncio.ensure_future(call(2))
+            await asyncio.sleep(0)
+            # the slot is handed to the first task, which is then cancelled
+            await holder.__aexit__(None, None, None)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            await second
+
+        asyncio.run(run())
+        assert order == [2]
+        assert limit._active == 0
+
+    def test_shared_limit(self, tmp_path):
+        limit = ConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+        async_limit = AsyncConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+
+        async def call():
+            async with async_limit.slot(timeout=5):
+                pass
+
+        async def run():
+            with limit.slot():
+                task = asyncio.ensure_future(call())
+                await asyncio.sleep(0.05)
+                assert not task.done()
+            await task
+
+        asyncio.run(run())
+        assert async_limit.queued == 1
+
+    def test_shared_limit_timeout(self, tmp_path):
+        limit = ConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+        async_limit = AsyncConcurrencyLimit(max_calls=1, lock_dir=tmp_path)
+
+        async def run():
+            async with async_limit.slot(timeout=0.05):
+                pass
+
+        with limit.slot():
+            with pytest.raises(SnapCtlTimeout):
+                asyncio.run(run())
+        assert async_limit._active == 0
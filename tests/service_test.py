@@ -1,16 +1,38 @@
+import asyncio
+from itertools import islice
 from textwrap import dedent
 from unittest.mock import call
 
 import pytest
 
+from snaphelpers._conf import (
+    ConfigSnapshotFile,
+    SnapConfig,
+)
 from snaphelpers._ctl import (
     ServiceInfo,
     SnapCtl,
 )
 from snaphelpers._service import (
+    _Backoff,
+    _dependency_layers,
+    AsyncSnapService,
+    AsyncSnapServices,
+    ServiceCall,
+    ServiceChange,
     SnapService,
     SnapServices,
 )
+from snaphelpers._watch import ConfigDiff
+
+
+@pytest.fixture
+def config_dependencies():
+    yield {
+        "web": ["web"],
+        "db": ["web", "worker"],
+        "worker.queue": ["worker"],
+    }
 
 
 @pytest.fixture
@@ -23,20 +45,141 @@ def snap_service_status_output(snapctl):
     )
 
 
+@pytest.fixture
+def service_states():
+    """Return snapctl services output for serv1 in the specified states."""
+
+    def states(*states):
+        return [
+            dedent(
+                f"""\
+                Service               Startup   Current   Notes
+                mysnap_inst.serv1     {startup:<8}  {current:<8}  -
+                """
+            )
+            for startup, current in states
+        ]
+
+    yield states
+
+
+@pytest.fixture
+def mock_sleep(mocker):
+    yield mocker.patch("snaphelpers._service.sleep")
+
+
+@pytest.fixture
+def active_services_run():
+    """Mock snapctl run, reporting all services as active."""
+    output = dedent(
+        """\
+        Service               Startup   Current   Notes
+        mysnap_inst.db        enabled   active    -
+        mysnap_inst.cron      enabled   active    -
+        mysnap_inst.api       enabled   active    -
+        mysnap_inst.worker    enabled   active    -
+        """
+    )
+
+    def run(*args):
+        return output if args[0] == "services" else ""
+
+    yield run
+
+
+@pytest.fixture
+def watch_outputs():
+    """Successive snapctl services outputs with status changes."""
+    header = "Service               Startup   Current   Notes\n"
+    yield [
+        header
+        + "mysnap_inst.serv1     enabled   active    -\n"
+        + "mysnap_inst.serv2     disabled  inactive  -\n",
+        header
+        + "mysnap_inst.serv1     enabled   active    -\n"
+        + "mysnap_inst.serv2     disabled  inactive  -\n",
+        header
+        + "mysnap_inst.serv1     enabled   inactive  -\n"
+        + "mysnap_inst.serv2     disabled  inactive  foo\n",
+    ]
+
+
+@pytest.fixture
+def services_output():
+    yield dedent(
+        """\
+        Service               Startup   Current   Notes
+        mysnap_inst.web       enabled   active    -
+        mysnap_inst.worker    enabled   active    -
+        mysnap_inst.cron      disabled  inactive  -
+        mysnap_inst.db        disabled  active    -
+        mysnap_inst.cache     enabled   inactive  -
+        """
+    )
+
+
+class TestBackoff:
+    def test_delay(self, mocker):
+        mocker.patch("snaphelpers._service.monotonic", return_value=0.0)
+        mocker.patch("random.uniform", side_effect=lambda a, b: b)
+        backoff = _Backoff(10.0, interval=1.0, max_interval=4.0)
+        assert [backoff.delay() for _ in range(4)] == [1.0, 2.0, 4.0, 4.0]
+
+    def test_delay_jitter(self, mocker):
+        uniform = mocker.patch("random.uniform", return_value=0.5)
+        backoff = _Backoff(10.0, interval=1.0)
+        assert backoff.delay() == 0.5
+        uniform.assert_called_once_with(0.5, 1.0)
+
+    def test_delay_within_deadline(self, mocker):
+        monotonic = mocker.patch("snaphelpers._service.monotonic")
+        monotonic.return_value = 0.0
+        backoff = _Backoff(1.5, interval=1.0)
+        monotonic.return_value = 1.0
+        assert backoff.delay() == 0.5
+        monotonic.return_value = 1.5
+        assert backoff.delay() is None
+
+
+class TestDependencyLayers:
+    @pytest.mark.parametrize(
+        "graph,layers",
+        [
+            ({}, []),
+            ({"web": []}, [["web"]]),
+            (
+                {"api": ["db"], "worker": ["api", "db"], "cron": []},
+                [["cron", "db"], ["api"], ["worker"]],
+            ),
+            (
+                {"web": ["api", "static"], "api": ["db"]},
+                [["db", "static"], ["api"], ["web"]],
+            ),
+        ],
+    )
+    def test_layers(self, graph, layers):
+        assert _dependency_layers(graph) == layers
+
+    def test_cycle(self):
+        with pytest.raises(ValueError) as e:
+            _dependency_layers({"a": ["b"], "b": ["c"], "c": ["b"]})
+        assert str(e.value) == "Cyclic services dependencies: a, b, c"
+
+
 class TestSnapService:
     def test_attrs(self, snapctl):
         info = ServiceInfo(
-            name="serv1", enabled=True, active=False, notes=["foo", "bar"]
+            name="serv1", enabled=True, active=False, notes=("foo", "bar")
         )
         service = SnapService(info, snapctl=snapctl)
         assert service.name == "serv1"
         assert service.enabled
         assert not service.active
-        assert service.notes == ["foo", "bar"]
+        assert service.notes == ("foo", "bar")
 
     def test_eq(self, snapctl):
         info = ServiceInfo(
-            name="serv1", enabled=True, active=False, notes=["foo", "bar"]
+            name="serv1", enabled=True, active=False, notes=("foo", "bar")
         )
         assert SnapService(info, snapctl=snapctl) == SnapService(
             info, snapctl=snapctl
@@ -44,10 +187,10 @@ class TestSnapService:
 
     def test_eq_other_info(self, snapctl):
         info1 = ServiceInfo(
-            name="serv1", enabled=True, active=False, notes=["foo", "bar"]
+            name="serv1", enabled=True, active=False, notes=("foo", "bar")
         )
         info2 = ServiceInfo(
-            name="serv2", enabled=True, active=False, notes=["foo", "bar"]
+            name="serv2", enabled=True, active=False, notes=("foo", "bar")
         )
         assert SnapService(info1, snapctl=snapctl) != SnapService(
             info2, snapctl=snapctl
@@ -55,7 +198,7 @@ class TestSnapService:
 
     def test_eq_other_snapctl(self, snapctl):
         info = ServiceInfo(
-            name="serv1", enabled=True, active=False, notes=["foo", "bar"]
+            name="serv1", enabled=True, active=False, notes=("foo", "bar")
         )
         assert SnapService(info, snapctl=snapctl) != SnapService(
             info, snapctl=SnapCtl()
@@ -63,14 +206,14 @@ class TestSnapService:
 
     def test_eq_different_object(self, snapctl):
         info = ServiceInfo(
-            name="serv", enabled=True, active=False, notes=["foo", "bar"]
+            name="serv", enabled=True, active=False, notes=("foo", "bar")
         )
         assert SnapService(info, snapctl=snapctl) != object()
 
     @pytest.mark.parametrize("action", ["start", "stop", "restart"])
     def test_actions(self, action, snapctl, snap_service_status_output):
         snapctl.run.side_effect = ["", snap_service_status_output]
-        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=[])
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
         service = SnapService(info, snapctl=snapctl)
         getattr(service, action)()
         assert snapctl.run.mock_calls == [
@@ -86,7 +229,7 @@ class TestSnapService:
         self, action, option, snapctl, snap_service_status_output
     ):
         snapctl.run.side_effect = ["", snap_service_status_output]
-        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=[])
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
         service = SnapService(info, snapctl=snapctl)
         getattr(service, action)(**{option: True})
         assert snapctl.run.mock_calls == [
@@ -94,14 +237,51 @@ class TestSnapService:
             call("services", "mysnap_inst.serv1"),
         ]
 
+    @pytest.mark.parametrize("action", ["start", "stop", "restart"])
+    def test_actions_no_refresh(self, action, snapctl):
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
+        service = SnapService(info, snapctl=snapctl)
+        getattr(service, action)(refresh=False)
+        assert snapctl.run.mock_calls == [call(action, "mysnap_inst.serv1")]
+        assert service.active
+
     def test_refresh_status(self, snapctl, snap_service_status_output):
         snapctl.run.return_value = snap_service_status_output
-        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=[])
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
         service = SnapService(info, snapctl=snapctl)
         service.refresh_status()
         assert not service.enabled
         assert not service.active
-        assert service.notes == ["foo", "bar"]
+        assert service.notes == ("foo", "bar")
+
+    def test_wait_until(self, snapctl, service_states, mock_sleep):
+        snapctl.run.side_effect = service_states(
+            ("enabled", "inactive"),
+            ("enabled", "inactive"),
+            ("enabled", "active"),
+        )
+        info = ServiceInfo(name="serv1", enabled=True, active=False, notes=())
+        service = SnapService(info, snapctl=snapctl)
+        assert service.wait_until()
+        assert service.active
+        assert len(snapctl.run.mock_calls) == 3
+        assert mock_sleep.call_count == 2
+
+    def test_wait_until_enabled(self, snapctl, service_states, mock_sleep):
+        snapctl.run.side_effect = service_states(
+            ("enabled", "active"), ("disabled", "inactive")
+        )
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
+        service = SnapService(info, snapctl=snapctl)
+        assert service.wait_until(active=False, enabled=False)
+        mock_sleep.assert_called_once()
+
+    def test_wait_until_timeout(self, snapctl, service_states, mock_sleep):
+        snapctl.run.side_effect = service_states(("enabled", "inactive"))
+        info = ServiceInfo(name="serv1", enabled=True, active=False, notes=())
+        service = SnapService(info, snapctl=snapctl)
+        assert not service.wait_until(timeout=0)
+        mock_sleep.assert_not_called()
 
 
 class TestSnapServices:
@@ -111,16 +291,465 @@ class TestSnapServices:
         getattr(services, action)()
         assert snapctl.run.mock_calls == [call(action, "mysnap_inst")]
 
+    @pytest.mark.parametrize(
+        "action, option",
+        [("start", "enable"), ("stop", "disable"), ("restart", "reload")],
+    )
+    def test_actions_services(self, action, option, snapctl):
+        services = SnapServices(snapctl=snapctl)
+        getattr(services, action)("web", "worker", **{option: True})
+        assert snapctl.run.mock_calls == [
+            call(
+                action, f"--{option}", "mysnap_inst.web", "mysnap_inst.worker"
+            )
+        ]
+
+    def test_refresh_all(self, snapctl, services_output):
+        snapctl.run.return_value = services_output
+        info = ServiceInfo(name="", enabled=False, active=False, notes=())
+        web = SnapService(info._replace(name="web"), snapctl=snapctl)
+        cache = SnapService(info._replace(name="cache"), snapctl=snapctl)
+        services = SnapServices(snapctl=snapctl)
+        services.refresh_all([web, cache])
+        assert snapctl.run.mock_calls == [
+            call("services", "mysnap_inst.web", "mysnap_inst.cache")
+        ]
+        assert web.enabled
+        assert web.active
+        assert cache.enabled
+        assert not cache.active
+
+    def test_refresh_all_empty(self, snapctl):
+        services = SnapServices(snapctl=snapctl)
+        services.refresh_all([])
+        snapctl.run.assert_not_called()
+
+    def test_wait_all(self, snapctl, services_output, mock_sleep):
+        snapctl.run.side_effect = [
+            services_output,
+            services_output.replace("inactive", "active "),
+        ]
+        services = SnapServices(snapctl=snapctl)
+        assert services.wait_all("web", "cache", "cron")
+        assert (
+            snapctl.run.mock_calls
+            == [
+                call(
+                    "services",
+                    "mysnap_inst.web",
+                    "mysnap_inst.cache",
+                    "mysnap_inst.cron",
+                )
+            ]
+            * 2
+        )
+        mock_sleep.assert_called_once()
+
+    def test_wait_all_timeout(self, snapctl, services_output, mock_sleep):
+        snapctl.run.return_value = services_output
+        services = SnapServices(snapctl=snapctl)
+        assert not services.wait_all(active=False, timeout=0)
+        assert snapctl.run.mock_calls == [call("services", "mysnap_inst")]
+
     def test_list(self, fake_snapctl):
         services = SnapServices(snapctl=fake_snapctl)
         info1 = ServiceInfo(
-            name="serv1", enabled=True, active=False, notes=["foo"]
+            name="serv1", enabled=True, active=False, notes=("foo",)
         )
         info2 = ServiceInfo(
-            name="serv2", enabled=False, active=True, notes=["bar"]
+            name="serv2", enabled=False, active=True, notes=("bar",)
         )
         fake_snapctl._services = [info1, info2]
         assert services.list() == {
             "serv1": SnapService(info1, snapctl=fake_snapctl),
             "serv2": SnapService(info2, snapctl=fake_snapctl),
         }
+
+    @pytest.mark.parametrize(
+        "diff,affected",
+        [
+            (ConfigDiff([], [], []), []),
+            (ConfigDiff([], [], ["web.port"]), ["web"]),
+            (ConfigDiff(["db"], [], []), ["web", "worker"]),
+            (ConfigDiff([], ["worker"], []), ["worker"]),
+            (ConfigDiff([], [], ["worker.threads"]), []),
+            (ConfigDiff([], [], ["other"]), []),
+        ],
+    )
+    def test_affected_services(
+        self, snapctl, config_dependencies, diff, affected
+    ):
+        services = SnapServices(
+            snapctl=snapctl, config_dependencies=config_dependencies
+        )
+        assert services.affected_services(diff) == affected
+
+    def test_restart_affected(self, snapctl, config_dependencies):
+        services = SnapServices(
+            snapctl=snapctl, config_dependencies=config_dependencies
+        )
+        diff = ConfigDiff([], [], ["db.host", "web.port"])
+        assert services.restart_affected(diff, reload=True) == [
+            "web",
+            "worker",
+        ]
+        assert snapctl.run.mock_calls == [
+            call(
+                "restart",
+                "--reload",
+                "mysnap_inst.web",
+                "mysnap_inst.worker",
+            )
+        ]
+
+    def test_restart_affected_saved_snapshot(
+        self, tmp_path, snapctl, fake_snapctl
+    ):
+        config = SnapConfig(
+            snapctl=fake_snapctl,
+            snapshot_file=ConfigSnapshotFile(
+                tmp_path / "config.json", revision="123"
+            ),
+        )
+        config.save_snapshot()
+        # the configure hook normalizes configuration before saving it
+        config.set({"foo": 456})
+        services = SnapServices(
+            snapctl=snapctl,
+            config_dependencies={"foo": ["web"], "bar": ["worker"]},
+        )
+        assert services.restart_affected(config.save_snapshot()) == ["web"]
+        snapctl.run.assert_called_once_with("restart", "mysnap_inst.web")
+
+    def test_restart_affected_none(self, snapctl, config_dependencies):
+        services = SnapServices(
+            snapctl=snapctl, config_dependencies=config_dependencies
+        )
+        assert services.restart_affected(ConfigDiff(["other"], [], [])) == []
+        snapctl.run.assert_not_called()
+
+    def test_reconcile(self, snapctl, services_output):
+        snapctl.run.return_value = services_output
+        services = SnapServices(snapctl=snapctl)
+        calls = services.reconcile(
+            {
+                "web": "active+enabled",
+                "worker": "inactive+disabled",
+                "cron": "active+enabled",
+                "db": "active+enabled",
+                "cache": "active",
+            }
+        )
+        assert calls == [
+            ServiceCall("stop", ["worker"], ["disable"]),
+            ServiceCall("start", ["cron", "db"], ["enable"]),
+            ServiceCall("start", ["cache"], []),
+        ]
+        assert snapctl.run.mock_calls == [
+            call("services", "mysnap_inst"),
+            call("stop", "--disable", "mysnap_inst.worker"),
+            call("start", "--enable", "mysnap_inst.cron", "mysnap_inst.db"),
+            call("start", "mysnap_inst.cache"),
+        ]
+
+    @pytest.mark.parametrize(
+        "desired,calls",
+        [
+            ({"web": "active", "cron": "inactive"}, []),
+            ({"web": "enabled", "cron": "disabled"}, []),
+            (
+                {"web": "inactive", "db": "inactive"},
+                [ServiceCall("stop", ["web", "db"], [])],
+            ),
+            (
+                {"web": "active+disabled"},
+                [
+                    ServiceCall("stop", ["web"], ["disable"]),
+                    ServiceCall("start", ["web"], []),
+                ],
+            ),
+            (
+                {"cron": "inactive+enabled"},
+                [
+                    ServiceCall("start", ["cron"], ["enable"]),
+                    ServiceCall("stop", ["cron"], []),
+                ],
+            ),
+            (
+                {"web": "restarted", "cron": "restarted+enabled"},
+                [
+                    ServiceCall("start", ["cron"], ["enable"]),
+                    ServiceCall("restart", ["web", "cron"], []),
+                ],
+            ),
+        ],
+    )
+    def test_reconcile_calls(self, snapctl, services_output, desired, calls):
+        snapctl.run.return_value = services_output
+        services = SnapServices(snapctl=snapctl)
+        assert services.reconcile(desired) == calls
+        assert len(snapctl.run.mock_calls) == len(calls) + 1
+
+    @pytest.mark.parametrize(
+        "state", ["running", "active+inactive", "active+", ""]
+    )
+    def test_reconcile_invalid_state(self, snapctl, services_output, state):
+        snapctl.run.return_value = services_output
+        services = SnapServices(snapctl=snapctl)
+        with pytest.raises(ValueError) as e:
+            services.reconcile({"web": state})
+        assert str(e.value) == f"Invalid service state: {state}"
+
+    def test_reconcile_unknown_service(self, snapctl, services_output):
+        snapctl.run.return_value = services_output
+        services = SnapServices(snapctl=snapctl)
+        with pytest.raises(ValueError) as e:
+            services.reconcile({"other": "active"})
+        assert str(e.value) == "Unknown service: other"
+        assert len(snapctl.run.mock_calls) == 1
+
+    def test_start_ordered(self, snapctl, active_services_run, mock_sleep):
+        snapctl.run.side_effect = active_services_run
+        services = SnapServices(snapctl=snapctl)
+        layers = services.start_ordered(
+            {"api": ["db"], "worker": ["api"], "cron": []}, enable=True
+        )
+        assert layers == [["cron", "db"], ["api"], ["worker"]]
+        assert snapctl.run.mock_calls == [
+            call("start", "--enable", "mysnap_inst.cron", "mysnap_inst.db"),
+            call("services", "mysnap_inst.cron", "mysnap_inst.db"),
+            call("start", "--enable", "mysnap_inst.api"),
+            call("services", "mysnap_inst.api"),
+            call("start", "--enable", "mysnap_inst.worker"),
+        ]
+        mock_sleep.assert_not_called()
+
+    def test_start_ordered_timeout(self, snapctl, services_output):
+        snapctl.run.side_effect = ["", services_output]
+        services = SnapServices(snapctl=snapctl)
+        with pytest.raises(TimeoutError) as e:
+            services.start_ordered({"web": ["cache"]}, timeout=0)
+        assert str(e.value) == "Services not active: cache"
+        assert snapctl.run.mock_calls == [
+            call("start", "mysnap_inst.cache"),
+            call("services", "mysnap_inst.cache"),
+        ]
+
+    def test_start_ordered_cycle(self, snapctl):
+        services = SnapServices(snapctl=snapctl)
+        with pytest.raises(ValueError):
+            services.start_ordered({"web": ["web"]})
+        snapctl.run.assert_not_called()
+
+    def test_watch(self, snapctl, watch_outputs, mock_sleep):
+        snapctl.run.side_effect = watch_outputs
+        services = SnapServices(snapctl=snapctl)
+        changes = list(islice(services.watch(interval=5), 4))
+        serv1, serv2 = changes[0].service, changes[1].service
+        assert changes == [
+            ServiceChange(serv1, None, ("enabled", "active", "notes")),
+            ServiceChange(serv2, None, ("enabled", "active", "notes")),
+            ServiceChange(
+                serv1,
+                ServiceInfo(name="serv1", enabled=True, active=True, notes=()),
+                ("active",),
+            ),
+            ServiceChange(
+                serv2,
+                ServiceInfo(
+                    name="serv2", enabled=False, active=False, notes=()
+                ),
+                ("notes",),
+            ),
+        ]
+        # services are updated in place
+        assert changes[2].service is serv1
+        assert not serv1.active
+        assert serv2.notes == ("foo",)
+        assert len(snapctl.run.mock_calls) == 3
+        assert mock_sleep.mock_calls == [call(5), call(5)]
+
+
+class TestAsyncSnapService:
+    def test_attrs(self, async_snapctl):
+        info = ServiceInfo(name="serv1", enabled=True, active=False, notes=())
+        service = AsyncSnapService(info, snapctl=async_snapctl)
+        assert service.name == "serv1"
+        assert service.enabled
+        assert service == AsyncSnapService(info, snapctl=async_snapctl)
+        assert service != SnapService(info)
+
+    @pytest.mark.parametrize(
+        "action, option",
+        [("start", "enable"), ("stop", "disable"), ("restart", "reload")],
+    )
+    def test_actions(
+        self, action, option, async_snapctl, snap_service_status_output
+    ):
+        async_snapctl.run.side_effect = ["", snap_service_status_output]
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
+        service = AsyncSnapService(info, snapctl=async_snapctl)
+        asyncio.run(getattr(service, action)(**{option: True}))
+        assert async_snapctl.run.mock_calls == [
+            call(action, f"--{option}", "mysnap_inst.serv1"),
+            call("services", "mysnap_inst.serv1"),
+        ]
+        assert not service.enabled
+        assert not service.active
+        assert service.notes == ("foo", "bar")
+
+    @pytest.mark.parametrize("action", ["start", "stop", "restart"])
+    def test_actions_no_refresh(self, action, async_snapctl):
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
+        service = AsyncSnapService(info, snapctl=async_snapctl)
+        asyncio.run(getattr(service, action)(refresh=False))
+        assert async_snapctl.run.mock_calls == [
+            call(action, "mysnap_inst.serv1")
+        ]
+
+    def test_wait_until(self, mocker, async_snapctl, service_states):
+        sleep = mocker.patch("asyncio.sleep")
+        async_snapctl.run.side_effect = service_states(
+            ("enabled", "inactive"), ("enabled", "active")
+        )
+        info = ServiceInfo(name="serv1", enabled=True, active=False, notes=())
+        service = AsyncSnapService(info, snapctl=async_snapctl)
+        assert asyncio.run(service.wait_until(enabled=True))
+        assert service.active
+        sleep.assert_awaited_once()
+
+    def test_wait_until_timeout(self, async_snapctl, service_states):
+        async_snapctl.run.side_effect = service_states(("enabled", "active"))
+        info = ServiceInfo(name="serv1", enabled=True, active=True, notes=())
+        service = AsyncSnapService(info, snapctl=async_snapctl)
+        assert not asyncio.run(service.wait_until(active=False, timeout=0))
+
+
+class TestAsyncSnapServices:
+    @pytest.mark.parametrize("action", ["start", "stop", "restart"])
+    def test_actions(self, action, async_snapctl):
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        asyncio.run(getattr(services, action)())
+        assert async_snapctl.run.mock_calls == [call(action, "mysnap_inst")]
+
+    @pytest.mark.parametrize("action", ["start", "stop", "restart"])
+    def test_actions_services(self, action, async_snapctl):
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        asyncio.run(getattr(services, action)("web"))
+        assert async_snapctl.run.mock_calls == [
+            call(action, "mysnap_inst.web")
+        ]
+
+    def test_refresh_all(self, async_snapctl, services_output):
+        async_snapctl.run.return_value = services_output
+        info = ServiceInfo(name="cron", enabled=True, active=True, notes=())
+        cron = AsyncSnapService(info, snapctl=async_snapctl)
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        asyncio.run(services.refresh_all([cron]))
+        assert async_snapctl.run.mock_calls == [
+            call("services", "mysnap_inst.cron")
+        ]
+        assert not cron.enabled
+        assert not cron.active
+
+    def test_refresh_all_empty(self, async_snapctl):
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        asyncio.run(services.refresh_all([]))
+        async_snapctl.run.assert_not_called()
+
+    def test_list(self, fake_snapctl, fake_async_snapctl):
+        services = AsyncSnapServices(snapctl=fake_async_snapctl)
+        info = ServiceInfo(
+            name="serv1", enabled=True, active=False, notes=("foo",)
+        )
+        fake_snapctl._services = [info]
+        assert asyncio.run(services.list()) == {
+            "serv1": AsyncSnapService(info, snapctl=fake_async_snapctl),
+        }
+
+    def test_restart_affected(self, async_snapctl, config_dependencies):
+        services = AsyncSnapServices(
+            snapctl=async_snapctl, config_dependencies=config_dependencies
+        )
+        diff = ConfigDiff([], [], ["web.port"])
+        assert asyncio.run(services.restart_affected(diff)) == ["web"]
+        assert async_snapctl.run.mock_calls == [
+            call("restart", "mysnap_inst.web")
+        ]
+
+    def test_restart_affected_none(self, async_snapctl):
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        diff = ConfigDiff([], [], ["web.port"])
+        assert asyncio.run(services.restart_affected(diff)) == []
+        async_snapctl.run.assert_not_called()
+
+    def test_reconcile(self, async_snapctl, services_output):
+        async_snapctl.run.return_value = services_output
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        calls = asyncio.run(
+            services.reconcile({"web": "inactive", "cron": "active+enabled"})
+        )
+        assert calls == [
+            ServiceCall("start", ["cron"], ["enable"]),
+            ServiceCall("stop", ["web"], []),
+        ]
+        assert async_snapctl.run.mock_calls == [
+            call("services", "mysnap_inst"),
+            call("start", "--enable", "mysnap_inst.cron"),
+            call("stop", "mysnap_inst.web"),
+        ]
+
+    def test_wait_all(self, mocker, async_snapctl, services_output):
+        sleep = mocker.patch("asyncio.sleep")
+        async_snapctl.run.side_effect = [
+            services_output,
+            services_output.replace("active", "inactive"),
+        ]
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        assert asyncio.run(services.wait_all("web", "worker", active=False))
+        sleep.assert_awaited_once()
+
+    def test_wait_all_timeout(self, async_snapctl, services_output):
+        async_snapctl.run.return_value = services_output
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        assert not asyncio.run(services.wait_all(timeout=0))
+
+    def test_start_ordered(self, async_snapctl, active_services_run):
+        async_snapctl.run.side_effect = active_services_run
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        layers = asyncio.run(services.start_ordered({"api": ["db"]}))
+        assert layers == [["db"], ["api"]]
+        assert async_snapctl.run.mock_calls == [
+            call("start", "mysnap_inst.db"),
+            call("services", "mysnap_inst.db"),
+            call("start", "mysnap_inst.api"),
+        ]
+
+    def test_start_ordered_timeout(self, async_snapctl, services_output):
+        async_snapctl.run.side_effect = ["", services_output]
+        services = AsyncSnapServices(snapctl=async_snapctl)
+        with pytest.raises(TimeoutError):
+            asyncio.run(services.start_ordered({"web": ["cache"]}, timeout=0))
+
+    def test_watch(self, mocker, async_snapctl, watch_outputs):
+        sleep = mocker.patch("asyncio.sleep")
+        async_snapctl.run.side_effect = watch_outputs
+        services = AsyncSnapServices(snapctl=async_snapctl)
+
+        async def watch():
+            changes = []
+            async for change in services.watch():
+                changes.append(change)
+                if len(changes) == 3:
+                    return changes
+
+        changes = asyncio.run(watch())
+        assert [change.service.name for change in changes] == [
+            "serv1",
+            "serv2",
+            "serv1",
+        ]
+        assert changes[2].service is changes[0].service
+        assert changes[2].changed == ("active",)
+        assert isinstance(changes[0].service, AsyncSnapService)
+        assert sleep.mock_calls == [call(1.0), call(1.0)]
@@ -0,0 +1,244 @@
+import json
+import mmap
+import multiprocessing
+import os
+from textwrap import dedent
+
+import pytest
+
+from snaphelpers._conf import SnapConfig
+from snaphelpers._ctl import SnapCtl
+from snaphelpers._env import SnapEnviron
+from snaphelpers._shared import SharedConfigCache
+from snaphelpers._transport import ExecTransport
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    yield tmp_path / "config.cache"
+
+
+@pytest.fixture
+def shared_cache(cache_path):
+    cache = SharedConfigCache(cache_path)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def other_cache(cache_path):
+    cache = SharedConfigCache(cache_path)
+    yield cache
+    cache.close()
+
+
+class TestSharedConfigCache:
+    def test_empty(self, shared_cache):
+        assert shared_cache.read() is None
+        assert shared_cache.generation() == 0
+
+    def test_file_created(self, cache_path, shared_cache):
+        shared_cache.generation()
+        assert cache_path.stat().st_mode & 0o777 == 0o600
+
+    def test_publish_read(self, shared_cache, snap_config):
+        generation = shared_cache.publish(snap_config)
+        assert generation == 2
+        assert shared_cache.read() == (2, snap_config)
+
+    def test_read_same_object(self, shared_cache, other_cache, snap_config):
+        other_cache.publish(snap_config)
+        _, config = shared_cache.read()
+        assert shared_cache.read()[1] is config
+
+    def test_read_other_process(self, shared_cache, other_cache, snap_config):
+        shared_cache.publish({"foo": "bar"})
+        assert other_cache.read() == (2, {"foo": "bar"})
+        shared_cache.publish(snap_config)
+        assert other_cache.read() == (4, snap_config)
+
+    def test_read_larger_content(self, shared_cache, other_cache):
+        shared_cache.publish({"foo": "bar"})
+        other_cache.read()
+        config = {"foo": "x" * mmap.PAGESIZE * 4}
+        shared_cache.publish(config)
+        assert other_cache.read() == (4, config)
+
+    def test_read_update_in_progress(self, mocker, shared_cache, other_cache):
+        shared_cache.publish({"foo": "bar"})
+        lock = mocker.spy(other_cache, "_lock")
+        # simulate a writer in progress
+        shared_cache._GENERATION.pack_into(
+            shared_cache._mmap, shared_cache._GENERATION_OFFSET, 3
+        )
+        assert other_cache.read() == (3, {"foo": "bar"})
+        lock.assert_called_once()
+
+    def test_read_locked_larger_content(
+        self, mocker, shared_cache, other_cache
+    ):
+        mocker.patch.object(other_cache, "_READ_ATTEMPTS", 0)
+        shared_cache.publish({"foo": "bar"})
+        other_cache.read()
+        config = {"foo": "x" * mmap.PAGESIZE * 4}
+        shared_cache.publish(config)
+        assert other_cache.read() == (4, config)
+
+    def test_read_locked_unchanged(self, mocker, shared_cache):
+        mocker.patch.object(shared_cache, "_READ_ATTEMPTS", 0)
+        shared_cache.publish({"foo": "bar"})
+        assert shared_cache.read() == (2, {"foo": "bar"})
+
+    def test_publish_after_interrupted_write(self, shared_cache):
+        shared_cache.publish({"foo": "bar"})
+        shared_cache._GENERATION.pack_into(
+            shared_cache._mmap, shared_cache._GENERATION_OFFSET, 3
+        )
+        assert shared_cache.publish({"foo": "baz"}) == 6
+
+    def test_publish_shorter_content(self, shared_cache, other_cache):
+        shared_cache.publish({"foo": "x" * 100})
+        shared_cache.publish({"foo": "bar"})
+        assert other_cache.read() == (4, {"foo": "bar"})
+
+    def test_publish_smaller_mapping(
+        self, cache_path, shared_cache, other_cache
+    ):
+        # the other instance only maps the header
+        assert other_cache.read() is None
+        shared_cache.publish({"foo": "x" * 10000})
+        size = cache_path.stat().st_size
+        other_cache.publish({"foo": "bar"})
+        # the file is not shrunk under the larger mapping
+        assert cache_path.stat().st_size == size
+        assert len(shared_cache._mmap) == size
+        assert shared_cache.read() == (4, {"foo": "bar"})
+
+    def test_invalidate(self, shared_cache, other_cache, snap_config):
+        shared_cache.publish(snap_config)
+        other_cache.read()
+        shared_cache.invalidate()
+        assert shared_cache.generation() == 4
+        assert other_cache.read() is None
+
+    def test_get_or_publish(self, mocker, shared_cache, snap_config):
+        fetch = mocker.Mock(return_value=snap_config)
+        assert shared_cache.get_or_publish(fetch) == (2, snap_config)
+        assert shared_cache.get_or_publish(fetch) == (2, snap_config)
+        fetch.assert_called_once_with()
+
+    def test_get_or_publish_other_process(
+        self, mocker, shared_cache, other_cache, snap_config
+    ):
+        other_cache.publish(snap_config)
+        fetch = mocker.Mock()
+        assert shared_cache.get_or_publish(fetch) == (2, snap_config)
+        fetch.assert_not_called()
+
+    def test_get_or_publish_published_while_waiting(
+        self, mocker, shared_cache, other_cache, snap_config
+    ):
+        # another process publishes content after the lockless read
+        mocker.patch.object(
+            shared_cache,
+            "read",
+            side_effect=lambda: other_cache.publish(snap_config) and None,
+        )
+        fetch = mocker.Mock()
+        assert shared_cache.get_or_publish(fetch) == (2, snap_config)
+        fetch.assert_not_called()
+
+    def test_invalid_file(self, cache_path):
+        cache_path.write_bytes(b"X" * 32)
+        cache = SharedConfigCache(cache_path)
+        with pytest.raises(ValueError) as error:
+            cache.read()
+        assert str(error.value) == (
+            f"Invalid shared config cache file: {cache_path}"
+        )
+        assert cache._fd is None
+
+    def test_map_failure(self, mocker, shared_cache):
+        mocker.patch("mmap.mmap", side_effect=OSError("fail"))
+        close = mocker.spy(os, "close")
+        with pytest.raises(OSError):
+            shared_cache.read()
+        close.assert_called_once()
+        assert shared_cache._fd is None
+
+    def test_revision(self, cache_path, shared_cache):
+        shared_cache.publish({"foo": "bar"})
+        cache = SharedConfigCache(cache_path, revision="124")
+        assert cache.read() is None
+        cache.publish({"foo": "baz"})
+        assert cache.read() == (4, {"foo": "baz"})
+        assert shared_cache.read() is None
+        cache.close()
+
+    def test_reopen_after_fork(self, mocker, shared_cache):
+        shared_cache.publish({"foo": "bar"})
+        fd = shared_cache._fd
+        close = mocker.spy(os, "close")
+        mocker.patch("os.getpid", return_value=shared_cache._pid + 1)
+        assert shared_cache.read() == (2, {"foo": "bar"})
+        close.assert_called_once_with(fd)
+
+    def test_close(self, shared_cache):
+        shared_cache.publish({"foo": "bar"})
+        shared_cache.close()
+        assert shared_cache._fd is None
+        assert shared_cache._mmap is None
+        # the file is opened again when needed
+        assert shared_cache.read() == (2, {"foo": "bar"})
+
+
+def _read_config(snap_env, executable, shared_cache, results):
+    snapctl = SnapCtl(
+        env=SnapEnviron(environ=snap_env),
+        transport=ExecTransport(str(executable)),
+    )
+    config = SnapConfig(snapctl=snapctl, shared_cache=shared_cache)
+    results.put(config.get("foo.bar"))
+
+
+class TestSharedConfigCacheProcesses:
+    @pytest.mark.parametrize("open_before_fork", [True, False])
+    def test_single_fetch(
+        self, tmp_path, snap_env, cache_path, open_before_fork
+    ):
+        log = tmp_path / "calls.log"
+        executable = tmp_path / "snapctl"
+        executable.write_text(
+            dedent(
+                f"""\
+                #!/bin/sh
+                echo "$@" >> {log}
+                sleep 0.1
+                echo '{json.dumps({"foo": {"bar": "baz"}})}'
+                """
+            )
+        )
+        executable.chmod(0o755)
+        cache = SharedConfigCache(cache_path)
+        if open_before_fork:
+            # workers inherit the file descriptor
+            assert cache.read() is None
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=_read_config,
+                args=(snap_env, executable, cache, results),
+            )
+            for _ in range(8)
+        ]
+        for worker in workers:
+            worker.start()
+        values = [results.get(timeout=10) for _ in workers]
+        for worker in workers:
+            worker.join(timeout=10)
+            assert worker.exitcode == 0
+        assert values == ["baz"] * 8
+        assert log.read_text() == "get -d\n"
+        cache.close()
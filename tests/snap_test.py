@@ -2,7 +2,13 @@ from pathlib import Path
 
 import pytest
 
-from snaphelpers._snap import Snap
+from snaphelpers._conf import AsyncSnapConfig
+from snaphelpers._health import AsyncSnapHealth
+from snaphelpers._service import AsyncSnapServices
+from snaphelpers._snap import (
+    AsyncSnap,
+    Snap,
+)
 
 
 class TestSnap:
@@ -21,3 +27,39 @@ class TestSnap:
         snap = Snap(environ=snap_env)
         assert snap.paths.snap == Path("/snap/mysnap/123")
         assert snap.paths.common == Path("/var/snap/mysnap/common")
+
+    def test_prefetch_config(self, snap_env):
+        snap = Snap(environ=snap_env, prefetch_config=True)
+        assert snap.config._prefetch
+
+    def test_config_snapshot_file(self, snap_env):
+        snap = Snap(environ=snap_env)
+        snapshot_file = snap.config._snapshot_file
+        assert snapshot_file.path == Path(
+            "/var/snap/mysnap/123/snaphelpers-config.json"
+        )
+        assert snapshot_file.revision == "123"
+
+    def test_shared_config(self, snap_env):
+        snap = Snap(environ=snap_env, shared_config=True)
+        assert snap.config._shared_cache.path == Path(
+            "/var/snap/mysnap/common/snaphelpers-config.cache"
+        )
+
+    def test_no_shared_config(self, snap_env):
+        snap = Snap(environ=snap_env)
+        assert snap.config._shared_cache is None
+
+
+class TestAsyncSnap:
+    def test_str(self, snap_env):
+        snap = AsyncSnap(environ=snap_env)
+        assert str(snap) == "AsyncSnap(mysnap 0.1.2 123)"
+
+    def test_attributes(self, snap_env):
+        snap = AsyncSnap(environ=snap_env)
+        assert snap.instance_name == "mysnap_inst"
+        assert snap.paths.data == Path("/var/snap/mysnap/123")
+        assert isinstance(snap.config, AsyncSnapConfig)
+        assert isinstance(snap.health, AsyncSnapHealth)
+        assert isinstance(snap.services, AsyncSnapServices)
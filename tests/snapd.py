@@ -0,0 +1,94 @@
+"""A stand-in for the snapd REST API, serving on a UNIX socket."""
+
+from http.server import BaseHTTPRequestHandler
+import json
+from pathlib import Path
+from socketserver import ThreadingUnixStreamServer
+from threading import Thread
+
+
+class SnapdRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.snapd.connections += 1
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client dropped the connection
+            pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        request = json.loads(self.rfile.read(length))
+        snapd = self.server.snapd
+        snapd.requests.append(request)
+        stdout, stderr, exit_code = snapd.handler(request["args"])
+        if exit_code:
+            response = {
+                "type": "error",
+                "status-code": 200,
+                "result": {
+                    "message": stderr,
+                    "kind": "unsuccessful",
+                    "value": {
+                        "stdout": stdout,
+                        "stderr": stderr,
+                        "exit-code": exit_code,
+                    },
+                },
+            }
+        else:
+            response = {
+                "type": "sync",
+                "status-code": 200,
+                "result": {"stdout": stdout, "stderr": stderr},
+            }
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if snapd.close_connections:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSnapd:
+    """Serve the ``/v2/snapctl`` endpoint on a UNIX socket.
+
+    Commands are handled by the ``handler`` callable, which is called with the
+    command arguments and returns a tuple with stdout, stderr and exit code.
+
+    """
+
+    def __init__(self, socket_path: Path):
+        self.socket_path = socket_path
+        self.requests = []
+        self.connections = 0
+        self.close_connections = False
+        self.handler = lambda args: ("", "", 0)
+        self._server = ThreadingUnixStreamServer(
+            str(socket_path), SnapdRequestHandler
+        )
+        self._server.daemon_threads = True
+        self._server.snapd = self
+        self._thread = Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.01},
+            daemon=True,
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,448 @@
+from pathlib import Path
+import signal
+from subprocess import (
+    PIPE,
+    Popen,
+)
+from textwrap import dedent
+import time
+
+import pytest
+
+from snaphelpers._ctl import SnapCtl
+from snaphelpers._transport import (
+    _MAX_ARG_SIZE,
+    ExecTransport,
+    is_read_only,
+    SnapCtlError,
+    SnapCtlTimeout,
+    SnapCtlTransport,
+    SocketTransport,
+)
+
+
+@pytest.mark.parametrize(
+    "args,read_only",
+    [
+        ([], False),
+        (["get", "-d", "foo"], True),
+        (["is-connected", "myplug"], True),
+        (["services"], True),
+        (["system-mode"], True),
+        (["refresh", "--pending"], True),
+        (["refresh", "--pending", "--hold"], False),
+        (["set", "foo=1"], False),
+        (["start", "mysnap.svc"], False),
+    ],
+)
+def test_is_read_only(args, read_only):
+    assert is_read_only(args) == read_only
+
+
+class TestSnapCtlError:
+    def test_message(self):
+        error = SnapCtlError(2, "error: failed\n")
+        assert error.returncode == 2
+        assert error.error == "error: failed\n"
+        assert str(error) == (
+            "Call to snapctl failed with error 2: error: failed\n"
+        )
+
+    def test_from_process(self):
+        process = Popen(
+            ["sh", "-c", "echo 'error: failed' >&2; exit 2"],
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        process.wait()
+        error = SnapCtlError(process)
+        assert error.returncode == 2
+        assert error.error == "error: failed\n"
+        process.stdout.close()
+        process.stderr.close()
+
+
+class TestSnapCtlTimeout:
+    def test_message(self):
+        error = SnapCtlTimeout(2.5)
+        assert error.timeout == 2.5
+        assert error.returncode == -signal.SIGKILL
+        assert str(error) == "Call to snapctl timed out after 2.5 seconds"
+        assert isinstance(error, SnapCtlError)
+
+
+class TestSnapCtlTransport:
+    def test_close(self):
+        class SampleTransport(SnapCtlTransport):
+            def run(self, args):
+                return " ".join(args)
+
+        transport = SampleTransport()
+        assert transport.run(["foo", "bar"]) == "foo bar"
+        transport.close()
+
+    def test_run_stream(self):
+        class SampleTransport(SnapCtlTransport):
+            def run(self, args):
+                return " ".join(args)
+
+        transport = SampleTransport()
+        assert list(transport.run_stream(["foo", "bar"])) == ["foo bar"]
+
+    def test_run_stream_timeout(self):
+        class SampleTransport(SnapCtlTransport):
+            def run(self, args, timeout=None):
+                return f"{' '.join(args)} {timeout}"
+
+        transport = SampleTransport()
+        assert list(transport.run_stream(["foo"], timeout=3)) == ["foo 3"]
+
+
+@pytest.fixture
+def make_snapctl(tmp_path):
+    """Return an ExecTransport for a stand-in script."""
+
+    def make(script, **kwargs):
+        executable = tmp_path / "snapctl"
+        executable.write_text(f"#!/bin/sh\n{script}\n", "utf-8")
+        executable.chmod(0o755)
+        return ExecTransport(executable=str(executable), **kwargs)
+
+    yield make
+
+
+class TestExecTransport:
+    def test_run(self, tmpdir):
+        executable = tmpdir / "snapctl"
+        executable.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                echo "$@"
+                """
+            ),
+            "utf-8",
+        )
+        executable.chmod(0o755)
+        transport = ExecTransport(executable=str(executable))
+        assert transport.run(["get", "foo"]) == "get foo\n"
+
+    def test_run_arg_too_long(self, mocker):
+        popen = mocker.patch("snaphelpers._transport.Popen")
+        transport = ExecTransport()
+        arg = "foo=" + "x" * _MAX_ARG_SIZE
+        with pytest.raises(ValueError) as e:
+            transport.run(["set", arg])
+        assert str(e.value) == (
+            f"Argument too long for snapctl ({len(arg) + 1} bytes, "
+            f"max {_MAX_ARG_SIZE}): foo=xxxxxxxxxxxxxxxx..."
+        )
+        popen.assert_not_called()
+
+    def test_run_arg_max_size(self):
+        transport = ExecTransport(executable="true")
+        arg = "x" * (_MAX_ARG_SIZE - 1)
+        assert transport.run(["set", arg]) == ""
+
+    def test_run_error(self, make_snapctl):
+        transport = make_snapctl("echo 'error: failed' >&2; exit 3")
+        with pytest.raises(SnapCtlError) as e:
+            transport.run(["get", "foo"])
+        assert e.value.returncode == 3
+        assert e.value.error == "error: failed\n"
+
+    def test_run_large_output(self, make_snapctl):
+        # output larger than the pipe buffer on both stdout and stderr
+        transport = make_snapctl(
+            "head -c 1048576 /dev/zero | tr '\\0' e >&2; "
+            "head -c 4194304 /dev/zero | tr '\\0' o"
+        )
+        assert transport.run(["get", "-d"]) == "o" * 4 * 2**20
+
+    def test_run_large_error(self, make_snapctl):
+        transport = make_snapctl(
+            "head -c 2097152 /dev/zero | tr '\\0' o; "
+            "head -c 1048576 /dev/zero | tr '\\0' e >&2; "
+            "exit 1"
+        )
+        with pytest.raises(SnapCtlError) as e:
+            transport.run(["get", "-d"])
+        assert e.value.error == "e" * 2**20
+
+    def test_run_stream(self, make_snapctl):
+        transport = make_snapctl("head -c 1048576 /dev/zero | tr '\\0' o")
+        chunks = list(transport.run_stream(["get", "-d"]))
+        assert len(chunks) > 1
+        assert "".join(chunks) == "o" * 2**20
+
+    def test_run_stream_split_characters(self, mocker, make_snapctl):
+        mocker.patch.object(ExecTransport, "_READ_SIZE", 1)
+        transport = make_snapctl("printf 'caf\\303\\251 \\342\\202\\254'")
+        chunks = list(transport.run_stream(["get"]))
+        assert chunks == ["c", "a", "f", "\u00e9", " ", "\u20ac"]
+
+    def test_run_stream_invalid_utf8(self, make_snapctl):
+        transport = make_snapctl("printf 'caf\\303'")
+        with pytest.raises(UnicodeDecodeError):
+            transport.run(["get"])
+
+    def test_run_stream_close(self, make_snapctl):
+        transport = make_snapctl("exec yes")
+        stream = transport.run_stream(["get"])
+        assert next(stream).startswith("y\n")
+        # the process is killed
+        stream.close()
+
+    def test_run_max_output(self, make_snapctl):
+        transport = make_snapctl("exec yes", max_output=100000)
+        with pytest.raises(ValueError) as e:
+            transport.run(["get"])
+        assert str(e.value) == "Output of snapctl exceeds 100000 bytes"
+
+    def test_run_max_output_error(self, make_snapctl):
+        transport = make_snapctl("exec yes >&2", max_output=100000)
+        with pytest.raises(ValueError):
+            transport.run(["get"])
+
+    def test_run_timeout(self, make_snapctl):
+        transport = make_snapctl("exec sleep 10")
+        start = time.monotonic()
+        with pytest.raises(SnapCtlTimeout) as e:
+            transport.run(["get"], timeout=0.2)
+        assert e.value.timeout == 0.2
+        assert time.monotonic() - start < 5
+
+    def test_run_timeout_kills_process_group(self, make_snapctl):
+        transport = make_snapctl("sleep 10 & echo $!; wait")
+        stream = transport.run_stream(["get"], timeout=0.5)
+        pid = int(next(stream))
+        with pytest.raises(SnapCtlTimeout):
+            next(stream)
+        assert _wait_for_exit(pid)
+
+    def test_run_timeout_pipes_closed(self, make_snapctl):
+        # the process closes its output but doesn't exit
+        transport = make_snapctl("exec >&- 2>&-; exec sleep 10")
+        with pytest.raises(SnapCtlTimeout):
+            transport.run(["get"], timeout=0.2)
+
+    def test_run_within_timeout(self, make_snapctl):
+        transport = make_snapctl("echo foo")
+        assert transport.run(["get"], timeout=10) == "foo\n"
+
+    def test_run_max_output_within_limit(self, make_snapctl):
+        transport = make_snapctl("echo foo", max_output=4)
+        assert transport.run(["get"]) == "foo\n"
+
+
+def _wait_for_exit(pid, timeout=5):
+    """Wait for a process to exit, even if not reaped."""
+    deadline = time.monotonic() + timeout
+    stat = Path(f"/proc/{pid}/stat")
+    while time.monotonic() < deadline:
+        try:
+            if stat.read_text().rsplit(")", 1)[1].split()[0] == "Z":
+                return True
+        except FileNotFoundError:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def transport(fake_snapd, snap_environ):
+    transport = SocketTransport(
+        socket_path=str(fake_snapd.socket_path), env=snap_environ
+    )
+    yield transport
+    transport.close()
+
+
+class TestSocketTransport:
+    def test_run(self, fake_snapd, transport):
+        fake_snapd.handler = lambda args: ('{"foo": 123}', "", 0)
+        assert transport.run(["get", "-d", "foo"]) == '{"foo": 123}'
+        assert fake_snapd.requests == [
+            {"context-id": "", "args": ["get", "-d", "foo"]}
+        ]
+
+    @pytest.mark.usefixtures("snap_apply_env")
+    def test_run_context_from_env(self, monkeypatch, fake_snapd):
+        monkeypatch.setenv("SNAP_COOKIE", "some-cookie")
+        transport = SocketTransport(socket_path=str(fake_snapd.socket_path))
+        transport.run(["get", "foo"])
+        assert fake_snapd.requests[0]["context-id"] == "some-cookie"
+
+    def test_run_fail(self, fake_snapd, transport):
+        fake_snapd.handler = lambda args: ("", "fail!\n", 2)
+        with pytest.raises(SnapCtlError) as e:
+            transport.run(["set", "foo=1"])
+        assert e.value.returncode == 2
+        assert str(e.value) == "Call to snapctl failed with error 2: fail!\n"
+
+    def test_parse_response_generic_error(self, transport):
+        with pytest.raises(SnapCtlError) as e:
+            transport._parse_response(
+                {
+                    "type": "error",
+                    "status-code": 403,
+                    "result": {"message": "cannot use this command"},
+                }
+            )
+        assert e.value.returncode == 1
+        assert e.value.error == "error: cannot use this command\n"
+
+    def test_connection_reused(self, fake_snapd, transport):
+        for _ in range(5):
+            transport.run(["get", "foo"])
+        assert len(fake_snapd.requests) == 5
+        assert fake_snapd.connections == 1
+
+    def test_connection_closed_by_server(self, fake_snapd, transport):
+        fake_snapd.close_connections = True
+        for _ in range(3):
+            transport.run(["get", "foo"])
+        assert len(fake_snapd.requests) == 3
+        assert fake_snapd.connections == 3
+        assert transport._pool == []
+
+    def test_stale_connection_retried(self, fake_snapd, transport):
+        transport.run(["get", "foo"])
+        [conn] = transport._pool
+        # simulate snapd dropping the idle connection
+        conn.sock.shutdown(2)
+        transport.run(["get", "bar"])
+        assert [request["args"] for request in fake_snapd.requests] == [
+            ["get", "foo"],
+            ["get", "bar"],
+        ]
+        assert fake_snapd.connections == 2
+
+    def test_stale_connection_retried_not_read_only(
+        self, fake_snapd, transport
+    ):
+        transport.run(["get", "foo"])
+        [conn] = transport._pool
+        # the request can't be sent, so it's safe to retry
+        conn.sock.shutdown(2)
+        transport.run(["set", "foo=bar"])
+        assert [request["args"] for request in fake_snapd.requests] == [
+            ["get", "foo"],
+            ["set", "foo=bar"],
+        ]
+
+    @pytest.mark.parametrize(
+        "args,retried",
+        [
+            (["get", "foo"], True),
+            (["services"], True),
+            (["refresh", "--pending"], True),
+            (["refresh", "--proceed"], False),
+            (["set", "foo=bar"], False),
+            (["restart", "mysnap.svc"], False),
+        ],
+    )
+    def test_reset_after_send(
+        self, mocker, fake_snapd, transport, args, retried
+    ):
+        transport.run(["get", "foo"])
+        [conn] = transport._pool
+        mocker.patch.object(
+            conn, "getresponse", side_effect=ConnectionResetError
+        )
+        if retried:
+            transport.run(args)
+            assert fake_snapd.connections == 2
+        else:
+            with pytest.raises(ConnectionResetError):
+                transport.run(args)
+            assert fake_snapd.connections == 1
+        assert conn.sock is None
+
+    def test_request_error_closes_connection(
+        self, mocker, fake_snapd, transport
+    ):
+        transport.run(["get", "foo"])
+        [conn] = transport._pool
+        mocker.patch.object(conn, "getresponse", side_effect=TimeoutError)
+        with pytest.raises(TimeoutError):
+            transport.run(["get", "foo"])
+        assert conn.sock is None
+        assert transport._pool == []
+
+    def test_send_error_closes_connection(self, mocker, fake_snapd, transport):
+        transport.run(["get", "foo"])
+        [conn] = transport._pool
+        mocker.patch.object(conn, "request", side_effect=TimeoutError)
+        with pytest.raises(TimeoutError):
+            transport.run(["get", "foo"])
+        assert conn.sock is None
+
+    def test_pool_size(self, fake_snapd, snap_environ):
+        transport = SocketTransport(
+            socket_path=str(fake_snapd.socket_path),
+            env=snap_environ,
+            pool_size=1,
+        )
+        conns = [transport._new_connection() for _ in range(2)]
+        for conn in conns:
+            transport._release_connection(conn)
+        assert transport._pool == conns[:1]
+        assert conns[1].sock is None
+        transport.close()
+        assert conns[0].sock is None
+
+    def test_timeout(self, fake_snapd, transport):
+        fake_snapd.handler = lambda args: time.sleep(1) or ("", "", 0)
+        with pytest.raises(SnapCtlTimeout) as e:
+            transport.run(["get", "foo"], timeout=0.1)
+        assert e.value.timeout == 0.1
+
+    def test_timeout_idle_connection(self, fake_snapd, transport):
+        transport.run(["get", "foo"])
+        fake_snapd.handler = lambda args: time.sleep(1) or ("", "", 0)
+        with pytest.raises(SnapCtlTimeout):
+            transport.run(["get", "foo"], timeout=0.1)
+        assert transport._pool == []
+
+    def test_timeout_reset_on_idle_connection(self, fake_snapd, transport):
+        transport.run(["get", "foo"], timeout=0.1)
+        [conn] = transport._pool
+        transport.run(["get", "foo"])
+        assert conn.sock.gettimeout() is None
+
+    def test_socket_missing(self, tmp_path, snap_environ):
+        transport = SocketTransport(
+            socket_path=str(tmp_path / "not-here.socket"), env=snap_environ
+        )
+        with pytest.raises(FileNotFoundError):
+            transport.run(["get", "foo"])
+
+    def test_socket_missing_fallback(self, mocker, tmp_path, snap_environ):
+        fallback = mocker.Mock(spec=ExecTransport)
+        fallback.run.return_value = "output"
+        transport = SocketTransport(
+            socket_path=str(tmp_path / "not-here.socket"),
+            env=snap_environ,
+            fallback=fallback,
+        )
+        assert transport.run(["get", "foo"]) == "output"
+        fallback.run.assert_called_once_with(["get", "foo"])
+        assert transport.run(["get", "foo"], timeout=2) == "output"
+        fallback.run.assert_called_with(["get", "foo"], timeout=2)
+        transport.close()
+        fallback.close.assert_called_once_with()
+
+    @pytest.mark.usefixtures("snap_apply_env")
+    def test_with_snapctl(self, fake_snapd, transport):
+        fake_snapd.handler = lambda args: ('{"foo": {"bar": 1}}', "", 0)
+        snapctl = SnapCtl(transport=transport)
+        assert snapctl.config_get("foo") == {"foo": {"bar": 1}}
+        fake_snapd.handler = lambda args: ("", "", 1)
+        assert not snapctl.is_connected("myplug")
+        assert [request["args"] for request in fake_snapd.requests] == [
+            ["get", "-d", "foo"],
+            ["is-connected", "myplug"],
+        ]
+        snapctl.close()
+        assert transport._pool == []
@@ -0,0 +1,101 @@
+import pytest
+
+from snaphelpers._view import (
+    frozen_view,
+    FrozenMapping,
+    FrozenSequence,
+)
+
+
+@pytest.fixture
+def data():
+    yield {"foo": 1, "bar": {"baz": [1, {"a": "b"}]}}
+
+
+class TestFrozenView:
+    @pytest.mark.parametrize("value", [1, "foo", None, 1.5, True])
+    def test_scalar(self, value):
+        assert frozen_view(value) is value
+
+    def test_dict(self):
+        assert isinstance(frozen_view({}), FrozenMapping)
+
+    def test_list(self):
+        assert isinstance(frozen_view([]), FrozenSequence)
+
+
+class TestFrozenMapping:
+    def test_mapping(self, data):
+        view = FrozenMapping(data)
+        assert len(view) == 2
+        assert list(view) == ["foo", "bar"]
+        assert "foo" in view
+        assert "other" not in view
+        assert view["foo"] == 1
+        assert view == data
+
+    def test_repr(self):
+        assert repr(FrozenMapping({"foo": 1})) == "FrozenMapping({'foo': 1})"
+
+    def test_nested_views(self, data):
+        view = FrozenMapping(data)
+        assert isinstance(view["bar"], FrozenMapping)
+        assert isinstance(view["bar"]["baz"], FrozenSequence)
+        assert isinstance(view["bar"]["baz"][1], FrozenMapping)
+
+    def test_read_only(self, data):
+        view = FrozenMapping(data)
+        with pytest.raises(TypeError):
+            view["foo"] = 2
+        with pytest.raises(AttributeError):
+            view["bar"]["baz"].append(3)
+
+    def test_not_copied(self, data):
+        view = FrozenMapping(data)
+        data["bar"]["baz"].append(3)
+        assert view["bar"]["baz"][2] == 3
+
+    def test_copy(self, data):
+        view = FrozenMapping(data)
+        copy = view.copy()
+        assert copy == data
+        copy["bar"]["baz"].append(3)
+        assert data["bar"]["baz"] == [1, {"a": "b"}]
+
+
+class TestFrozenSequence:
+    def test_sequence(self):
+        view = FrozenSequence([1, 2, 3])
+        assert len(view) == 3
+        assert list(view) == [1, 2, 3]
+        assert view[-1] == 3
+        assert 2 in view
+
+    def test_repr(self):
+        assert repr(FrozenSequence([1, 2])) == "FrozenSequence([1, 2])"
+
+    def test_slice(self):
+        view = FrozenSequence([1, 2, 3])
+        sliced = view[1:]
+        assert isinstance(sliced, FrozenSequence)
+        assert sliced == [2, 3]
+
+    @pytest.mark.parametrize(
+        "other,equal",
+        [
+            ([1, {"a": "b"}], True),
+            ((1, {"a": "b"}), True),
+            (FrozenSequence([1, {"a": "b"}]), True),
+            ([1, {"a": "c"}], False),
+            ([1], False),
+            ("other", False),
+        ],
+    )
+    def test_eq(self, other, equal):
+        assert (FrozenSequence([1, {"a": "b"}]) == other) == equal
+
+    def test_copy(self):
+        data = [[1], [2]]
+        copy = FrozenSequence(data).copy()
+        copy[0].append(3)
+        assert data == [[1], [2]]
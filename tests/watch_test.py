@@ -0,0 +1,343 @@
+import asyncio
+from threading import Event
+
+import pytest
+
+from snaphelpers._conf import (
+    AsyncSnapConfig,
+    InvalidKey,
+    SnapConfig,
+    SnapConfigOptions,
+)
+from snaphelpers._transport import SnapCtlError
+from snaphelpers._watch import (
+    AsyncSnapConfigWatcher,
+    ConfigDiff,
+    diff_config,
+    SnapConfigWatcher,
+)
+
+
+class TestDiffConfig:
+    def test_no_changes(self, snap_config):
+        diff = diff_config(snap_config, snap_config)
+        assert diff == ConfigDiff([], [], [])
+        assert not diff
+
+    def test_changes(self):
+        old = {
+            "foo": 1,
+            "bar": {"a": 1, "b": {"c": 2}},
+            "baz": "x",
+            "list": [1, 2],
+        }
+        new = {
+            "foo": 2,
+            "bar": {"a": 1, "b": {"c": 3, "d": 4}, "e": {"f": 5}},
+            "list": [1, 2, 3],
+            "new": {"x": 1},
+        }
+        diff = diff_config(old, new)
+        assert diff.added == ["bar.b.d", "bar.e", "new"]
+        assert diff.removed == ["baz"]
+        assert diff.changed == ["bar.b.c", "foo", "list"]
+        assert diff
+
+    @pytest.mark.parametrize(
+        "old,new",
+        [
+            (1, True),
+            (1, 1.0),
+            ({"a": 1}, 1),
+            (1, {"a": 1}),
+        ],
+    )
+    def test_changed_type(self, old, new):
+        assert diff_config({"foo": old}, {"foo": new}).changed == ["foo"]
+
+    def test_keys(self):
+        diff = ConfigDiff(["b.c"], ["a"], ["c", "b.a"])
+        assert diff.keys == ["a", "b.a", "b.c", "c"]
+
+    @pytest.mark.parametrize(
+        "prefix,affected",
+        [
+            ("web", True),
+            ("web.port", True),
+            ("web.tls", True),
+            ("web.tls.cert", True),
+            ("we", False),
+            ("webapp", False),
+            ("db", False),
+        ],
+    )
+    def test_affects(self, prefix, affected):
+        diff = ConfigDiff(["web.tls"], [], ["web.port"])
+        assert diff.affects(prefix) == affected
+
+
+class Fetcher:
+    """Return options for successive configurations."""
+
+    def __init__(self, *configs):
+        self.configs = list(configs)
+
+    def __call__(self):
+        # the last configuration is repeated
+        if len(self.configs) > 1:
+            config = self.configs.pop(0)
+        else:
+            config = self.configs[0]
+        if isinstance(config, Exception):
+            raise config
+        options = SnapConfigOptions([])
+        options._set_config(config)
+        return options
+
+
+@pytest.mark.usefixtures("snap_apply_env")
+class TestSnapConfigWatcher:
+    def test_poll(self, mocker):
+        callback = mocker.Mock()
+        fetch = Fetcher({"foo": 1}, {"foo": 1}, {"foo": 2})
+        watcher = SnapConfigWatcher(fetch, callback)
+        assert not watcher.poll()
+        assert not watcher.poll()
+        callback.assert_not_called()
+        diff = watcher.poll()
+        assert diff == ConfigDiff([], [], ["foo"])
+        callback.assert_called_once_with(diff, watcher.options)
+        assert watcher.options["foo"] == 2
+
+    def test_backoff(self):
+        watcher = SnapConfigWatcher(
+            Fetcher({}), lambda *args: None, interval=1, max_interval=5
+        )
+        intervals = []
+        for diff in [None, None, None, None, ConfigDiff(["a"], [], [])]:
+            watcher._backoff(diff)
+            intervals.append(watcher._next_interval)
+        assert intervals == [2, 4, 5, 5, 1]
+
+    def test_thread(self):
+        changed = Event()
+        diffs = []
+
+        def callback(diff, options):
+            diffs.append(diff)
+            changed.set()
+
+        fetch = Fetcher({"foo": 1}, SnapCtlError(1, ""), {"foo": 2})
+        with SnapConfigWatcher(
+            fetch, callback, interval=0.001, max_interval=0.001
+        ) as watcher:
+            watcher.start()
+            assert changed.wait(timeout=5)
+        assert watcher._thread is None
+        assert diffs[0] == ConfigDiff([], [], ["foo"])
+
+    def test_thread_errors(self):
+        changed = Event()
+        errors = []
+        diffs = []
+
+        def callback(diff, options):
+            if options["foo"] == 2:
+                raise RuntimeError("callback failed")
+            diffs.append(diff)
+            changed.set()
+
+        fetch = Fetcher(
+            {"foo": 1}, ValueError("invalid"), {"foo": 2}, {"foo": 3}
+        )
+        with SnapConfigWatcher(
+            fetch,
+            callback,
+            interval=0.001,
+            max_interval=0.001,
+            on_error=errors.append,
+        ) as watcher:
+            watcher.start()
+            assert changed.wait(timeout=5)
+        # watching continues after errors
+        assert [str(error) for error in errors] == [
+            "invalid",
+            "callback failed",
+        ]
+        assert diffs == [ConfigDiff([], [], ["foo"])]
+
+    def test_thread_errors_excepthook(self, mocker):
+        excepthook = mocker.patch("sys.excepthook")
+        changed = Event()
+        fetch = Fetcher({"foo": 1}, ValueError("invalid"), {"foo": 2})
+        with SnapConfigWatcher(
+            fetch,
+            lambda *args: changed.set(),
+            interval=0.001,
+            max_interval=0.001,
+        ) as watcher:
+            watcher.start()
+            assert changed.wait(timeout=5)
+        [call] = excepthook.mock_calls
+        assert call.args[0] is ValueError
+        assert str(call.args[1]) == "invalid"
+
+    def test_stop_not_started(self):
+        watcher = SnapConfigWatcher(Fetcher({}), lambda *args: None)
+        watcher.stop()
+
+
+@pytest.mark.usefixtures("snap_apply_env")
+class TestAsyncSnapConfigWatcher:
+    def test_poll(self, mocker):
+        callback = mocker.AsyncMock()
+        fetch = mocker.AsyncMock(side_effect=Fetcher({"foo": 1}, {"bar": 1}))
+        watcher = AsyncSnapConfigWatcher(fetch, callback)
+
+        async def poll():
+            return [await watcher.poll(), await watcher.poll()]
+
+        assert asyncio.run(poll()) == [
+            ConfigDiff([], [], []),
+            ConfigDiff(["bar"], ["foo"], []),
+        ]
+        callback.assert_awaited_once()
+
+    def test_task(self, mocker):
+        diffs = []
+        fetch = mocker.AsyncMock(
+            side_effect=Fetcher({"foo": 1}, SnapCtlError(1, ""), {"foo": 2})
+        )
+
+        async def watch():
+            changed = asyncio.Event()
+
+            def callback(diff, options):
+                diffs.append(diff)
+                changed.set()
+
+            async with AsyncSnapConfigWatcher(
+                fetch, callback, interval=0.001, max_interval=0.001
+            ) as watcher:
+                await watcher.start()
+                await asyncio.wait_for(changed.wait(), timeout=5)
+            assert watcher._task is None
+
+        asyncio.run(watch())
+        assert diffs[0] == ConfigDiff([], [], ["foo"])
+
+    def test_task_errors(self, mocker):
+        errors = []
+        diffs = []
+        fetch = mocker.AsyncMock(
+            side_effect=Fetcher(
+                {"foo": 1}, ValueError("invalid"), {"foo": 2}, {"foo": 3}
+            )
+        )
+
+        async def watch():
+            changed = asyncio.Event()
+
+            async def callback(diff, options):
+                if options["foo"] == 2:
+                    raise RuntimeError("callback failed")
+                diffs.append(diff)
+                changed.set()
+
+            async with AsyncSnapConfigWatcher(
+                fetch,
+                callback,
+                interval=0.001,
+                max_interval=0.001,
+                on_error=errors.append,
+            ) as watcher:
+                await watcher.start()
+                await asyncio.wait_for(changed.wait(), timeout=5)
+
+        asyncio.run(watch())
+        # watching continues after errors
+        assert [str(error) for error in errors] == [
+            "invalid",
+            "callback failed",
+        ]
+        assert diffs == [ConfigDiff([], [], ["foo"])]
+
+    def test_task_errors_exception_handler(self, mocker):
+        contexts = []
+        fetch = mocker.AsyncMock(
+            side_effect=Fetcher({"foo": 1}, ValueError("invalid"), {"foo": 2})
+        )
+
+        async def watch():
+            asyncio.get_running_loop().set_exception_handler(
+                lambda loop, context: contexts.append(context)
+            )
+            changed = asyncio.Event()
+            async with AsyncSnapConfigWatcher(
+                fetch,
+                lambda *args: changed.set(),
+                interval=0.001,
+                max_interval=0.001,
+            ) as watcher:
+                await watcher.start()
+                await asyncio.wait_for(changed.wait(), timeout=5)
+                return watcher._task
+
+        task = asyncio.run(watch())
+        [context] = contexts
+        assert context["message"] == "Error watching configuration"
+        assert str(context["exception"]) == "invalid"
+        assert context["task"] is task
+
+    def test_stop_not_started(self):
+        watcher = AsyncSnapConfigWatcher(Fetcher({}), lambda *args: None)
+        asyncio.run(watcher.stop())
+
+
+class TestSnapConfigWatch:
+    def test_watch(self, mocker, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl, prefetch=True)
+        callback = mocker.Mock()
+        on_error = mocker.Mock()
+        watcher = config.watch(
+            ["foo", "baz"], callback, interval=60, on_error=on_error
+        )
+        try:
+            assert watcher.on_error is on_error
+            assert watcher.options.as_dict() == {
+                "foo": 123,
+                "baz": {"aaa": "nested", "bbb": {"ccc": "more nested"}},
+            }
+            # changes to other keys are ignored
+            fake_snapctl.config_set({"bar": "changed"})
+            assert not watcher.poll()
+            # changes are seen even in snapshot mode
+            fake_snapctl.config_set({"baz.bbb.ccc": "changed"})
+            assert watcher.poll() == ConfigDiff([], [], ["baz.bbb.ccc"])
+            callback.assert_called_once()
+        finally:
+            watcher.stop()
+
+    def test_watch_invalid_key(self, fake_snapctl):
+        config = SnapConfig(snapctl=fake_snapctl)
+        with pytest.raises(InvalidKey):
+            config.watch(["foo.bar"], lambda *args: None)
+
+    def test_watch_async(self, mocker, fake_snapctl, fake_async_snapctl):
+        config = AsyncSnapConfig(snapctl=fake_async_snapctl)
+        callback = mocker.Mock()
+
+        async def watch():
+            watcher = await config.watch([], callback, interval=60)
+            fake_snapctl.config_unset("foo")
+            diff = await watcher.poll()
+            await watcher.stop()
+            return diff
+
+        assert asyncio.run(watch()) == ConfigDiff([], ["foo"], [])
+        callback.assert_called_once()
+
+    def test_watch_async_invalid_key(self, fake_async_snapctl):
+        config = AsyncSnapConfig(snapctl=fake_async_snapctl)
+        with pytest.raises(InvalidKey):
+            asyncio.run(config.watch(["foo.bar"], lambda *args: None))